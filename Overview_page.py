@@ -2,6 +2,7 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px  # Using Plotly for enhanced charting
 from datetime import datetime
+from ledger import ledger_of # Purchases and consumed as columns, the dates are already parsed
 
 # Initialize session state keys
 if "roommates" not in st.session_state:
@@ -13,119 +14,135 @@ if "purchases" not in st.session_state:
 if "consumed" not in st.session_state:
     st.session_state["consumed"] = {mate: [] for mate in st.session_state["roommates"]}
 
+TOP_PRODUCTS = 10 # Products shown in chart 4, all others are stacked as "Other"
 
-# Overview page function
+
+# Function to get a figure from the cache of the session, it is only built again when its key (the version of its data) changed.
+# The cache belongs to the session and with it to the flat the session is logged into.
+def cached_figure(name, key, build):
+    cache = st.session_state.setdefault("overview_figures", {})
+    if name not in cache or cache[name][0] != key:
+        cache[name] = (key, build())
+    return cache[name][1]
+
+# Function to sum up the products after the first top_n (by total price) as "Other"
+def top_products(inventory_df, top_n=TOP_PRODUCTS):
+    totals = inventory_df.groupby("Product")["Price"].sum().sort_values(ascending=False)
+    if len(totals) <= top_n:
+        return inventory_df
+    other = ~inventory_df["Product"].isin(totals.index[:top_n])
+    inventory_df = inventory_df.assign(Product=inventory_df["Product"].where(~other, "Other"))
+    return inventory_df.groupby(["Roommate", "Product"], as_index=False, sort=False)["Price"].sum()
+
+# Function to build chart 1
+def expenses_figure():
+    expense_df = pd.DataFrame(list(st.session_state["expenses"].items()), columns=["Roommate", "Total Expenses (CHF)"])
+    if expense_df.empty:
+        return None
+    return px.bar(expense_df, x="Roommate", y="Total Expenses (CHF)", title="Total Expenses by Flatmate")
+
+# Function to build chart 2 from the sums per roommate and day which the ledger keeps up to date
+def month_figure(purchases, now):
+    # Step 1: Read the sums of the current month, only the days of this month are read
+    month_df = purchases.month_totals(now.year, now.month)
+
+    # Step 2: Keep the current roommates
+    month_df = month_df[month_df["Roommate"].isin(st.session_state["roommates"])]
+
+    # Step 3: One row per day and one column per roommate (at most 31 rows)
+    daily_purchases = month_df.set_index(["Date", "Roommate"])["Total"].unstack(fill_value=0).sort_index()
+
+    # Step 4: Reshape for Plotly (Convert to long format for Plotly)
+    daily_purchases_long = daily_purchases.reset_index().melt(
+        id_vars=["Date"],
+        var_name="Roommate",
+        value_name="Total Purchases (CHF)"
+    )
+    if daily_purchases_long.empty:
+        return None
+
+    # Step 5: Plot
+    return px.line(
+        daily_purchases_long,
+        x="Date",
+        y="Total Purchases (CHF)",
+        color="Roommate",
+        title=f"Daily Purchases by Flatmate - {now.strftime('%B %Y')}",
+        markers=True,  # Add markers for better visibility
+    )
+
+# Function to build chart 3
+def consumption_figure(consumed):
+    consumed_totals = consumed.totals() # Kept up to date with every consumption
+    consumption_data = {mate: consumed_totals.get(mate, 0.0) for mate in st.session_state["roommates"]}
+    consumption_df = pd.DataFrame(list(consumption_data.items()), columns=["Roommate", "Total Consumption (CHF)"])
+    if consumption_df.empty:
+        return None
+    fig3 = px.pie(consumption_df, names="Roommate", values="Total Consumption (CHF)",
+                  title="Total Consumption by Flatmate", hole=0.3,
+                  color_discrete_sequence=px.colors.qualitative.Pastel)
+    fig3.update_traces(textinfo='percent+label', hoverinfo='label+percent+value')
+    return fig3
+
+# Function to build chart 4, one trace per product of the top products and one for all others
+def inventory_figure(purchases):
+    inventory_df = purchases.product_totals() # Sums per roommate and product, kept up to date with every purchase
+    inventory_df = inventory_df[inventory_df["Roommate"].isin(st.session_state["roommates"])]
+    if inventory_df.empty:
+        return None
+    inventory_summary = top_products(inventory_df).set_index(["Roommate", "Product"])["Price"].unstack(fill_value=0)
+    if "Other" in inventory_summary.columns: # The rest is stacked on top
+        inventory_summary = inventory_summary[[product for product in inventory_summary.columns if product != "Other"] + ["Other"]]
+    return px.bar(inventory_summary.reset_index(),
+                  x="Roommate", y=inventory_summary.columns,
+                  title="Inventory Value by Roommate",
+                  labels={"value": "Price (CHF)", "variable": "Product"},
+                  barmode="stack")
+
+
+# Overview page function. The figures are cached in the session and only built again when their data changed.
 def overview_page():
     st.title("Flatmate Overview")
+    roommates = tuple(st.session_state["roommates"])
+    purchases = ledger_of(st.session_state["purchases"]) # The ledgers keep the sums of the charts up to date
+    consumed = ledger_of(st.session_state["consumed"])
+    now = datetime.now()
 
     # Chart 1: Total Expenses by Flatmate (Bar Chart)
     st.subheader("1. Total Expenses by Flatmate")
-    expense_df = pd.DataFrame(list(st.session_state["expenses"].items()), columns=["Roommate", "Total Expenses (CHF)"])
-    if not expense_df.empty:
-        fig1 = px.bar(expense_df, x="Roommate", y="Total Expenses (CHF)", title="Total Expenses by Flatmate")
+    fig1 = cached_figure("expenses", tuple(st.session_state["expenses"].items()), expenses_figure)
+    if fig1 is not None:
         st.plotly_chart(fig1)
     else:
         st.write("No expense data available.")
 
-
     # Chart 2: Monthly Purchases by Flatmate (Line Chart)
     st.subheader("2. Monthly Purchases by Flatmate")
-
-    # Step 1: Collect purchase data
-    purchases_data = []
-    for mate in st.session_state["roommates"]:
-        purchases_data.extend([
-            {
-                "Roommate": mate,
-                "Date": purchase.get("Date", "1900-01-01"),  # Fetch date or use default
-                "Total": purchase.get("Price", 0)           # Fetch price or use 0
-            }
-            for purchase in st.session_state["purchases"][mate]
-        ])
-
-    # Step 2: Create DataFrame
-    purchases_df = pd.DataFrame(purchases_data)
-
-    if not purchases_df.empty:
-        # Step 3: Convert Date to datetime
-        purchases_df["Date"] = pd.to_datetime(purchases_df["Date"], errors="coerce")  # Parse full datetime
-    
-        # Check if Date parsing works
-        st.write("Parsed DataFrame (Date column):")
-        st.write(purchases_df)
-
-        # Step 4: Filter for the current month and year
-        current_month = datetime.now().month
-        current_year = datetime.now().year
-        purchases_df = purchases_df[
-            (purchases_df["Date"].dt.month == current_month) & 
-            (purchases_df["Date"].dt.year == current_year)
-        ]
-
-        # Step 5: Group by Day (Date) and Roommate
-        daily_purchases = purchases_df.groupby([purchases_df["Date"].dt.date, "Roommate"])["Total"].sum().unstack(fill_value=0)
-
-        # Step 6: Reshape for Plotly (Convert to long format for Plotly)
-        daily_purchases_long = daily_purchases.reset_index().melt(
-            id_vars=["Date"], 
-            var_name="Roommate", 
-            value_name="Total Purchases (CHF)"
-        )
-
-        # Check if reshaped data is correct
-        st.write("Reshaped Data for Plotly:")
-        st.write(daily_purchases_long)
-
-        # Step 7: Plot
-        if not daily_purchases_long.empty:
-            fig2 = px.line(
-                daily_purchases_long,
-                x="Date",
-                y="Total Purchases (CHF)",
-                color="Roommate",
-                title=f"Daily Purchases by Flatmate - {datetime.now().strftime('%B %Y')}",
-                markers=True,  # Add markers for better visibility
-            )
+    if any(len(purchases.rows(mate)) for mate in roommates):
+        fig2 = cached_figure("month", (purchases.data_version(), roommates, now.year, now.month), lambda: month_figure(purchases, now))
+        if fig2 is not None:
             st.plotly_chart(fig2)
         else:
             st.write("No data available for the current month.")
     else:
         st.write("No purchases data available.")
 
-
-
-
     # Chart 3: Total Consumption by Flatmate (Pie Chart)
     st.subheader("3. Total Consumption by Flatmate")
-    consumption_data = {mate: sum([item["Price"] for item in st.session_state["consumed"][mate]])
-                        for mate in st.session_state["roommates"]}
-    consumption_df = pd.DataFrame(list(consumption_data.items()), columns=["Roommate", "Total Consumption (CHF)"])
-    if not consumption_df.empty:
-        fig3 = px.pie(consumption_df, names="Roommate", values="Total Consumption (CHF)",
-                      title="Total Consumption by Flatmate", hole=0.3, 
-                      color_discrete_sequence=px.colors.qualitative.Pastel)
-        fig3.update_traces(textinfo='percent+label', hoverinfo='label+percent+value')
+    fig3 = cached_figure("consumption", (consumed.data_version(), roommates), lambda: consumption_figure(consumed))
+    if fig3 is not None:
         st.plotly_chart(fig3)
     else:
         st.write("No consumption data available.")
 
     # Chart 4: Inventory Summary (Stacked Bar Chart)
     st.subheader("4. Inventory Value by Roommate")
-    inventory_data = []
-    for mate in st.session_state["roommates"]:
-        for purchase in st.session_state["purchases"][mate]:
-            inventory_data.append({"Roommate": mate, "Product": purchase["Product"], "Price": purchase["Price"]})
-    inventory_df = pd.DataFrame(inventory_data)
-    if not inventory_df.empty:
-        inventory_summary = inventory_df.groupby(["Roommate", "Product"])["Price"].sum().unstack(fill_value=0)
-        fig4 = px.bar(inventory_summary.reset_index(), 
-                      x="Roommate", y=inventory_summary.columns, 
-                      title="Inventory Value by Roommate", 
-                      labels={"value": "Price (CHF)", "variable": "Product"}, 
-                      barmode="stack")
+    fig4 = cached_figure("inventory", (purchases.data_version(), roommates, TOP_PRODUCTS), lambda: inventory_figure(purchases))
+    if fig4 is not None:
         st.plotly_chart(fig4)
     else:
         st.write("No inventory data available.")
 
-# Call the function to render the page
-overview_page()
+# Call the function to render the page (only when this file is run on its own, main.py calls it itself)
+if __name__ == "__main__":
+    overview_page()
@@ -0,0 +1,103 @@
+import json # Cached responses are stored as JSON
+import os # To read the settings from environment variables
+import sqlite3 # On-disk cache shared by all sessions and server processes
+import threading # The counters are updated by several threads
+import time # To check the age of the entries
+from contextlib import contextmanager # To open one connection per operation
+
+# Responses of TheMealDB and Open Food Facts are cached on disk, so the same ingredient search or barcode scan is
+# answered locally for every session and flat. Every endpoint has its own time to live, results like "product not
+# found" are cached as well (with a shorter time to live). When more than MAX_ENTRIES are stored, the entries which
+# were used least recently are removed. Failed requests are never cached.
+CACHE_FILE = os.environ.get("WASTELESS_API_CACHE", "api_cache.db")
+MAX_ENTRIES = int(os.environ.get("WASTELESS_API_CACHE_SIZE", "5000"))
+TTL = { # Seconds an answer stays valid: (found, not found)
+    "themealdb.filter": (7 * 24 * 3600, 24 * 3600), # Recipes of an ingredient rarely change
+    "openfoodfacts.product": (24 * 3600, 6 * 3600), # Products are added and edited more often
+}
+DEFAULT_TTL = (3600, 600)
+ENABLED = os.environ.get("WASTELESS_API_CACHE_ENABLED", "1") != "0"
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "negative_hits": 0, "misses": 0, "expired": 0, "stores": 0, "evictions": 0}
+_initialized = set() # Cache files whose table was already created by this process
+
+
+# Function to open the cache file, creates the table the first time
+@contextmanager
+def connect(path=None):
+    path = path or CACHE_FILE
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        with conn: # Commits at the end, rolls back if an error occurs
+            if path not in _initialized:
+                conn.execute("""CREATE TABLE IF NOT EXISTS responses (endpoint TEXT, key TEXT, value TEXT,
+                                negative INTEGER, expires REAL, used REAL, PRIMARY KEY (endpoint, key))""")
+                conn.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses (used)")
+                _initialized.add(path)
+            yield conn
+    finally:
+        conn.close()
+
+# Function to increase one of the counters
+def count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+# Function to look up a cached answer, returns (True, value) for a valid entry and (False, None) otherwise
+def get(endpoint, key, path=None):
+    now = time.time()
+    with connect(path) as conn:
+        row = conn.execute("SELECT value, negative, expires FROM responses WHERE endpoint = ? AND key = ?",
+                           (endpoint, key)).fetchone()
+        if row is None:
+            count("misses")
+            return False, None
+        if row[2] <= now:
+            conn.execute("DELETE FROM responses WHERE endpoint = ? AND key = ?", (endpoint, key))
+            count("expired")
+            count("misses")
+            return False, None
+        conn.execute("UPDATE responses SET used = ? WHERE endpoint = ? AND key = ?", (now, endpoint, key)) # Most recently used
+    count("negative_hits" if row[1] else "hits")
+    return True, json.loads(row[0])
+
+# Function to store an answer, a negative answer (nothing found) uses the shorter time to live of the endpoint
+def put(endpoint, key, value, negative=False, path=None):
+    now = time.time()
+    ttl = TTL.get(endpoint, DEFAULT_TTL)[1 if negative else 0]
+    with connect(path) as conn:
+        conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                     (endpoint, key, json.dumps(value), int(negative), now + ttl, now))
+        size = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if size > MAX_ENTRIES: # Remove the least recently used entries
+            conn.execute("DELETE FROM responses WHERE rowid IN (SELECT rowid FROM responses ORDER BY used LIMIT ?)",
+                         (size - MAX_ENTRIES,))
+            count("evictions", size - MAX_ENTRIES)
+    count("stores")
+
+# Function to return the cached answer or call fetch() and cache its result. is_negative(result) tells if the
+# result means "nothing found". Errors raised by fetch() are passed on and not cached.
+def cached(endpoint, key, fetch, is_negative=lambda value: not value, path=None):
+    if not ENABLED:
+        return fetch()
+    key = str(key).strip().lower()
+    hit, value = get(endpoint, key, path)
+    if hit:
+        return value
+    value = fetch()
+    put(endpoint, key, value, negative=is_negative(value), path=path)
+    return value
+
+# Function to remove all entries (e.g. after the API changed)
+def clear(path=None):
+    with connect(path) as conn:
+        conn.execute("DELETE FROM responses")
+
+# Function to get the hit and miss counters of this process and the hit rate
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    lookups = result["hits"] + result["negative_hits"] + result["misses"]
+    result["hit_rate"] = (result["hits"] + result["negative_hits"]) / lookups if lookups else 0.0
+    return result
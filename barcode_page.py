@@ -1,9 +1,13 @@
 import streamlit as st 
 import pandas as pd # Use to display data in table
 from PIL import Image # Use for editing images
-from pyzbar.pyzbar import decode # Use for decoing barcode
+import barcode_scanner # Use for preprocessing images and decoding barcodes
 import requests # Use to request data from API
-from datetime import datetime  # use to record the date and time
+import api_cache # Use to cache the answers of the API on disk
+import metrics # Use to time decoding and the API requests
+import inventory_service # Use to add products and to journal them
+import receipt_ingest # Use to read receipts
+from history_view import history_view # Use to show the purchases page by page
 
 # Initialization of the session status for saving values between interactions
 # The following part is unnecessary because it is only used to run and test this page
@@ -16,45 +20,89 @@ if "expenses" not in st.session_state:
 if "purchases" not in st.session_state:
     st.session_state["purchases"] = {mate: [] for mate in st.session_state["roommates"]}
 
-# Function to recognize and decode barcode in picture
+# Function to recognize and decode the barcodes in a picture, returns all of them (an empty list if none was found)
+@metrics.timed("barcode.decode")
 def barcode_decode(image):
-    decoded_objects = decode(image)  # Searching the barcode and save the list of barcodes in the variable
-    for obj in decoded_objects:
-        return obj.data.decode("utf-8") # Convert a binary number into a string
-    return None # Returns non if no barcode was found
+    barcodes = barcode_scanner.decode_all(barcode_scanner.preprocess(image))  # Searching the barcodes on the upright, grayscale and downscaled image
+    return list(dict.fromkeys(barcode["data"] for barcode in barcodes)) # Every code once, also if it was read as two types
 
-# Function to get product information
+# Function to get product information, answers (also "product not found") are cached for all sessions
 def get_product_info(barcode):
+    try:
+        return api_cache.cached("openfoodfacts.product", barcode, lambda: fetch_product_info(barcode), is_negative=lambda product: product is None)
+    except requests.RequestException: # Failed requests are not cached
+        return None
+
+# Function to request product information from the API
+@metrics.timed("openfoodfacts.product")
+def fetch_product_info(barcode):
     url = f"https://world.openfoodfacts.org/api/v0/product/{barcode}.json" # URL refers to the Open Food Facts API
-    response = requests.get(url) # Connects to the Open Food Facts API and sends a request
-    if response.status_code == 200: # It means that the request was successful and the data is available
-        data = response.json() # Converts the response data from JSON into a Python dictionary
-        if data.get("status") == 1:  # If status one: Barcode exists in the database, if status 0: Barcode does not exist in the database
-            product = data["product"] # Extract product information and return name and brand
-            return {
-                "name": product.get("product_name", "Unknown Product"), # When no value available default value
-                "brand": product.get("brands", "Unknown Brand")
-            }
+    response = requests.get(url, timeout=10) # Connects to the Open Food Facts API and sends a request
+    response.raise_for_status() # Raises an error if the request was not successful, so it is not cached as "not found"
+    data = response.json() # Converts the response data from JSON into a Python dictionary
+    if data.get("status") == 1:  # If status one: Barcode exists in the database, if status 0: Barcode does not exist in the database
+        product = data["product"] # Extract product information and return name and brand
+        return {
+            "name": product.get("product_name", "Unknown Product"), # When no value available default value
+            "brand": product.get("brands", "Unknown Brand")
+        }
     return None # return None, if barcode does not exist in the database
 
-# Function to add product to inventory
-def add_product_to_inventory(food_item, quantity, unit, price, selected_roommate): 
-    purchase_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S") # Save the time at which a product is added to the inventory
-    if food_item in st.session_state["inventory"]:  # checks if the food is already in the inventory to ensure that no product appears twice by name in the Invenory
-        st.session_state["inventory"][food_item]["Quantity"] += quantity # Add the quantity to the existing quantity
-        st.session_state["inventory"][food_item]["Price"] += price # Add the price to the existing price
-    else:
-        st.session_state["inventory"][food_item] = {"Quantity": quantity, "Unit": unit, "Price": price} # If the product is not currently in the inventory, it will be added as a new one and the quantity, unit and price will be adopted
-    
-    st.session_state["expenses"][selected_roommate] += price # The cost of the product is added to the total expenses of the person
-    st.session_state["purchases"][selected_roommate].append({ # the entire purchase is saved in the history
-        "Product": food_item,
-        "Quantity": quantity,
-        "Price": price,
-        "Unit": unit,
-        "Date": purchase_time
-    })
-    st.success(f"'{food_item}' has been added to the inventory, and {selected_roommate}'s expenses were updated.") # Displays to the user that the product has been successfully added to the inventory
+# Function to add product to inventory, the same change as on the fridge page (inventory_service)
+def add_product_to_inventory(food_item, quantity, unit, price, selected_roommate, expires=None):
+    add_products_to_inventory([{"Product": food_item, "Quantity": quantity, "Unit": unit, "Price": price, "Expires": expires}], selected_roommate)
+
+# Function to add several products at once (bulk scan, receipt), the changes are journaled with one write.
+# rows are dictionaries with Product, Quantity, Unit, Price and optionally Expires, rows without product or quantity are skipped.
+def add_products_to_inventory(rows, selected_roommate):
+    operations = [inventory_service.add(row["Product"], row["Quantity"], row["Unit"], row["Price"], selected_roommate, row.get("Expires")) for row in rows
+                  if row["Product"] and row["Quantity"] > 0 and row["Price"] >= 0]
+    if not operations: # Every row was skipped
+        st.warning("No product was added. Every product needs a name, a quantity above 0 and a price of at least 0.")
+        return 0
+    result = inventory_service.apply_operations(st.session_state, operations, st.session_state.get("username")) # One batch, one write
+    if not result["ok"]:
+        st.warning(result["errors"][0][1])
+    elif result["added"] == 1:
+        st.success(f"'{operations[0]['product']}' has been added to the inventory, and {selected_roommate}'s expenses were updated.") # Displays to the user that the product has been successfully added to the inventory
+    elif result["added"]:
+        st.success(f"{result['added']} products have been added to the inventory, and {selected_roommate}'s expenses were updated.")
+    return result["added"]
+
+# Function to let the user correct the found products and add them all together
+def review_products(key):
+    rows_df = pd.DataFrame(st.session_state[key])
+    rows_df["Expires"] = pd.to_datetime(rows_df.get("Expires"), errors="coerce") # Best-before days, empty until the user enters them
+    edited = st.data_editor(rows_df, hide_index=True, key=f"{key}_editor",
+                            column_config={"Unit": st.column_config.SelectboxColumn(options=["Pieces", "Liters", "Grams"]),
+                                           "Expires": st.column_config.DateColumn("Best before")})
+    selected_roommate = st.selectbox("Who bought the products?", st.session_state["roommates"], key=f"{key}_roommate")
+    if st.button("Add all products to inventory", key=f"{key}_add"):
+        if add_products_to_inventory(edited.to_dict("records"), selected_roommate): # Keep the rows if nothing was added, so the user can correct them
+            st.session_state[key] = []
+
+# Function to read a receipt and add its items, the items of every page are shown as soon as the page is read
+def receipt_scan():
+    uploaded_file = st.file_uploader("Upload a receipt", type=["pdf", "jpg", "jpeg", "png"])
+    if uploaded_file is not None and st.button("Read receipt"):
+        rows = []
+        status = st.empty()
+        table = st.empty()
+        try:
+            for page in receipt_ingest.ingest_receipt(uploaded_file.getvalue(), uploaded_file.name):
+                rows.extend(page["items"])
+                status.write(f"Page {page['page']} read in {page['seconds']:.1f} s ({len(rows)} items so far)")
+                table.dataframe(pd.DataFrame(rows), hide_index=True)
+        except Exception as e: # Missing OCR engine, broken file
+            st.error(f"The receipt could not be read: {e}")
+        table.empty()
+        st.session_state["receipt_rows"] = rows
+        if not rows:
+            st.write("No items found on the receipt.")
+
+    if st.session_state.get("receipt_rows"):
+        st.write(f"{len(st.session_state['receipt_rows'])} items found. Correct them and add them:")
+        review_products("receipt_rows")
 
 # Function to show total expenses in a table
 def display_total_expenses():
@@ -65,33 +113,65 @@ def display_total_expenses():
 # Function to show purchases per roommate
 def display_purchases():
     with st.expander("Purchases per Roommate"):  # Function that allows the user to expand or hide the information about purchases
-        for roommate in st.session_state["purchases"]:
-            st.write(f"**{roommate}**")  # Display the name of the current roommate in fat letters
-            
-            purchases = st.session_state["purchases"][roommate]  # Access the list of purchases of the current roommate and save the list in the variable
-            
-            if purchases:  # Checks if the roommate has already made purchases
-                data = []  # Create an empty list to collect the purchases. Required to create a DataFrame later
-                
-                for purchase in purchases:  # Process each purchase from the roommate individually and extract the data from it
-                    data.append([purchase["Product"], purchase["Quantity"], purchase["Price"], purchase["Unit"], purchase["Date"]]) # Extract details of purchase and add them to the data list
-                
-                purchases_df = pd.DataFrame(data, columns=["Product", "Quantity", "Price", "Unit", "Date"]) # Change the data into a table format and define the columntitle
-                st.table(purchases_df) # Display the table
-            else:
-                st.write("No purchases recorded.")  # Message if there are no purchases
+        history_view(st.session_state["purchases"], "barcode_purchases", st.session_state["roommates"]) # Only the visible page is sent
+
+# Function to look up the products of barcodes, returns one row per barcode for review_products
+def product_rows(barcodes):
+    rows = []
+    for barcode in barcodes:
+        product_info = get_product_info(barcode) or {"name": "", "brand": ""} # Cached lookups
+        rows.append({"Barcode": barcode, "Product": product_info["name"], "Brand": product_info["brand"],
+                     "Quantity": 1.0, "Unit": "Pieces", "Price": 0.0})
+    return rows
+
+# Function to scan many images at once, all barcodes are looked up and can be added together
+def bulk_scan():
+    uploaded_files = st.file_uploader("Upload images with barcodes", type=["jpg", "jpeg", "png"], accept_multiple_files=True)
+    if uploaded_files and st.button("Scan all images"):
+        files = [(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_files]
+        with st.spinner(f"Scanning {len(files)} images..."):
+            results, barcodes = barcode_scanner.scan_files(files) # Decoded in a process pool
+        for result in results:
+            if result["error"]:
+                st.warning(f"{result['name']} could not be read: {result['error']}")
+            elif not result["barcodes"]:
+                st.write(f"No barcode found in {result['name']}.")
+        st.session_state["bulk_scan_rows"] = product_rows([barcode["data"] for barcode in barcodes])
+        timings = barcode_scanner.total_timings(results)
+        st.caption("Time per stage: " + ", ".join(f"{stage} {seconds:.2f} s" for stage, seconds in timings.items()))
+
+    if st.session_state.get("bulk_scan_rows"):
+        st.write(f"{len(st.session_state['bulk_scan_rows'])} different barcodes found. Correct the products and add them:")
+        review_products("bulk_scan_rows")
 
 # Main page function
 def barcode_page():
     st.title("Upload your barcode") # Define the title of the side
+    mode = st.radio("Scan mode:", ("One image", "Several images", "Receipt"), horizontal=True)
+    if mode != "One image":
+        if mode == "Several images":
+            bulk_scan()
+        else:
+            receipt_scan()
+        display_total_expenses()
+        display_purchases()
+        return
     uploaded_file = st.file_uploader("Upload an image with a barcode", type=["jpg", "jpeg", "png"]) # Function that people can upload files
 
     if uploaded_file is not None: # Checks if an image has been uploaded
         image = Image.open(uploaded_file)  # Use pillow library to open the image
         st.write("Scanning for barcode...")
-        barcode = barcode_decode(image) # Activates the barcode function to scan the image for a barcode
+        barcodes = barcode_decode(image) # Activates the barcode function to scan the image for barcodes
 
-        if barcode: # Check if a barcode was found
+        if len(barcodes) > 1: # Several products in one picture, they are added together like in bulk mode
+            if st.session_state.get("single_scan_barcodes") != barcodes: # Looked up once per picture, not on every rerun
+                st.session_state["single_scan_barcodes"] = barcodes
+                st.session_state["single_scan_rows"] = product_rows(barcodes)
+            if st.session_state.get("single_scan_rows"):
+                st.write(f"{len(barcodes)} barcodes found: {', '.join(barcodes)}. Correct the products and add them:")
+                review_products("single_scan_rows")
+        elif barcodes: # Check if a barcode was found
+            barcode = barcodes[0]
             st.write(f"Barcode found: {barcode}")
             st.write("Searching for product information...")
             product_info = get_product_info(barcode) # Calls the previous defined function to get information about the product
@@ -112,10 +192,11 @@ def barcode_page():
             quantity = st.number_input("Quantity:", min_value=0.0, step=0.1, format="%.1f")
             unit = st.selectbox("Unit:", ["Pieces", "Liters", "Grams"])
             price = st.number_input("Price (in CHF):", min_value=0.0, step=0.1, format="%.2f")
+            expires = st.date_input("Best before (optional):", value=None)
 
             if st.button("Add product to inventory"):
                 if food_item and quantity > 0 and price >= 0: # Make sure that all fields have been filled in
-                    add_product_to_inventory(food_item, quantity, unit, price, selected_roommate) # Add product to the inventory
+                    add_product_to_inventory(food_item, quantity, unit, price, selected_roommate, expires) # Add product to the inventory
                 else:
                     st.warning("Please fill in all fields.")
         else:
@@ -126,4 +207,5 @@ def barcode_page():
 
 # The following part is unnecessary because it is only used to run and test this page
 # Run page
-barcode_page()
\ No newline at end of file
+if __name__ == "__main__":
+    barcode_page()
\ No newline at end of file
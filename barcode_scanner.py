@@ -0,0 +1,103 @@
+import io # Uploaded files are passed to the workers as bytes
+import multiprocessing # Workers are started with "spawn", forking a server with running threads is not safe
+import os # To get the number of processors
+import threading # The process pool is shared by all sessions
+import time # To measure the time of every stage
+from concurrent.futures import ProcessPoolExecutor # Images are decoded in separate processes, not on the UI thread
+from concurrent.futures.process import BrokenProcessPool # Raised when a worker crashed
+from PIL import Image, ImageOps # Use for editing images
+import metrics # Timing of scanning several files
+
+# Barcode scanning for one or many images. Every image is preprocessed before decoding: turned upright according
+# to its EXIF orientation, converted to grayscale and downscaled to MAX_SIDE pixels (JPEGs are already decoded at
+# a reduced size, so a 12 MP photo never has to be held in memory at full resolution). If no barcode is found, the
+# image is decoded again at the other SCALES. All barcodes of an image are returned, not just the first one.
+MAX_SIDE = 1600 # Longest side of the image which is decoded, in pixels
+SCALES = [1.0, 0.5, 1.5] # Scales tried one after the other until a barcode is found
+MAX_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Function to open an image and prepare it for decoding, returns a grayscale image of at most MAX_SIDE pixels
+def preprocess(image, max_side=MAX_SIDE):
+    if image.format == "JPEG":
+        image.draft("L", (max_side, max_side)) # Let the JPEG decoder downscale while reading (less memory)
+    image = ImageOps.exif_transpose(image) # Photos taken with a rotated phone are stored sideways
+    image = image.convert("L")
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side))
+    return image
+
+# Function to decode all barcodes of a prepared image, tries the other scales if nothing is found.
+# Returns a list of {"data", "type"} dictionaries without duplicates.
+def decode_all(image, scales=SCALES):
+    from pyzbar.pyzbar import decode # Use for decoing barcode (imported here, so preprocessing works without zbar)
+    for scale in scales:
+        scaled = image if scale == 1.0 else image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))))
+        found = []
+        for obj in decode(scaled):
+            barcode = {"data": obj.data.decode("utf-8"), "type": obj.type} # Convert a binary number into a string
+            if barcode not in found:
+                found.append(barcode)
+        if found:
+            return found
+    return []
+
+# Function to scan one uploaded file, returns its barcodes and how long every stage took (runs in a worker)
+def scan_file(name, content, max_side=MAX_SIDE):
+    result = {"name": name, "barcodes": [], "timings": {}, "error": None}
+    start = time.perf_counter()
+    try:
+        image = Image.open(io.BytesIO(content))
+        result["timings"]["open"] = time.perf_counter() - start
+        start = time.perf_counter()
+        image = preprocess(image, max_side)
+        result["timings"]["preprocess"] = time.perf_counter() - start
+        start = time.perf_counter()
+        result["barcodes"] = decode_all(image)
+        result["timings"]["decode"] = time.perf_counter() - start
+    except Exception as e: # A broken image must not stop the other images
+        result["error"] = str(e)
+    return result
+
+# Function to get the shared process pool
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+# Function to scan several files, files is a list of (name, bytes). Returns the result of every file and the
+# barcodes of all files without duplicates, each with the names of the files it was found in.
+@metrics.timed("barcode.scan_files")
+def scan_files(files, max_side=MAX_SIDE, parallel=True):
+    global _pool
+    results = None
+    if parallel and len(files) > 1:
+        pool = get_pool()
+        try:
+            results = list(pool.map(scan_file, [name for name, _ in files], [content for _, content in files], [max_side] * len(files)))
+        except BrokenProcessPool: # A worker crashed, start a new pool next time and scan here
+            with _pool_lock:
+                if _pool is pool:
+                    _pool = None
+    if results is None:
+        results = [scan_file(name, content, max_side) for name, content in files]
+    barcodes = {}
+    for result in results:
+        for barcode in result["barcodes"]:
+            entry = barcodes.setdefault(barcode["data"], {"data": barcode["data"], "type": barcode["type"], "files": []})
+            entry["files"].append(result["name"])
+    return results, list(barcodes.values())
+
+# Function to add up the time of every stage over all files
+def total_timings(results):
+    totals = {}
+    for result in results:
+        for stage, seconds in result["timings"].items():
+            totals[stage] = totals.get(stage, 0.0) + seconds
+    return totals
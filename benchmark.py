@@ -0,0 +1,301 @@
+import argparse # Command line options
+import contextlib # The flat is stored in a temporary folder for the time of a benchmark
+import io # Sample images are created in memory
+import json # To print the results
+import os # To run the storage benchmarks in a temporary folder
+import random # Synthetic data
+import statistics # Median of the measurements
+import subprocess # To record the commit the results belong to
+import sys # To find the Python interpreter
+import tempfile # Storage benchmarks write into a temporary folder
+import time # To measure
+from datetime import datetime, timedelta # Dates of the synthetic purchases
+
+# Repeatable benchmarks of the hot paths, the results are printed as JSON so runs of different commits can be
+# compared. A synthetic flat with N roommates and M purchases, consumptions and ratings is generated with a fixed
+# seed, then these are measured:
+#   storage     writing the flat as events and loading it, appending one change and loading again (JSON files and SQLite)
+#   auto_save   auto_save after a setting changed and writing the journaled change (JSON files and SQLite)
+#   pages       rendering the overview and the inventory page with Streamlit's AppTest, the session is loaded from
+#               the stored flat like at login (first render) and then rendered again (rerun, the caches are warm)
+#   recommend   predict_recipe without and with the cache, best_recipes over the inventory
+#   barcode     preprocessing and decoding sample images (from --images or generated blank images)
+# Run with: python benchmark.py [--roommates 4] [--purchases 2000] [--output results.json]
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+PRODUCTS = ['chicken', 'curry powder', 'coconut milk', 'onion', 'garlic', 'ginger', 'beef', 'potatoes', 'carrots',
+            'beef broth', 'broccoli', 'bell peppers', 'soy sauce', 'tofu', 'lentils', 'celery', 'fish', 'tortillas',
+            'cabbage', 'lime', 'avocado', 'eggs', 'cream', 'bacon', 'cheese', 'flour', 'sugar', 'butter', 'apples', 'bread']
+UNITS = ["Pieces", "Liters", "Grams"]
+
+
+# Function to create a flat with the same structure as the app stores it
+def generate_flat(roommates=4, purchases=2000, consumed=None, ratings=None, days=365, seed=0):
+    rng = random.Random(seed)
+    consumed = purchases // 2 if consumed is None else consumed
+    ratings = purchases // 20 if ratings is None else ratings
+    mates = [f"Roommate {n + 1}" for n in range(roommates)]
+    start = datetime.now() - timedelta(days=days)
+    def entry():
+        return {
+            "Product": rng.choice(PRODUCTS),
+            "Quantity": float(rng.randint(1, 5)),
+            "Price": round(rng.uniform(0.5, 20), 2),
+            "Unit": rng.choice(UNITS),
+            "Date": (start + timedelta(seconds=rng.randint(0, days * 86400))).strftime("%Y-%m-%d %H:%M:%S"),
+        }
+    data = {
+        "flate_name": "Benchmark flat",
+        "setup_finished": True,
+        "roommates": mates,
+        "inventory": {product: {"Quantity": float(rng.randint(1, 10)), "Unit": rng.choice(UNITS), "Price": round(rng.uniform(1, 30), 2)}
+                      for product in rng.sample(PRODUCTS, min(20, len(PRODUCTS)))},
+        "purchases": {mate: [] for mate in mates},
+        "consumed": {mate: [] for mate in mates},
+        "cooking_history": [],
+        "recipe_links": {},
+        "recipe_suggestions": [],
+        "selected_recipe": None,
+        "selected_recipe_link": None,
+    }
+    for _ in range(purchases):
+        data["purchases"][rng.choice(mates)].append(entry())
+    for _ in range(consumed):
+        data["consumed"][rng.choice(mates)].append(entry())
+    for _ in range(ratings):
+        recipe = f"Recipe {rng.randint(1, 50)}"
+        data["cooking_history"].append({"Person": rng.choice(mates), "Recipe": recipe, "Rating": rng.randint(1, 5),
+                                        "Link": f"https://www.themealdb.com/meal/{recipe}", "Date": entry()["Date"]})
+    data["expenses"] = {mate: round(sum(p["Price"] for p in data["purchases"][mate]), 2) for mate in mates}
+    return data
+
+# Function to turn the flat into the events the app journals for it, in the order of their dates
+def flat_events(data):
+    events = [{"op": "set", "key": key, "value": data[key]} for key in ["flate_name", "setup_finished"]]
+    events += [{"op": "add_roommate", "roommate": mate} for mate in data["roommates"]]
+    changes = sorted([(entry["Date"], op, mate, entry) for op, key in (("add_product", "purchases"), ("delete_product", "consumed"))
+                      for mate, entries in data[key].items() for entry in entries], key=lambda change: change[0])
+    for number, (date, op, mate, entry) in enumerate(changes):
+        event = {"op": op, "product": entry["Product"], "quantity": entry["Quantity"], "unit": entry["Unit"],
+                 "price": entry["Price"], "roommate": mate, "date": date}
+        if op == "add_product":
+            event["lot"] = f"bench-{number}"
+        events.append(event)
+    events += [{"op": "rate_recipe", "entry": entry} for entry in data["cooking_history"]]
+    return events
+
+# Function to run fn several times, returns the times in milliseconds
+def measure(fn, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return summarize(times)
+
+# Function to summarize times in milliseconds
+def summarize(times):
+    return {"median_ms": statistics.median(times), "min_ms": min(times), "max_ms": max(times), "runs": len(times)}
+
+# Function to measure saving and loading with both storage backends
+def bench_storage(data, repeat):
+    from storage_backend import JsonBackend, SqliteBackend
+    results = {}
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder) # The backends write into the current folder
+        try:
+            for name, backend in (("json", JsonBackend()), ("sqlite", SqliteBackend(os.path.join(folder, "benchmark.db")))):
+                username = f"bench_{name}"
+                events = flat_events(data)
+                def write():
+                    backend.delete(username)
+                    backend.append_many(username, events)
+                    backend.compact(username)
+                event = {"op": "add_product", "product": "onion", "quantity": 1.0, "price": 1.0, "unit": "Pieces",
+                         "roommate": data["roommates"][0], "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+                results[name] = {
+                    "write": measure(write, repeat),
+                    "load": measure(lambda: backend.load(username), repeat),
+                    "load_hot": measure(lambda: backend.load_hot(username), repeat),
+                    "append_and_load_hot": measure(lambda: (backend.append(username, event), backend.load_hot(username)), repeat),
+                }
+                backend.delete(username)
+        finally:
+            os.chdir(previous)
+    return results
+
+# Function to store the flat with a backend in a temporary folder, yields the username while the backend is active
+@contextlib.contextmanager
+def stored_flat(data, name):
+    import storage_backend
+    import write_behind
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder) # The backends write into the current folder
+        backend = storage_backend.JsonBackend() if name == "json" else storage_backend.SqliteBackend(os.path.join(folder, "benchmark.db"))
+        storage_backend.set_backend(backend)
+        username = f"bench_{name}"
+        try:
+            backend.append_many(username, flat_events(data))
+            backend.compact(username) # Logins start from a compacted snapshot, like in the app
+            yield username
+        finally:
+            write_behind.flush(username)
+            storage_backend.set_backend(None)
+            os.chdir(previous)
+
+# Script which loads the session from the stored flat on its first run (like login_user) and syncs it on every run
+SESSION_SCRIPT = """
+import streamlit as st
+from flat_sync import load_session, sync_session
+if not st.session_state.get("logged_in"):
+    st.session_state["logged_in"] = True
+    st.session_state["username"] = {username!r}
+    load_session({username!r})
+sync_session()
+"""
+
+# Page script: renders the page function like main.py does
+PAGE_SCRIPT = SESSION_SCRIPT + """
+from {module} import {function}
+{function}()
+"""
+
+# auto_save script: changes a setting, saves it and writes the journal, the times are stored in the session state
+AUTO_SAVE_SCRIPT = SESSION_SCRIPT + """
+import time
+import write_behind
+from store_externally import auto_save
+st.session_state["selected_recipe"] = f"Recipe {{time.perf_counter()}}" # A new value on every run
+start = time.perf_counter()
+auto_save()
+queued = time.perf_counter()
+write_behind.flush({username!r})
+st.session_state["bench_ms"] = ((queued - start) * 1000, (time.perf_counter() - queued) * 1000)
+"""
+
+# Function to measure rendering a page with the session loaded from the flat stored with each backend
+def bench_page(module, function, data, repeat):
+    from streamlit.testing.v1 import AppTest
+    def run(app):
+        app.run()
+        if app.exception:
+            raise RuntimeError(app.exception[0].value)
+    results = {}
+    for name in ("json", "sqlite"):
+        with stored_flat(data, name) as username:
+            script = PAGE_SCRIPT.format(username=username, module=module, function=function)
+            new_app = lambda: AppTest.from_string(script, default_timeout=300)
+            app = new_app()
+            results[name] = {
+                "first_render": measure(lambda: run(new_app()), repeat), # Loads the session and builds the ledgers and figures
+                "rerun": (run(app), measure(lambda: run(app), repeat))[1], # Same session again, like clicking a widget
+            }
+    return results
+
+# Function to measure auto_save with the journaling save path of each backend
+def bench_auto_save(data, repeat):
+    from streamlit.testing.v1 import AppTest
+    results = {}
+    for name in ("json", "sqlite"):
+        with stored_flat(data, name) as username:
+            app = AppTest.from_string(AUTO_SAVE_SCRIPT.format(username=username), default_timeout=300)
+            times = []
+            for _ in range(repeat + 1): # The first run loads the session
+                app.run()
+                if app.exception:
+                    raise RuntimeError(app.exception[0].value)
+                times.append(app.session_state["bench_ms"])
+            times = times[1:]
+            results[name] = {
+                "auto_save": summarize([queued for queued, _ in times]), # Time the page waits, the change is only queued
+                "write": summarize([written for _, written in times]), # Writing the change in the background
+            }
+    return results
+
+# Function to measure the recipe model
+def bench_recommend(data, repeat):
+    import model_holder
+    import prediction_cache
+    import recommender
+    start = time.perf_counter()
+    model_holder.get_components()
+    results = {"load_ms": (time.perf_counter() - start) * 1000}
+    ingredients = list(data["inventory"])[:5]
+    import recipe_page
+    def uncached():
+        prediction_cache.clear()
+        recipe_page.predict_recipe(ingredients)
+    results["predict_recipe"] = measure(uncached, repeat)
+    results["predict_recipe_cached"] = measure(lambda: recipe_page.predict_recipe(ingredients), repeat)
+    results["best_recipes"] = measure(lambda: recommender.best_recipes(list(data["inventory"]), k=3), repeat)
+    return results
+
+# Function to measure barcode preprocessing and decoding
+def bench_barcode(images_dir, repeat):
+    from PIL import Image
+    import barcode_scanner
+    files = []
+    if images_dir:
+        for name in sorted(os.listdir(images_dir)):
+            if name.lower().endswith((".jpg", ".jpeg", ".png")):
+                with open(os.path.join(images_dir, name), "rb") as file:
+                    files.append((name, file.read()))
+    if not files: # Blank phone-sized photos, measures preprocessing and an unsuccessful decode
+        for n in range(4):
+            buffer = io.BytesIO()
+            Image.new("RGB", (4032, 3024), "white").save(buffer, "JPEG")
+            files.append((f"blank{n}.jpg", buffer.getvalue()))
+    results = {"images": len(files)}
+    results["serial"] = measure(lambda: barcode_scanner.scan_files(files, parallel=False), repeat)
+    scanned, _ = barcode_scanner.scan_files(files, parallel=False)
+    results["stages_ms"] = {stage: seconds * 1000 / len(files) for stage, seconds in barcode_scanner.total_timings(scanned).items()}
+    results["errors"] = sorted({result["error"] for result in scanned if result["error"]})
+    return results
+
+# Function to get the commit of the working copy, so results can be matched to it
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+# Function to run all benchmarks, a benchmark which fails reports its error instead of stopping the others
+def run_benchmarks(roommates=4, purchases=2000, repeat=5, images_dir=None, only=None):
+    data = generate_flat(roommates, purchases)
+    benchmarks = {
+        "storage": lambda: bench_storage(data, repeat),
+        "auto_save": lambda: bench_auto_save(data, repeat),
+        "overview_page": lambda: bench_page("Overview_page", "overview_page", data, repeat),
+        "fridge_page": lambda: bench_page("fridge_page", "fridge_page", data, repeat),
+        "recommend": lambda: bench_recommend(data, repeat),
+        "barcode": lambda: bench_barcode(images_dir, repeat),
+    }
+    results = {"commit": current_commit(), "python": sys.version.split()[0], "roommates": roommates,
+               "purchases": purchases, "repeat": repeat, "results": {}}
+    for name, benchmark in benchmarks.items():
+        if only and name not in only:
+            continue
+        try:
+            results["results"][name] = benchmark()
+        except Exception as e:
+            results["results"][name] = {"error": f"{type(e).__name__}: {e}"}
+    return results
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, APP_DIR)
+    parser = argparse.ArgumentParser(description="Benchmarks of the app, results are printed as JSON")
+    parser.add_argument("--roommates", type=int, default=4)
+    parser.add_argument("--purchases", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--images", help="Folder with barcode photos")
+    parser.add_argument("--only", nargs="*", help="Run only these benchmarks")
+    parser.add_argument("--output", help="Write the results to this file instead of printing them")
+    arguments = parser.parse_args()
+    output = json.dumps(run_benchmarks(arguments.roommates, arguments.purchases, arguments.repeat, arguments.images, arguments.only), indent=2)
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
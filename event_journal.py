@@ -0,0 +1,240 @@
+import json # To store the events as JSON lines
+import os # To check and remove files
+import expiry # Products are stored in lots with expiry dates
+from file_utils import atomic_write_json, atomic_write_text, file_lock # To write the compacted snapshot safely
+
+# Every change of the flat data is appended as one line to the journal instead of rewriting the whole data file.
+# The snapshot is split in two sections which are only rewritten when the journal is compacted:
+# {username}_data.json holds the hot state (settings, roommates, inventory with its lots, expenses, waste) which every page needs,
+# {username}_history.json holds the history (HISTORY_KEYS) which is only loaded when a page uses it.
+# Every event increases the version of the flat by one. Both sections store the version they contain and the
+# journal starts with a "base" record holding that version, so a session can tell which events it hasn't seen yet.
+# Loading applies only the journal events newer than the version of the section, so a compaction which was
+# interrupted between writing the sections and starting the new journal doesn't apply events twice.
+COMPACT_EVERY = 500 # Number of journal records after which the snapshot is rewritten (at login and by the saver)
+HISTORY_KEYS = ["purchases", "consumed", "cooking_history", "recipe_links"]
+
+
+# Function to get the name of the snapshot file of a flat (hot section)
+def snapshot_file(username):
+    return f"{username}_data.json"
+
+# Function to get the name of the history file of a flat (history section)
+def history_file(username):
+    return f"{username}_history.json"
+
+# Function to get the name of the journal file of a flat
+def journal_file(username):
+    return f"{username}_journal.jsonl"
+
+# Function to append one event to the journal of a flat
+def append_event(username, event):
+    append_events(username, [event])
+
+# Function to append several events with one write
+def append_events(username, events):
+    with file_lock(journal_file(username)): # Compaction must not remove the journal while we append
+        drop_cut_off_line(journal_file(username))
+        with open(journal_file(username), "a") as file: # Opens file in append modus, existing lines are never rewritten
+            file.write("".join(json.dumps(event) + "\n" for event in events))
+
+# Function to remove a last line which a crash cut off during the write (the journal lock must be held).
+# Otherwise the next event would be appended to it and both would be unreadable.
+def drop_cut_off_line(path):
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as file: # Opens file in binary read and write modus
+        end = file.seek(0, os.SEEK_END)
+        position = end
+        while position > 0: # Search the last newline from the end, in blocks
+            start = max(0, position - 4096)
+            file.seek(start)
+            block = file.read(position - start)
+            newline = block.rfind(b"\n")
+            if newline >= 0:
+                position = start + newline + 1
+                break
+            position = start
+        if position < end: # Everything after the last newline is the cut off line
+            file.truncate(position)
+
+# Function to read the journal, returns the version of the snapshot it starts from and the events
+def read_journal(username):
+    base, events = None, []
+    if os.path.exists(journal_file(username)):
+        base = 0 # Journal of a new flat or written before versions existed, its events start at version 1
+        with open(journal_file(username), "r") as file: # Opens file in read modus
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue # Cut off by a crash, the change was never completely written
+                if record["op"] == "base":
+                    base = record["version"]
+                else:
+                    events.append(record)
+    if base is None: # No journal at all, the snapshot contains everything
+        base = read_json(snapshot_file(username)).get("version", 0)
+    return base, events
+
+# Function to read all events of the journal
+def read_events(username):
+    return read_journal(username)[1]
+
+# Function to get the current version of the flat
+def current_version(username):
+    base, events = read_journal(username)
+    return base + len(events)
+
+# Function to get the events a session with the given version hasn't seen yet, together with the new version.
+# Returns None if the events were already compacted into the snapshot, the session has to load the flat again.
+def events_since(username, version):
+    base, events = read_journal(username)
+    if version < base:
+        return None
+    return events[version - base:], base + len(events)
+
+# Function to read a JSON file, returns an empty dictionary if the file does not exist
+def read_json(path):
+    if os.path.exists(path):
+        with open(path, "r") as file: # Opens file in read modus
+            return json.load(file)
+    return {}
+
+# Function to apply one journal event to the flat data (same changes as the page functions did).
+# With hot=False only the history is changed, with history=False only the hot state. version is the version of the
+# event if it is known, it names the lots of events from before lots existed.
+def apply_event(data, event, hot=True, history=True, version=None):
+    op = event["op"]
+    if op in ["add_product", "delete_product"]: # Product was added to or removed from the inventory
+        mate = event["roommate"]
+        if hot:
+            inventory = data.setdefault("inventory", {})
+            expenses = data.setdefault("expenses", {})
+            expenses.setdefault(mate, 0.0)
+            # Totals and lots of the product, lots used up after their expiry day count as waste
+            changed = expiry.change_inventory(inventory, event, data.setdefault("waste", {}), version)
+            if op == "add_product":
+                if data.get("expiry_queue") is not None: # Keep the "use soon" queue of a session up to date
+                    data["expiry_queue"].push(event["product"], changed)
+                expenses[mate] += event["price"]
+            else: # The price of a removal is the amount that was deducted
+                expenses[mate] -= event["price"]
+        if history:
+            ensure_history(data, mate)
+            data["purchases" if op == "add_product" else "consumed"][mate].append({
+                "Product": event["product"],
+                "Quantity": event["quantity"],
+                "Price": event["price"],
+                "Unit": event["unit"],
+                "Date": event["date"]
+            })
+    elif op == "rate_recipe": # Recipe was rated and added to the cooking history
+        if history:
+            data.setdefault("cooking_history", []).append(event["entry"])
+    elif op == "add_roommate":
+        if hot:
+            roommates = data.setdefault("roommates", [])
+            if event["roommate"] not in roommates:
+                roommates.append(event["roommate"])
+            data.setdefault("expenses", {}).setdefault(event["roommate"], 0.0)
+        if history:
+            ensure_history(data, event["roommate"])
+    elif op == "remove_roommate":
+        if hot:
+            roommates = data.setdefault("roommates", [])
+            if event["roommate"] in roommates:
+                roommates.remove(event["roommate"])
+    elif op == "set": # Simple settings like the flat name are stored with their new value
+        if history if event["key"] in HISTORY_KEYS else hot:
+            data[event["key"]] = event["value"]
+
+# Function to make sure a roommate has entries in purchases and consumed
+def ensure_history(data, mate):
+    data.setdefault("purchases", {}).setdefault(mate, [])
+    data.setdefault("consumed", {}).setdefault(mate, [])
+
+# Function to build the hot section from the snapshot and the events
+# Only the events newer than the version stored in the snapshot are applied: if compaction was interrupted after the
+# snapshot was replaced but before the journal was reset, the journal still holds events which are in the snapshot.
+def replay_hot(username, base, events):
+    data = read_json(snapshot_file(username))
+    for key in HISTORY_KEYS: # Snapshots written before the split contain the history as well
+        data.pop(key, None)
+    stored = data.get("version", base)
+    for version, event in enumerate(events, start=base + 1):
+        if version > stored:
+            apply_event(data, event, history=False, version=version)
+    data["version"] = base + len(events)
+    return data
+
+# Function to build the history section from the history snapshot and the events newer than the version it stores
+def replay_history(username, base, events):
+    if os.path.exists(history_file(username)):
+        history = read_json(history_file(username))
+    else: # Snapshot written before the split
+        legacy = read_json(snapshot_file(username))
+        history = {key: legacy[key] for key in HISTORY_KEYS if key in legacy}
+        history["version"] = legacy.get("version", base)
+    stored = history.pop("version", base) # History files written before they stored their version
+    for version, event in enumerate(events, start=base + 1):
+        if version > stored:
+            apply_event(history, event, hot=False)
+    return history
+
+# Function to load the hot section, this is all that is needed to log in.
+# Loading holds the journal lock, so the snapshot and the journal can't be compacted in between.
+def load_hot(username):
+    with file_lock(journal_file(username)):
+        base, events = read_journal(username)
+        if len(events) < COMPACT_EVERY:
+            return replay_hot(username, base, events)
+        data = compact_locked(username) # Keep the journal short so the next login stays fast
+    return {key: value for key, value in data.items() if key not in HISTORY_KEYS}
+
+# Function to load the history section together with the version it belongs to ("version")
+def load_history(username):
+    with file_lock(journal_file(username)):
+        base, events = read_journal(username)
+        return dict(replay_history(username, base, events), version=base + len(events))
+
+# Function to load the complete flat data
+def load_state(username):
+    with file_lock(journal_file(username)):
+        return read_state(username)
+
+# Function to read snapshot and journal into the complete flat data (the journal lock must be held)
+def read_state(username):
+    base, events = read_journal(username)
+    data = replay_hot(username, base, events)
+    data.update(replay_history(username, base, events))
+    return data
+
+# Function to replay the journal into a new snapshot once it has at least min_events records, so reading the events
+# of a flat that stays logged in doesn't get slower and slower. Returns True if the journal was compacted.
+def compact(username, min_events=None):
+    with file_lock(journal_file(username)): # No event can be appended between reading and replacing the journal
+        if len(read_events(username)) < (COMPACT_EVERY if min_events is None else min_events):
+            return False
+        compact_locked(username)
+        return True
+
+def compact_locked(username):
+    data = read_state(username)
+    write_sections(username, data)
+    return data
+
+# Function to write both snapshot sections and start a new journal (the journal lock must be held)
+def write_sections(username, data):
+    atomic_write_json(history_file(username), dict({key: data[key] for key in HISTORY_KEYS if key in data}, version=data["version"]))
+    atomic_write_json(snapshot_file(username), {key: value for key, value in data.items() if key not in HISTORY_KEYS})
+    atomic_write_text(journal_file(username), json.dumps({"op": "base", "version": data["version"]}) + "\n") # Only the base record
+
+# Function to remove snapshot, history and journal of a flat
+def delete_state(username):
+    for path in (snapshot_file(username), history_file(username), journal_file(username), journal_file(username) + ".lock"):
+        if os.path.exists(path):
+            os.remove(path)
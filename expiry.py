@@ -0,0 +1,173 @@
+import heapq # The "use soon" queue is a heap ordered by expiry date
+from datetime import date, timedelta # Expiry dates are days
+
+# Every product of the inventory keeps its batches (lots) next to the totals:
+#   inventory[product] = {"Quantity", "Unit", "Price", "Lots": [{"Id", "Quantity", "Price", "Expires", "Added"}, ...]}
+# "Expires" is the best-before day ("YYYY-MM-DD") or None, "Added" is the date of the purchase. Products stored before
+# lots existed are one lot without expiry date. Removals use up the lots first in, first out: the lot that expires first
+# is used first, lots without expiry date last, and lots with the same date in the order they were bought.
+# The session that removes a product chooses the lots and the delete_product event names them ("lots": [[lot id,
+# quantity], ...]), so every session and backend uses up the same lots, also if another session added a lot at the
+# same time. Removals journaled before lots were named use the lots first in, first out.
+# ExpiryQueue is a heap of (expiry day, lot id, product) so "what expires in the next N days" only looks at the lots
+# that do, not at the whole inventory. Lots which were used up stay in the heap until they come to the top (lazy removal).
+# Lots that are used up after they expired count as waste: data["waste"] = {"lots", "quantity", "value", "products"}.
+DATE_FORMAT = "%Y-%m-%d"
+SOON_DAYS = 3 # Lots expiring within this many days are shown and preferred by the recipe search
+
+
+# Function to get the lots of an inventory item, an item stored before lots existed becomes one lot without expiry date
+def lots_of(item):
+    if "Lots" not in item:
+        item["Lots"] = [{"Id": "stock", "Quantity": item["Quantity"], "Price": item["Price"], "Expires": None, "Added": None}]
+    return item["Lots"]
+
+# Function to get the order in which lots are used up
+def fifo_key(lot):
+    return (lot["Expires"] is None, lot["Expires"] or "", lot["Added"] or "")
+
+# Function to get the id of the lot an add_product event creates. Events from before lots existed have none, their lot
+# is named after the version of the event, which is the same in every session and backend that replays it.
+def lot_id(event, item, version=None):
+    if event.get("lot"):
+        return event["lot"]
+    if version is not None:
+        return f"v{version}"
+    return f"{event['date']}-{len(item.get('Lots', []))}" # Version unknown
+
+# Function to apply an add_product or delete_product event to the inventory (totals and lots), version is the
+# version of the event if it is known. Returns the lot that was added, or the lots that were used up as [(lot, quantity, price)].
+def change_inventory(inventory, event, waste=None, version=None):
+    product = event["product"]
+    if event["op"] == "add_product":
+        if product in inventory:
+            item = inventory[product]
+            lots = lots_of(item)
+            item["Quantity"] += event["quantity"]
+            item["Price"] += event["price"]
+        else:
+            item = inventory[product] = {"Quantity": event["quantity"], "Unit": event["unit"], "Price": event["price"], "Lots": []}
+            lots = item["Lots"]
+        lot = {"Id": lot_id(event, item, version), "Quantity": event["quantity"], "Price": event["price"],
+               "Expires": event.get("expires"), "Added": event["date"]}
+        lots.append(lot)
+        return lot
+    if product not in inventory:
+        return []
+    item = inventory[product]
+    lots = lots_of(item)
+    taken = take_lots(lots, event["lots"]) if "lots" in event else take(lots, event["quantity"])
+    # The totals are the sum of the remaining lots, so they can't drift from them (e.g. the price of a removal journaled
+    # before lots existed is not the value of the lots that were used up)
+    item["Quantity"] = sum(lot["Quantity"] for lot in lots)
+    item["Price"] = sum(lot["Price"] for lot in lots)
+    if not lots:
+        del inventory[product]
+    if waste is not None:
+        count_waste(waste, product, taken, event["date"][:10])
+    return taken
+
+# Function to use up a quantity from the lots (first in, first out), returns [(lot, quantity, price)] of the used lots
+def take(lots, quantity):
+    taken = []
+    for lot in sorted(lots, key=fifo_key):
+        if quantity <= 0:
+            break
+        used = min(quantity, lot["Quantity"])
+        quantity -= used
+        taken.append(use(lot, used))
+    lots[:] = [lot for lot in lots if lot["Quantity"] > 1e-9]
+    return taken
+
+# Function to use up the lots a removal names ([[lot id, quantity], ...]), returns [(lot, quantity, price)].
+# A quantity whose lot is already gone (another session used it up at the same time) is taken first in, first out.
+def take_lots(lots, planned):
+    by_id = {lot["Id"]: lot for lot in lots}
+    taken, rest = [], 0.0
+    for lot_id, quantity in planned:
+        lot = by_id.get(lot_id)
+        used = min(quantity, lot["Quantity"]) if lot else 0.0
+        if used > 0:
+            taken.append(use(lot, used))
+        rest += quantity - used
+    lots[:] = [lot for lot in lots if lot["Quantity"] > 1e-9]
+    if rest > 1e-9:
+        taken += take(lots, rest)
+    return taken
+
+# Function to use up a quantity of one lot, returns (lot, quantity, price of the quantity)
+def use(lot, quantity):
+    price = lot["Price"] / lot["Quantity"] * quantity if lot["Quantity"] > 0 else 0.0
+    lot["Quantity"] -= quantity
+    lot["Price"] -= price
+    return lot, quantity, price
+
+# Function to choose the lots for using up a quantity of an item (first in, first out) without changing it.
+# Returns the lots for the delete_product event ([[lot id, quantity], ...]) and the price of the used up part.
+def plan_removal(item, quantity):
+    lots = [dict(lot) for lot in lots_of(item)]
+    taken = take(lots, quantity)
+    return [[lot["Id"], used] for lot, used, _ in taken], sum(price for _, _, price in taken)
+
+# Function to add the lots that were used up after their expiry day to the waste
+def count_waste(waste, product, taken, day):
+    for lot, quantity, price in taken:
+        if lot["Expires"] and lot["Expires"] < day:
+            waste["lots"] = waste.get("lots", 0) + 1
+            waste["quantity"] = waste.get("quantity", 0.0) + quantity
+            waste["value"] = waste.get("value", 0.0) + price
+            products = waste.setdefault("products", {})
+            products[product] = products.get(product, 0.0) + price
+
+
+# Heap of the lots with an expiry date
+class ExpiryQueue:
+    def __init__(self, inventory):
+        self.inventory = inventory # The queue belongs to this inventory dictionary
+        self.heap = [(lot["Expires"], lot["Id"], product) for product, item in inventory.items()
+                     for lot in item.get("Lots", []) if lot["Expires"]]
+        heapq.heapify(self.heap)
+
+    # Function to add a new lot
+    def push(self, product, lot):
+        if lot["Expires"]:
+            heapq.heappush(self.heap, (lot["Expires"], lot["Id"], product))
+
+    # Function to find a lot that is still in the inventory
+    def lot(self, product, lot_id):
+        item = self.inventory.get(product)
+        return next((lot for lot in item.get("Lots", []) if lot["Id"] == lot_id), None) if item else None
+
+    # Function to get the lots which expire within the next days (and the ones that already expired), earliest first.
+    # Returns [(expiry day, product, lot)], only the lots up to the last day are taken from the heap.
+    def expiring(self, days=SOON_DAYS, today=None):
+        last = ((today or date.today()) + timedelta(days=days)).strftime(DATE_FORMAT)
+        found, seen = [], set()
+        while self.heap and self.heap[0][0] <= last:
+            expires, lot_id, product = heapq.heappop(self.heap)
+            lot = self.lot(product, lot_id)
+            if lot is not None and (lot_id, product) not in seen: # Used up lots are dropped from the heap here
+                seen.add((lot_id, product))
+                found.append((expires, product, lot))
+        for expires, product, lot in found: # The lots are still in the inventory, so they go back
+            heapq.heappush(self.heap, (expires, lot["Id"], product))
+        return found
+
+    # Function to get the products which expire within the next days, earliest first
+    def products(self, days=SOON_DAYS, today=None):
+        return list(dict.fromkeys(product for _, product, _ in self.expiring(days, today)))
+
+
+# Function to get the expiry queue of the flat data (e.g. st.session_state), it is built again when the inventory was replaced
+def expiry_queue(data):
+    queue = data.get("expiry_queue")
+    if queue is None or queue.inventory is not data.get("inventory"):
+        queue = data["expiry_queue"] = ExpiryQueue(data.setdefault("inventory", {}))
+    return queue
+
+# Function to sum up the lots which are still in the inventory but already expired
+def expired_summary(queue, today=None):
+    today = today or date.today()
+    expired = [(product, lot) for expires, product, lot in queue.expiring(-1, today)]
+    return {"lots": len(expired), "quantity": sum(lot["Quantity"] for _, lot in expired),
+            "value": sum(lot["Price"] for _, lot in expired), "products": sorted({product for product, _ in expired})}
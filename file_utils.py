@@ -0,0 +1,48 @@
+import json # To write the data as JSON
+import os # To rename and remove files
+import tempfile # To create the temporary file next to the target
+from contextlib import contextmanager # To use the lock with a with statement
+try:
+    import fcntl # File locks on Linux and macOS
+except ImportError:
+    fcntl = None
+    import msvcrt # File locks on Windows
+
+
+# Function to write a text file atomically: the text goes into a temporary file first which then replaces the target,
+# so a crash during the write never leaves a half written file behind
+def atomic_write_text(path, text):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_")
+    try:
+        with os.fdopen(fd, "w") as file: # Opens the temporary file in write modus
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno()) # Make sure the data is on disk before the rename
+        os.replace(tmp_path, path) # Rename is atomic, readers see either the old or the new file
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+# Function to write JSON atomically
+def atomic_write_json(path, data):
+    atomic_write_text(path, json.dumps(data))
+
+# Function to lock a file for the time of a with block, so only one process at a time changes the file
+@contextmanager
+def file_lock(path):
+    with open(path + ".lock", "a") as lock_file: # Separate lock file, the real file is replaced by atomic_write_json
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX) # Waits until no other process holds the lock
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1) # Windows
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,91 @@
+import json # To copy the settings
+import uuid # To give every browser session its own id
+import streamlit as st # Session state of the current browser session
+import write_behind # Saves the data in a background thread
+from storage_backend import get_backend # To load the flat and read the events of other sessions
+from event_journal import apply_event # To apply the events of other sessions to this session
+from lazy_history import lazy_history, is_unloaded, materialize # History is only loaded when a page needs it
+import metrics # Timing of loading and syncing
+
+# Several roommates can use the same flat in different browser sessions at the same time. Every session only
+# appends its own changes (events) and applies the events of the other sessions at the start of each rerun,
+# so no session overwrites the purchases of another one. Adding and removing products are deltas, the order
+# in which two sessions' events are applied doesn't change the result.
+
+# Settings which are small and changed directly in the session state, auto_save journals them when they change.
+# Inventory, expenses, purchases, consumed and the cooking history are journaled by the functions that change them.
+SETTINGS_KEYS = ["flate_name", "setup_finished", "recipe_suggestions", "selected_recipe", "selected_recipe_link", "recipe_links"]
+
+
+# Function to get the id of this browser session, it is stored in every event this session writes
+def session_id():
+    if "session_id" not in st.session_state:
+        st.session_state["session_id"] = uuid.uuid4().hex
+    return st.session_state["session_id"]
+
+# Function used by the pages to record a change, does nothing if no flat is signed in (pages run on their own for testing)
+def record_event(username, event):
+    if username:
+        write_behind.submit_events(username, [dict(event, session=session_id())])
+
+# Function to record several changes at once, they are written to the journal with one write
+def record_events(username, events):
+    if username and events:
+        write_behind.submit_events(username, [dict(event, session=session_id()) for event in events])
+
+# Function to load the flat data without the history (purchases, consumed, cooking history, recipe links)
+@metrics.timed("storage.load_hot")
+def load_hot_data(username):
+    write_behind.flush(username) # Changes of the flat that are still queued must be written first
+    return get_backend().load_hot(username)
+
+# Function to load only the history of the flat. The history can be newer than the hot state of the session, the
+# version it belongs to is stored in "history_version" so sync_session doesn't apply these events to it a second time.
+@metrics.timed("storage.load_history")
+def load_history_data(username):
+    from ledger import compact_history # Purchases and consumed are kept in compact columns (imports NumPy and pandas, not needed to log in)
+    write_behind.flush(username)
+    history = get_backend().load_history(username)
+    st.session_state["history_version"] = history.pop("version", 0)
+    return compact_history(history)
+
+# Function to copy the current settings, used to detect which of them changed since the last save.
+# Settings in the history which were not loaded yet can't have changed, their saved value is kept.
+def settings_snapshot():
+    saved = st.session_state.get("data") or {}
+    current = {}
+    for key in SETTINGS_KEYS:
+        value = st.session_state.get(key)
+        current[key] = saved.get(key) if is_unloaded(value) else materialize(value)
+    return json.loads(json.dumps(current))
+
+# Function to load the flat into the session state, the history is loaded on first access
+def load_session(username):
+    st.session_state["waste"] = {} # Flats which never used up an expired lot have no waste yet
+    st.session_state.update(load_hot_data(username)) # Hot state and the version it belongs to
+    st.session_state.pop("history_version", None) # Set again when the history is loaded
+    st.session_state.update(lazy_history(lambda: load_history_data(username)))
+    st.session_state["data"] = {}
+    st.session_state["data"] = settings_snapshot() # Settings as they are stored right now
+
+# Function to apply the changes other sessions of the flat made since the last rerun
+@metrics.timed("storage.sync")
+def sync_session():
+    username = st.session_state.get("username")
+    if not username or "version" not in st.session_state:
+        return
+    changes = get_backend().events_since(username, st.session_state["version"])
+    if changes is None: # The events were compacted or the flat was replaced, load it again
+        load_session(username)
+        return
+    events, version = changes
+    history_loaded = not is_unloaded(st.session_state.get("purchases"))
+    history_version = st.session_state.get("history_version", 0)
+    for number, event in enumerate(events, start=st.session_state["version"] + 1): # Version of every event
+        if event.get("session") == session_id(): # Own changes are already in the session state
+            continue
+        # Unloaded history reads these events itself, loaded history already contains the events up to its version
+        apply_event(st.session_state, event, history=history_loaded and number > history_version, version=number)
+        if event["op"] == "set" and event["key"] in SETTINGS_KEYS:
+            st.session_state["data"][event["key"]] = json.loads(json.dumps(event["value"])) # Not a change of this session
+    st.session_state["version"] = version
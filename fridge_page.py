@@ -1,6 +1,9 @@
 import streamlit as st # Streamlit for building the user interface
 import pandas as pd # Library to handle data
-from datetime import datetime # To handle timestamps for purchases and consumption
+from datetime import date # The "use soon" list starts today
+import inventory_service # Adds and removes products, records the changes in the flat's journal
+import expiry # Lots with expiry dates and the "use soon" queue
+from history_view import history_view # Filtered and paginated tables of purchases and consumed
 
 # Initialization of the session status for saving values between interactions, just for testing
 if "roommates" not in st.session_state:
@@ -27,63 +30,45 @@ def ensure_roommate_entries():
         if mate not in st.session_state["consumed"]: # Add missing consumption log
             st.session_state["consumed"][mate] = []
 
-# Function to remove product from inventory
+# Function to remove product from inventory, the lots that expire first are used up first
 def delete_product_from_inventory(food_item, quantity, unit, selected_roommate):
     ensure_roommate_entries() # Ensure all roommate-related data is initialized
-    delete_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S") # Records the current time
-    
-    if food_item and quantity > 0 and selected_roommate:
-        # Check if the item already exists in inventory
-        if food_item in st.session_state["inventory"]: 
-            current_quantity = st.session_state["inventory"][food_item]["Quantity"]
-            current_price = st.session_state["inventory"][food_item]["Price"]
-            # Update the quantity and total price of the existing item
-            if quantity <= current_quantity:
-                # Calculate the price
-                price_per_unit = current_price / current_quantity if current_quantity > 0 else 0
-                amount_to_deduct = price_per_unit * quantity
-                # Update inventory
-                st.session_state["inventory"][food_item]["Quantity"] -= quantity
-                st.session_state["inventory"][food_item]["Price"] -= amount_to_deduct
-                st.session_state["expenses"][selected_roommate] -= amount_to_deduct
-                st.success(f"'{quantity}' of '{food_item}' has been removed.")
-                # Report the ingredients in consumed
-                st.session_state["consumed"][selected_roommate].append({
-                    "Product": food_item,
-                    "Quantity": quantity,
-                    "Price": amount_to_deduct,
-                    "Unit": unit,
-                    "Date": delete_time
-                })
-                # Remove item if quantity reaches zero
-                if st.session_state["inventory"][food_item]["Quantity"] <= 0:
-                    del st.session_state["inventory"][food_item]
-            else:
-                st.warning("The quantity to remove exceeds the available quantity.") # Warning message
-        else:
-            st.warning("This item is not in the inventory.") # Warning message
+    result = inventory_service.apply_operations(st.session_state, [inventory_service.remove(food_item, quantity, unit, selected_roommate)],
+                                                st.session_state.get("username")) # Inventory, expenses, consumed and the journal
+    if result["ok"]:
+        st.success(f"'{quantity}' of '{food_item}' has been removed.")
     else:
-        st.warning("Please fill in all fields.") # Warning message
+        st.warning(result["errors"][0][1]) # Warning message
 
 # Function to add product to inventory
-def add_product_to_inventory(food_item, quantity, unit, price, selected_roommate):
+def add_product_to_inventory(food_item, quantity, unit, price, selected_roommate, expires=None):
     ensure_roommate_entries()
-    purchase_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    if food_item in st.session_state["inventory"]:  # checks if the food is already in the inventory
-        st.session_state["inventory"][food_item]["Quantity"] += quantity
-        st.session_state["inventory"][food_item]["Price"] += price
+    result = inventory_service.apply_operations(st.session_state, [inventory_service.add(food_item, quantity, unit, price, selected_roommate, expires)],
+                                                st.session_state.get("username")) # Inventory, expenses, purchases and the journal
+    if result["ok"]:
+        st.success(f"'{food_item}' has been added to the inventory, and {selected_roommate}'s expenses were updated.")
     else:
-        st.session_state["inventory"][food_item] = {"Quantity": quantity, "Unit": unit, "Price": price}
-    
-    st.session_state["expenses"][selected_roommate] += price
-    st.session_state["purchases"][selected_roommate].append({
-        "Product": food_item,
-        "Quantity": quantity,
-        "Price": price,
-        "Unit": unit,
-        "Date": purchase_time
-    })
-    st.success(f"'{food_item}' has been added to the inventory, and {selected_roommate}'s expenses were updated.")
+        st.warning(result["errors"][0][1])
+
+# Function to show the lots that expire soon and what was wasted, the lots are taken from the expiry queue
+def show_use_soon():
+    st.subheader("Use soon")
+    queue = expiry.expiry_queue(st.session_state) # Built once per inventory, kept up to date by every added lot
+    days = st.slider("Expiring within the next days:", min_value=1, max_value=14, value=expiry.SOON_DAYS)
+    today = date.today().strftime(expiry.DATE_FORMAT)
+    soon = queue.expiring(days)
+    if soon:
+        st.table(pd.DataFrame([{"Food Item": product, "Quantity": lot["Quantity"], "Price": lot["Price"], "Best before": expires,
+                                "Status": "Expired" if expires < today else "Today" if expires == today else "Soon"}
+                               for expires, product, lot in soon]))
+    else:
+        st.write(f"Nothing expires within the next {days} days.")
+
+    expired = expiry.expired_summary(queue)
+    waste = st.session_state.get("waste") or {}
+    col1, col2 = st.columns(2)
+    col1.metric("Expired in the fridge", f"{expired['value']:.2f} CHF", f"{expired['lots']} lots", delta_color="off")
+    col2.metric("Used up after expiry", f"{waste.get('value', 0.0):.2f} CHF", f"{waste.get('lots', 0)} lots", delta_color="off")
 
 # Main page function
 def fridge_page():
@@ -118,10 +103,11 @@ def fridge_page():
         quantity = st.number_input("Quantity:", min_value=0.0)
         unit = st.selectbox("Unit:", ["Pieces", "Liters", "Grams"])
         price = st.number_input("Price (in CHF):", min_value=0.0)
+        expires = st.date_input("Best before (optional):", value=None) # Every purchase is its own lot with its own date
         
         if st.button("Add item"): # Button to confirm adding the item
             if food_item and quantity > 0 and price >= 0 and selected_roommate:
-                add_product_to_inventory(food_item, quantity, unit, price, selected_roommate)
+                add_product_to_inventory(food_item, quantity, unit, price, selected_roommate, expires)
             else:
                 st.warning("Please fill in all fields.")
     
@@ -141,25 +127,25 @@ def fridge_page():
         st.write("Current Inventory:")
         inventory_df = pd.DataFrame.from_dict(st.session_state["inventory"], orient='index') # Creates a DataFrame and sets food items as row labels
         inventory_df = inventory_df.reset_index().rename(columns={'index': 'Food Item'}) # Move food item to the second column and rename the column title
-        st.table(inventory_df)
+        inventory_df["Next expiry"] = [min((lot["Expires"] for lot in item.get("Lots", []) if lot["Expires"]), default="")
+                                       for item in st.session_state["inventory"].values()]
+        st.table(inventory_df.drop(columns="Lots", errors="ignore")) # One row per product, the lots are shown below
     else:
         st.write("The inventory is empty.")
 
+    show_use_soon()
+
     # Display total expenses per roommate
     st.write("Total expenses per roommate:")
     expenses_df = pd.DataFrame(list(st.session_state["expenses"].items()), columns=["Roommate", "Total Expenses (CHF)"]) #Generates a list of tuples and assigns column titles
     st.table(expenses_df)
 
-    # Display purchases and consumed items per roommate
-    st.write("Purchases and Consumptions per roommate:")
-    for mate in st.session_state["roommates"]:
-        st.write(f"{mate}'s Purchases:")
-        purchases_df = pd.DataFrame(st.session_state["purchases"][mate])
-        st.table(purchases_df)
-        
-        st.write(f"{mate}'s Consumptions:")
-        consumed_df = pd.DataFrame(st.session_state["consumed"][mate])
-        st.table(consumed_df)
+    # Display purchases and consumed items, one page at a time
+    st.write("Purchases:")
+    history_view(st.session_state["purchases"], "fridge_purchases", st.session_state["roommates"])
+    st.write("Consumptions:")
+    history_view(st.session_state["consumed"], "fridge_consumed", st.session_state["roommates"])
 
-# Call the function to display the fridge page
-fridge_page()
+# Call the function to display the fridge page (only when this file is run on its own, main.py calls it itself)
+if __name__ == "__main__":
+    fridge_page()
@@ -0,0 +1,47 @@
+import math # To count the pages
+from datetime import datetime, time, timedelta # The date filter is turned into a range of datetimes
+import streamlit as st # Widgets of the history view
+from ledger import FIELDS, ledger_of # Filtering, sorting and paging run on the columns of the ledger
+
+# Paginated view of a history (purchases or consumed). The filters (roommates, product, date range) and the sorting
+# are applied to the ledger on the server, using its roommate and date indexes, and only the rows of the visible page
+# are turned into a table and sent to the browser, no matter how long the history is.
+PAGE_SIZES = [10, 25, 50, 100]
+
+
+# Function to show a history with filters, sorting and pages. key makes the widgets of several views unique.
+def history_view(entries_by_mate, key, roommates=None):
+    ledger = ledger_of(entries_by_mate)
+    roommates = list(roommates if roommates is not None else entries_by_mate)
+    if not len(ledger):
+        st.write("No entries recorded.")
+        return
+
+    filters = st.columns(3)
+    mates = filters[0].multiselect("Roommates", roommates, key=f"{key}_mates") or None
+    product = filters[1].text_input("Product", key=f"{key}_product")
+    dates = filters[2].date_input("Dates", value=(), key=f"{key}_dates") # Empty, one day or a range
+    start = datetime.combine(dates[0], time()) if dates else None
+    end = datetime.combine(dates[-1], time()) + timedelta(days=1) if dates else None # The last day is included
+
+    options = st.columns(3)
+    sort = options[0].selectbox("Sort by", ["Date"] + [field for field in FIELDS if field != "Date"] + ["Roommate"], key=f"{key}_sort")
+    descending = options[1].toggle("Newest / largest first", value=True, key=f"{key}_descending")
+    page_size = options[2].selectbox("Rows per page", PAGE_SIZES, index=1, key=f"{key}_page_size")
+
+    page_key = f"{key}_page"
+    page = st.session_state.get(page_key, 1)
+    query = lambda page: ledger.query(mates, [product] if product else None, start, end, sort, descending,
+                                      offset=(page - 1) * page_size, limit=page_size)
+    page_df, total = query(page)
+    pages = max(1, math.ceil(total / page_size))
+    if page > pages: # The filters left fewer pages than the page that was selected
+        page = st.session_state[page_key] = pages
+        page_df, total = query(page)
+    if total:
+        page_df = page_df.astype({"Roommate": str, "Product": str, "Unit": str}) # Without the names of all other products
+        st.dataframe(page_df[["Date", "Roommate"] + [field for field in FIELDS if field != "Date"]], hide_index=True)
+        st.caption(f"Entries {(page - 1) * page_size + 1}-{(page - 1) * page_size + len(page_df)} of {total}")
+    else:
+        st.write("No entries match the filters.")
+    st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=page_key)
@@ -0,0 +1,92 @@
+import uuid # Every added lot gets its own id
+from datetime import datetime # Time of the purchases and consumptions, expiry days
+import expiry # Lots and first in, first out removal
+from event_journal import apply_event # The same change as the journal replays
+from flat_sync import record_events # A batch is written to the journal with one write
+
+# Changes of the inventory in one place, without any Streamlit widgets. A batch is a list of operations:
+#   {"op": "add", "product": ..., "quantity": ..., "unit": ..., "price": ..., "roommate": ..., "expires": ...}
+#   {"op": "remove", "product": ..., "quantity": ..., "unit": ..., "roommate": ...}
+# apply_operations() first checks the whole batch against the inventory (operations see the changes of the operations
+# before them), then applies all of it to the inventory, expenses, purchases and consumed, and records all events with
+# one write. If one operation is invalid nothing is changed. Every add creates a lot with its expiry day ("YYYY-MM-DD",
+# a date or None), a removal uses up the lots that expire first and its price is the value of the used up part of them.
+# The event of a removal names the lots it used up, so the other sessions use up the same lots.
+
+
+# Function to create an operation that adds a product
+def add(product, quantity, unit, price, roommate, expires=None):
+    return {"op": "add", "product": product, "quantity": quantity, "unit": unit, "price": price, "roommate": roommate, "expires": expires}
+
+# Function to create an operation that removes (uses up) a product
+def remove(product, quantity, unit, roommate):
+    return {"op": "remove", "product": product, "quantity": quantity, "unit": unit, "roommate": roommate}
+
+# Function to check one operation against the inventory as it would be at that point of the batch.
+# Returns (event, error message), stock is changed like the event would change the inventory.
+def check_operation(operation, stock, roommates, date):
+    product, roommate = operation.get("product"), operation.get("roommate")
+    try:
+        quantity = float(operation.get("quantity") or 0)
+        price = float(operation.get("price") or 0)
+    except (TypeError, ValueError):
+        return None, "Quantity and price must be numbers."
+    if not product or quantity <= 0 or price < 0 or not roommate:
+        return None, "Please fill in all fields."
+    if roommates is not None and roommate not in roommates:
+        return None, f"{roommate} is not a roommate of this flat."
+    event = {"product": product, "quantity": quantity, "unit": operation.get("unit"), "roommate": roommate, "date": date}
+    if operation["op"] == "add":
+        expires = operation.get("expires")
+        if not expires or expires != expires: # No expiry date (or an empty cell of a table)
+            expires = None
+        elif hasattr(expires, "strftime"): # A date from a date input
+            expires = expires.strftime(expiry.DATE_FORMAT)
+        else:
+            try:
+                expires = datetime.strptime(str(expires)[:10], expiry.DATE_FORMAT).strftime(expiry.DATE_FORMAT)
+            except ValueError:
+                return None, "The expiry date must be a date (YYYY-MM-DD)."
+        event = dict(event, op="add_product", price=price, expires=expires, lot=uuid.uuid4().hex[:12])
+        expiry.change_inventory(stock, event)
+        return event, None
+    if operation["op"] == "remove":
+        item = stock.get(product)
+        if item is None or item["Quantity"] <= 0:
+            return None, "This item is not in the inventory."
+        if quantity > item["Quantity"]:
+            return None, "The quantity to remove exceeds the available quantity."
+        lots, price = expiry.plan_removal(item, quantity) # The lots that expire first and the price of the used up part
+        event = dict(event, op="delete_product", price=price, lots=lots)
+        expiry.change_inventory(stock, event)
+        return event, None
+    return None, f"Unknown operation: {operation['op']}"
+
+# Function to apply a batch of operations to the flat data (e.g. st.session_state) and journal it with one write.
+# Returns {"ok", "events", "errors": [(index of the operation, message)], "added", "removed", "price"}.
+def apply_operations(data, operations, username=None):
+    date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    products = {operation.get("product") for operation in operations}
+    stock = {product: dict(item, Lots=[dict(lot) for lot in expiry.lots_of(dict(item))]) # Copies of the products of the batch
+             for product, item in data.get("inventory", {}).items() if product in products}
+    roommates = data.get("roommates") or None
+    events, errors = [], []
+    for index, operation in enumerate(operations):
+        event, error = check_operation(operation, stock, roommates, date)
+        if error:
+            errors.append((index, error))
+        else:
+            events.append(event)
+    if errors or not events: # All or nothing
+        return {"ok": not errors, "events": [], "errors": errors, "added": 0, "removed": 0, "price": 0.0}
+    for event in events:
+        apply_event(data, event)
+    record_events(username, events)
+    return {
+        "ok": True,
+        "events": events,
+        "errors": [],
+        "added": sum(event["op"] == "add_product" for event in events),
+        "removed": sum(event["op"] == "delete_product" for event in events),
+        "price": sum(event["price"] for event in events if event["op"] == "add_product"),
+    }
@@ -0,0 +1,99 @@
+import threading # Two reruns of the same session must not load the history twice
+from collections.abc import MutableMapping, MutableSequence # Base classes which provide the dict and list methods
+
+
+# The history of a flat (purchases, consumed, cooking_history, recipe_links) is not loaded at login.
+# The session state gets proxies instead, which load the whole history section on their first access.
+class LazyHistory:
+    def __init__(self, loader):
+        self.loader = loader # Function which returns the history section as a dictionary
+        self.data = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.data is None:
+            with self.lock:
+                if self.data is None:
+                    self.data = self.loader()
+        return self.data
+
+    @property
+    def loaded(self):
+        return self.data is not None
+
+
+# Proxy for a history entry which is a dictionary (purchases, consumed, recipe_links)
+class LazyDict(MutableMapping):
+    def __init__(self, history, key):
+        self.history = history
+        self.key = key
+
+    def target(self):
+        return self.history.get().setdefault(self.key, {})
+
+    def __getitem__(self, name):
+        return self.target()[name]
+
+    def __setitem__(self, name, value):
+        self.target()[name] = value
+
+    def __delitem__(self, name):
+        del self.target()[name]
+
+    def __iter__(self):
+        return iter(self.target())
+
+    def __len__(self):
+        return len(self.target())
+
+    def __repr__(self):
+        return repr(self.target())
+
+
+# Proxy for a history entry which is a list (cooking_history)
+class LazyList(MutableSequence):
+    def __init__(self, history, key):
+        self.history = history
+        self.key = key
+
+    def target(self):
+        return self.history.get().setdefault(self.key, [])
+
+    def __getitem__(self, index):
+        return self.target()[index]
+
+    def __setitem__(self, index, value):
+        self.target()[index] = value
+
+    def __delitem__(self, index):
+        del self.target()[index]
+
+    def __len__(self):
+        return len(self.target())
+
+    def insert(self, index, value):
+        self.target().insert(index, value)
+
+    def __repr__(self):
+        return repr(self.target())
+
+
+# Function to create the proxies for all history entries, they share one loader so the file is read only once
+def lazy_history(loader):
+    history = LazyHistory(loader)
+    return {
+        "purchases": LazyDict(history, "purchases"),
+        "consumed": LazyDict(history, "consumed"),
+        "cooking_history": LazyList(history, "cooking_history"),
+        "recipe_links": LazyDict(history, "recipe_links"),
+    }
+
+# Function to check if a value is a proxy whose history was not loaded yet
+def is_unloaded(value):
+    return isinstance(value, (LazyDict, LazyList)) and not value.history.loaded
+
+# Function to turn proxies into plain dictionaries and lists (e.g. before writing them as JSON)
+def materialize(value):
+    if isinstance(value, (LazyDict, LazyList)):
+        return value.target()
+    return value
@@ -0,0 +1,422 @@
+import calendar # Dates are stored as seconds since 1970
+import itertools # Numbers which tell ledgers apart
+import sys # To read the command line arguments
+from collections.abc import MutableMapping, MutableSequence # Base classes which provide the dict and list methods
+from datetime import datetime, timedelta # To convert between date strings and seconds
+import numpy as np # Columns are NumPy arrays
+import pandas as pd # Pages read the ledger as DataFrames
+from lazy_history import materialize # The history in the session state can still be a proxy
+from rollups import Rollups # Sums for the Overview charts, kept up to date with every change
+
+# Compact store for purchases and consumed. Instead of one dictionary with five strings per entry, every entry is a
+# row in typed columns: the date as seconds (int64), product, roommate and unit as numbers of interned names, quantity
+# and price as float64. That is about 40 bytes per entry instead of several hundred, and the dates are parsed once
+# when an entry is added instead of on every render.
+# LedgerBook keeps the shape of the session state ({roommate: [entry, ...]}), so st.session_state["purchases"][mate]
+# can still be appended to, iterated and turned into a DataFrame. Pages which aggregate use frame(), whose date and
+# number columns are views of the arrays (no copy, no parsing).
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+NO_DATE = np.iinfo(np.int64).min # Missing or unreadable date, the same value as NaT in pandas
+FIELDS = ["Product", "Quantity", "Price", "Unit", "Date"] # Keys of an entry in the order the app writes them
+EPOCH = datetime(1970, 1, 1)
+_serials = itertools.count() # Every ledger gets its own number, so (serial, version) identifies its content
+
+
+# Function to turn a date string into seconds, NO_DATE if it can't be read
+def to_seconds(date):
+    try:
+        if len(date) == 19 and date[4] == "-" and date[7] == "-" and date[10] == " " and date[13] == ":" and date[16] == ":":
+            parsed = datetime(int(date[:4]), int(date[5:7]), int(date[8:10]), int(date[11:13]), int(date[14:16]), int(date[17:]))
+        else: # Slicing is much faster than strptime, which is only used for dates which don't look as expected
+            parsed = datetime.strptime(date, DATE_FORMAT)
+        return calendar.timegm(parsed.timetuple())
+    except (TypeError, ValueError):
+        return NO_DATE
+
+# Function to turn seconds back into the date string
+def to_date(seconds):
+    return (EPOCH + timedelta(seconds=int(seconds))).strftime(DATE_FORMAT)
+
+
+# Array which grows by doubling, so appending is O(1) on average
+class Column:
+    def __init__(self, dtype, capacity=16):
+        self.data = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def append(self, value):
+        if self.size == len(self.data):
+            grown = np.empty(max(16, 2 * len(self.data)), dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size] = value
+        self.size += 1
+
+    def values(self):
+        return self.data[:self.size] # View, no copy
+
+    def replace(self, values):
+        self.data = np.array(values, dtype=self.data.dtype)
+        self.size = len(self.data)
+
+
+# Numbers for repeated names (products, roommates, units), every name is stored once
+class Names:
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+
+    def id(self, name):
+        number = self.ids.get(name)
+        if number is None:
+            number = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return number
+
+
+# All entries of one history (purchases or consumed) of a flat, in the order they were added
+class Ledger:
+    def __init__(self):
+        self.seconds = Column(np.int64)
+        self.product = Column(np.int32)
+        self.roommate = Column(np.int32)
+        self.unit = Column(np.int32)
+        self.quantity = Column(np.float64)
+        self.price = Column(np.float64)
+        self.products, self.roommates, self.units = Names(), Names(), Names()
+        self.rows_of = {} # Roommate number -> Column with the rows of the roommate
+        self.originals = {} # Row -> entry, for the rare entries which the columns can't give back exactly
+        self.serial = next(_serials)
+        self.version = 0 # Changes with every change, e.g. to know when a result computed from the ledger is outdated
+        self.rollups = Rollups()
+        self._date_order = None # (version, rows sorted by date)
+
+    def __len__(self):
+        return self.seconds.size
+
+    # Function to get a key which changes whenever the content of the ledger changes (e.g. for caches)
+    def data_version(self):
+        return (self.serial, self.version)
+
+    # Function to add an entry of a roommate, returns its row
+    def append(self, mate, entry):
+        row = len(self)
+        mate_id = self.roommates.id(mate)
+        self.write(row, mate_id, entry, appending=True)
+        self.rows_of.setdefault(mate_id, Column(np.int32)).append(row)
+        self.version += 1
+        return row
+
+    # Function to write the columns of a row (appending=True adds a new row)
+    def write(self, row, mate_id, entry, appending=False):
+        if not appending:
+            self.rollup(row, -1) # The old values of the row are taken out of the sums
+        seconds = to_seconds(entry.get("Date"))
+        values = [
+            (self.seconds, seconds),
+            (self.product, self.products.id(str(entry.get("Product")))),
+            (self.roommate, mate_id),
+            (self.unit, self.units.id(str(entry.get("Unit")))),
+            (self.quantity, to_float(entry.get("Quantity"))),
+            (self.price, to_float(entry.get("Price"))),
+        ]
+        for column, value in values:
+            if appending:
+                column.append(value)
+            else:
+                column.data[row] = value
+        self.rollup(row, 1)
+        exact = (list(entry) == FIELDS and seconds != NO_DATE and to_date(seconds) == entry["Date"]
+                 and all(type(entry[key]) is str for key in ["Product", "Unit"])
+                 and all(type(entry[key]) in (int, float) for key in ["Quantity", "Price"])) # Whole numbers come back as floats
+        if exact:
+            self.originals.pop(row, None)
+        else: # Kept as it was, e.g. a date in another format or an additional key
+            self.originals[row] = dict(entry)
+
+    # Function to get a row as the dictionary the app uses
+    def entry(self, row):
+        if row in self.originals:
+            return dict(self.originals[row])
+        return {
+            "Product": self.products.names[self.product.data[row]],
+            "Quantity": float(self.quantity.data[row]),
+            "Price": float(self.price.data[row]),
+            "Unit": self.units.names[self.unit.data[row]],
+            "Date": to_date(self.seconds.data[row]),
+        }
+
+    # Function to get the rows of a roommate
+    def rows(self, mate):
+        mate_id = self.roommates.ids.get(mate)
+        column = self.rows_of.get(mate_id)
+        return column.values() if column is not None else np.empty(0, dtype=np.int32)
+
+    # Function to delete rows and to insert an entry before a row, both move the following rows (O(n), rarely used)
+    def delete(self, rows):
+        for row in np.unique(np.asarray(rows, dtype=np.int64)):
+            self.rollup(int(row), -1)
+        keep = np.ones(len(self), dtype=bool)
+        keep[rows] = False
+        self.reorder(np.flatnonzero(keep))
+
+    def insert(self, row, mate, entry):
+        last = self.append(mate, entry)
+        self.reorder(np.concatenate([np.arange(row), [last], np.arange(row, last)]))
+
+    # Function to keep only the given rows, in the given order
+    def reorder(self, order):
+        position = np.full(len(self), -1)
+        position[order] = np.arange(len(order))
+        for column in [self.seconds, self.product, self.roommate, self.unit, self.quantity, self.price]:
+            column.replace(column.values()[order])
+        self.originals = {int(position[row]): entry for row, entry in self.originals.items() if position[row] >= 0}
+        mates = self.roommate.values()
+        for mate_id, column in self.rows_of.items():
+            column.replace(np.flatnonzero(mates == mate_id))
+        self.version += 1
+
+    # Function to get the entries as a DataFrame with Date (datetime64), Roommate, Product, Quantity, Price and Unit.
+    # Date, Quantity and Price are views of the arrays: copy the frame if it must not change with the ledger.
+    # mate or rows select some of the rows (a copy), e.g. the rows of one page.
+    def frame(self, mate=None, rows=None):
+        if mate is not None: # Only the rows of one roommate
+            rows = self.rows(mate)
+        if rows is not None:
+            take = lambda column: column.values()[rows]
+        else:
+            take = lambda column: column.values()
+        return pd.DataFrame({
+            "Date": take(self.seconds).view("datetime64[s]"),
+            "Roommate": pd.Categorical.from_codes(take(self.roommate), categories=pd.Index(self.roommates.names, dtype=object)),
+            "Product": pd.Categorical.from_codes(take(self.product), categories=pd.Index(self.products.names, dtype=object)),
+            "Quantity": take(self.quantity),
+            "Price": take(self.price),
+            "Unit": pd.Categorical.from_codes(take(self.unit), categories=pd.Index(self.units.names, dtype=object)),
+        }, copy=False)
+
+    # Function to get the rows sorted by date, computed again only after a change (index for date ranges)
+    def date_order(self):
+        if self._date_order is None or self._date_order[0] != self.version:
+            self._date_order = (self.version, np.argsort(self.seconds.values(), kind="stable"))
+        return self._date_order[1]
+
+    # Function to filter and sort the entries and to get one page of them, returns (DataFrame of the page, matching rows).
+    # mates and products are lists of names (products match if they contain one of the texts, without case),
+    # start and end are datetimes (end excluded), sort is a column of frame().
+    def query(self, mates=None, products=None, start=None, end=None, sort="Date", descending=True, offset=0, limit=25):
+        if start is not None or end is not None: # Date range from the date index
+            order = self.date_order()
+            seconds = self.seconds.values()[order]
+            low = 0 if start is None else np.searchsorted(seconds, calendar.timegm(start.timetuple()), side="left")
+            high = len(order) if end is None else np.searchsorted(seconds, calendar.timegm(end.timetuple()), side="left")
+            rows = order[low:high]
+            rows = rows[seconds[low:high] != NO_DATE]
+        elif mates is not None and len(mates) == 1: # Rows of one roommate from the roommate index
+            rows = self.rows(mates[0]).astype(np.int64)
+        else:
+            rows = np.arange(len(self))
+        if mates is not None:
+            mate_ids = [self.roommates.ids[mate] for mate in mates if mate in self.roommates.ids]
+            rows = rows[np.isin(self.roommate.values()[rows], mate_ids)]
+        if products:
+            texts = [text.strip().lower() for text in products if text.strip()]
+            product_ids = [number for number, name in enumerate(self.products.names) if any(text in name.lower() for text in texts)]
+            rows = rows[np.isin(self.product.values()[rows], product_ids)]
+        keys = {
+            "Date": lambda: self.seconds.values()[rows],
+            "Quantity": lambda: self.quantity.values()[rows],
+            "Price": lambda: self.price.values()[rows],
+            "Roommate": lambda: name_ranks(self.roommates)[self.roommate.values()[rows]],
+            "Product": lambda: name_ranks(self.products)[self.product.values()[rows]],
+            "Unit": lambda: name_ranks(self.units)[self.unit.values()[rows]],
+        }
+        rows = rows[np.argsort(keys[sort](), kind="stable")]
+        if descending:
+            rows = rows[::-1]
+        return self.frame(rows=rows[offset:offset + limit]), len(rows)
+
+    # Function to add a row to the rollups (sign=1) or to take it out of them (sign=-1)
+    def rollup(self, row, sign):
+        if self.rollups is None: # Being loaded, the rollups are computed once at the end
+            return
+        self.rollups.add(int(self.roommate.data[row]), int(self.product.data[row]), int(self.seconds.data[row]),
+                         float(self.price.data[row]), NO_DATE, sign)
+
+    # Function to compute the rollups again from the columns, returns the keys where the kept rollups differ.
+    # With replace=True the rebuilt rollups are used from now on.
+    def verify_rollups(self, replace=False):
+        rebuilt = Rollups.rebuild(self, NO_DATE)
+        differences = self.rollups.differences(rebuilt)
+        if replace:
+            self.rollups = rebuilt
+        return differences
+
+    # Function to get the sum of the prices per roommate
+    def totals(self):
+        return {name: self.rollups.totals.get(number, [0.0])[0] for number, name in enumerate(self.roommates.names)}
+
+    # Function to get the sum of the prices per roommate and day of a month as a long DataFrame (Date, Roommate, Total)
+    def month_totals(self, year, month):
+        days = self.rollups.month_days(year, month)
+        return pd.DataFrame([(date, self.roommates.names[mate], total) for (mate, date), total in days.items()],
+                            columns=["Date", "Roommate", "Total"])
+
+    # Function to get the sum of the prices per roommate and product as a DataFrame (Roommate, Product, Price)
+    def product_totals(self):
+        return pd.DataFrame([(self.roommates.names[mate], self.products.names[product], value[0])
+                             for (mate, product), value in self.rollups.products.items()],
+                            columns=["Roommate", "Product", "Price"])
+
+    # Function to get the memory of the columns in bytes (without the interned names)
+    def nbytes(self):
+        return sum(column.data.nbytes for column in [self.seconds, self.product, self.roommate, self.unit, self.quantity, self.price])
+
+
+# Function to get the rank of every name in alphabetical order, to sort by names
+def name_ranks(names):
+    ranks = np.empty(len(names.names), dtype=np.int64)
+    ranks[sorted(range(len(names.names)), key=lambda number: str(names.names[number]).lower())] = np.arange(len(names.names))
+    return ranks
+
+# Function to read a number, entries written by old versions of the app can contain None or strings
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+# The entries of one roommate, behaves like the list it replaces
+class LedgerEntries(MutableSequence):
+    def __init__(self, ledger, mate):
+        self.ledger = ledger
+        self.mate = mate
+
+    def row(self, index):
+        rows = self.ledger.rows(self.mate)
+        return int(rows[index]) # Raises IndexError like a list
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.ledger.entry(int(row)) for row in self.ledger.rows(self.mate)[index]]
+        return self.ledger.entry(self.row(index))
+
+    def __setitem__(self, index, entry):
+        self.ledger.write(self.row(index), self.ledger.roommates.id(self.mate), entry)
+        self.ledger.version += 1
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            self.ledger.delete(self.ledger.rows(self.mate)[index])
+        else:
+            self.ledger.delete([self.row(index)])
+
+    def __len__(self):
+        return len(self.ledger.rows(self.mate))
+
+    def __iter__(self):
+        for row in self.ledger.rows(self.mate).copy():
+            yield self.ledger.entry(int(row))
+
+    def insert(self, index, entry):
+        rows = self.ledger.rows(self.mate)
+        if index >= len(rows):
+            self.ledger.append(self.mate, entry)
+        else:
+            self.ledger.insert(int(rows[max(index, -len(rows))]), self.mate, entry)
+
+    def append(self, entry):
+        self.ledger.append(self.mate, entry)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+# {roommate: entries} of one history, behaves like the dictionary it replaces
+class LedgerBook(MutableMapping):
+    def __init__(self, ledger=None):
+        self.ledger = ledger or Ledger()
+        self.mates = {} # Roommates in the order they were added (dictionaries keep roommates without entries)
+
+    # Function to build a book from {roommate: [entry, ...]}
+    @classmethod
+    def from_entries(cls, entries_by_mate):
+        book = cls()
+        book.ledger.rollups = None
+        for mate, entries in (entries_by_mate or {}).items():
+            book[mate] = entries
+        book.ledger.rollups = Rollups.rebuild(book.ledger, NO_DATE)
+        return book
+
+    def __getitem__(self, mate):
+        if mate not in self.mates:
+            raise KeyError(mate)
+        return LedgerEntries(self.ledger, mate)
+
+    def __setitem__(self, mate, entries):
+        if mate in self.mates:
+            del self[mate]
+        self.mates[mate] = True
+        self.ledger.roommates.id(mate)
+        for entry in list(entries):
+            self.ledger.append(mate, entry)
+
+    def __delitem__(self, mate):
+        del self.mates[mate]
+        self.ledger.delete(self.ledger.rows(mate))
+
+    def __iter__(self):
+        return iter(list(self.mates))
+
+    def __len__(self):
+        return len(self.mates)
+
+    def setdefault(self, mate, default=None):
+        if mate not in self.mates:
+            self[mate] = default or []
+        return self[mate]
+
+    def __repr__(self):
+        return repr({mate: list(self[mate]) for mate in self.mates})
+
+
+# Function to get the ledger of a history in the session state. Books give their ledger, plain dictionaries
+# (e.g. a page run on its own) are turned into a ledger for this call.
+def ledger_of(entries_by_mate):
+    entries_by_mate = materialize(entries_by_mate)
+    if isinstance(entries_by_mate, LedgerBook):
+        return entries_by_mate.ledger
+    return LedgerBook.from_entries(entries_by_mate).ledger
+
+# Function to store purchases and consumed of a loaded history in ledgers
+def compact_history(history):
+    for key in ["purchases", "consumed"]:
+        if key in history and not isinstance(history[key], LedgerBook):
+            history[key] = LedgerBook.from_entries(history[key])
+    return history
+
+
+# Checks that the rollups kept up to date entry by entry match a full rebuild, for the stored history of a flat.
+# Usage: python ledger.py verify <username>
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "verify":
+        sys.exit("Usage: python ledger.py verify <username>")
+    from storage_backend import get_backend
+    history = get_backend().load_history(sys.argv[2])
+    failed = False
+    for key in ["purchases", "consumed"]:
+        ledger = Ledger() # Built entry by entry, like the app does with new entries
+        for mate, entries in history.get(key, {}).items():
+            for entry in entries:
+                ledger.append(mate, entry)
+        differences = ledger.verify_rollups()
+        failed = failed or bool(differences)
+        print(f"{key}: {len(ledger)} entries, {len(differences) or 'no'} differences")
+        for difference in differences[:20]:
+            print(f"  {difference}")
+    sys.exit(1 if failed else 0)
+
@@ -1,12 +1,29 @@
 # Importing necessary libraries and custom modules
 import streamlit as st # Create interactive web applications
+import importlib # Import the subpages only when they are opened
+import os # To read the settings from environment variables
 # Importing subpages and functions
 from settings_page import setup_flat_name, setup_roommates, settingspage
-from fridge_page import fridge_page
-from barcode_page import barcode_page
-from recipe_page import recipepage
 from store_externally import authentication, auto_save, delete_account
-from Overview_page import overview_page
+import write_behind # Saves the data in a background thread
+from flat_sync import sync_session # Applies the changes other sessions of the flat made
+import model_holder # Recipe model shared by all sessions
+import metrics # Timing of the pages, external calls and saving
+
+# Registry of the subpages: page name -> (module, function). The modules pull in heavy libraries (TensorFlow for
+# recipes, Plotly for the overview, pyzbar and Pillow for the scan page), so they are imported the first time the
+# page is opened and not when the login screen is shown. startup_benchmark.py measures the difference.
+PAGES = {
+    "overview": ("Overview_page", "overview_page"),
+    "inventory": ("fridge_page", "fridge_page"),
+    "scan": ("barcode_page", "barcode_page"),
+    "recipes": ("recipe_page", "recipepage"),
+}
+
+# With WASTELESS_WARMUP=1 the recipe model is loaded and warmed up in the background when the server starts,
+# so the first recommendation doesn't wait for it (started only once per process)
+if os.environ.get("WASTELESS_WARMUP") == "1":
+    model_holder.start_warm_up()
 
 # Define the custom tokenizer function
 def custom_tokenizer(text):
@@ -61,6 +78,11 @@ if "data" not in st.session_state: # Store user-related data
 def change_page(new_page):
     st.session_state["page"] = new_page # Update the session state
 
+# Function to get the function of a subpage, the module is imported on first use (afterwards Python keeps it in sys.modules)
+def load_page(name):
+    module_name, function_name = PAGES[name]
+    return getattr(importlib.import_module(module_name), function_name)
+
 
 # CSS for circular image
 circular_image_css = """
@@ -86,6 +108,7 @@ st.sidebar.markdown(f'<img src="{logo_url}" class="circular-logo">', unsafe_allo
 
 # Display of the main page
 if st.session_state["logged_in"]: # Check if the user is logged in
+    sync_session() # Show the changes roommates made in their own sessions
 
     # Sidebar navigation without account selection
     st.sidebar.title("Navigation") # Title for the navigation menu
@@ -100,34 +123,29 @@ if st.session_state["logged_in"]: # Check if the user is logged in
     if st.sidebar.button("Settings"): # Navigate to the settings page
         change_page("settings")
     if st.sidebar.button("Log Out", type="primary"): # Log out the user
+        write_behind.flush(st.session_state["username"]) # Write the queued changes of the flat before leaving
         st.session_state["logged_in"] = False # Update login status
         st.session_state["username"] = None # Clear username
         st.session_state["data"] = {} # Clear user data
 
 
     # Page display logic for the selected page
-    if st.session_state["page"] == "overview": # If the overview page is selected:
-        overview_page() # Display the overview page
-        auto_save() # Automatically save data
-    elif st.session_state["page"] == "inventory": # If the inventory page is selected
-        fridge_page() # Display the inventory page
-        auto_save() # Automatically save data
-    elif st.session_state["page"] == "scan": # If the scan page is selected:
-        barcode_page() # Display the barcode scanning page
-        auto_save() # Automaticaly save data
-    elif st.session_state["page"] == "recipes": # If the recipes page is selected:
-        recipepage() # Display the recipe page
-        auto_save() # Automatically save data
-    elif st.session_state["page"] == "settings": # If the settings page is selected:
-        if not st.session_state["setup_finished"]: # If the setup is incomplete:
-            if st.session_state["flate_name"] == "": # If the flat's name is not set:
-                setup_flat_name() # Prompt to set the flat's name
-            else:
-                setup_roommates() # Prompt to set up roommates
-        else:
-            settingspage() # Display the settings page
-            delete_account() # Option to delete the account
-        auto_save() # Automatically save data
+    with metrics.rerun(st.session_state["page"]): # Timing of the page, logged if the rerun is slow
+        if st.session_state["page"] in PAGES: # Overview, inventory, scan or recipes page is selected:
+            with metrics.span(f"page.{st.session_state['page']}"):
+                load_page(st.session_state["page"])() # Display the page
+            auto_save() # Automatically save data
+        elif st.session_state["page"] == "settings": # If the settings page is selected:
+            with metrics.span("page.settings"):
+                if not st.session_state["setup_finished"]: # If the setup is incomplete:
+                    if st.session_state["flate_name"] == "": # If the flat's name is not set:
+                        setup_flat_name() # Prompt to set the flat's name
+                    else:
+                        setup_roommates() # Prompt to set up roommates
+                else:
+                    settingspage() # Display the settings page
+                    delete_account() # Option to delete the account
+            auto_save() # Automatically save data
 else:
     # Sidebar with account selection
     st.title("Wasteless") # Display the app's name
@@ -0,0 +1,151 @@
+import bisect # To find the bucket of a measurement
+import logging # To log slow reruns
+import os # To read the settings from environment variables
+import threading # Measurements come from the sessions' threads and from background threads
+import time # To measure
+from contextlib import contextmanager, nullcontext # Spans are context managers
+
+# Lightweight timing of the hot paths. Code marks an operation with `with metrics.span("name"):` or the @timed("name")
+# decorator. The durations are counted in a latency histogram per operation, which can be exported in the Prometheus
+# text format to a file (WASTELESS_METRICS_FILE, rewritten every few seconds) or served on a local port
+# (WASTELESS_METRICS_PORT, http://localhost:<port>/metrics). main.py wraps every rerun, reruns slower than
+# WASTELESS_SLOW_RERUN_MS are logged with the spans they contained.
+# Everything is off unless WASTELESS_METRICS=1: span() then returns a shared empty context and @timed returns the
+# function unchanged, so the disabled instrumentation costs one function call per span.
+ENABLED = os.environ.get("WASTELESS_METRICS") == "1"
+METRICS_FILE = os.environ.get("WASTELESS_METRICS_FILE")
+METRICS_PORT = int(os.environ.get("WASTELESS_METRICS_PORT", "0"))
+SLOW_RERUN_MS = float(os.environ.get("WASTELESS_SLOW_RERUN_MS", "0")) # 0 turns the slow rerun log off
+EXPORT_INTERVAL = 5.0 # Seconds between two writes of the metrics file
+BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0] # Upper bounds in seconds
+
+logger = logging.getLogger(__name__)
+_lock = threading.Lock()
+_histograms = {} # Operation -> {"buckets": counts per bucket (last one is +Inf), "sum": seconds, "count": n}
+_local = threading.local() # Spans of the rerun which is running in this thread
+_disabled_span = nullcontext()
+_exporter = None
+
+
+# Function to count one measurement
+def observe(name, seconds):
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = {"buckets": [0] * (len(BUCKETS) + 1), "sum": 0.0, "count": 0}
+        histogram["buckets"][bisect.bisect_left(BUCKETS, seconds)] += 1
+        histogram["sum"] += seconds
+        histogram["count"] += 1
+    spans = getattr(_local, "spans", None)
+    if spans is not None:
+        spans.append((name, seconds))
+
+@contextmanager
+def _span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+# Function to time a block of code
+def span(name):
+    return _span(name) if ENABLED else _disabled_span
+
+# Decorator to time every call of a function
+def timed(name):
+    def decorate(function):
+        if not ENABLED:
+            return function
+        def wrapper(*args, **kwargs):
+            with _span(name):
+                return function(*args, **kwargs)
+        wrapper.__name__, wrapper.__doc__, wrapper.__wrapped__ = function.__name__, function.__doc__, function
+        return wrapper
+    return decorate
+
+# Function to time a whole rerun of the app, slow reruns are logged with their spans
+@contextmanager
+def rerun(page):
+    if not ENABLED:
+        yield
+        return
+    start_exporter()
+    _local.spans = []
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        spans, _local.spans = _local.spans, None
+        observe("rerun", seconds)
+        if SLOW_RERUN_MS and seconds * 1000 >= SLOW_RERUN_MS:
+            logger.warning("Slow rerun of %s: %.0f ms (%s)", page, seconds * 1000,
+                           ", ".join(f"{name} {spent * 1000:.0f} ms" for name, spent in spans))
+
+# Function to export the histograms in the Prometheus text format
+def prometheus_text():
+    with _lock:
+        histograms = {name: {"buckets": list(h["buckets"]), "sum": h["sum"], "count": h["count"]} for name, h in _histograms.items()}
+    lines = ["# HELP wasteless_operation_seconds Duration of app operations",
+             "# TYPE wasteless_operation_seconds histogram"]
+    for name in sorted(histograms):
+        histogram = histograms[name]
+        cumulative = 0
+        for bound, count in zip([str(bound) for bound in BUCKETS] + ["+Inf"], histogram["buckets"]):
+            cumulative += count
+            lines.append(f'wasteless_operation_seconds_bucket{{operation="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'wasteless_operation_seconds_sum{{operation="{name}"}} {histogram["sum"]:.6f}')
+        lines.append(f'wasteless_operation_seconds_count{{operation="{name}"}} {histogram["count"]}')
+    return "\n".join(lines) + "\n"
+
+# Function to get count, sum and mean of every operation (e.g. for a benchmark or a debug page)
+def summary():
+    with _lock:
+        return {name: {"count": h["count"], "sum_seconds": h["sum"], "mean_ms": h["sum"] * 1000 / h["count"]}
+                for name, h in _histograms.items() if h["count"]}
+
+# Function to forget all measurements
+def reset():
+    with _lock:
+        _histograms.clear()
+
+# Function to start writing the metrics file and serving the metrics port, if they are configured (once per process)
+def start_exporter():
+    global _exporter
+    if _exporter is not None or not (METRICS_FILE or METRICS_PORT):
+        return
+    with _lock:
+        if _exporter is not None:
+            return
+        _exporter = []
+    if METRICS_FILE:
+        from file_utils import atomic_write_text # Scrapers never see a half written file
+        def write_file():
+            while True:
+                time.sleep(EXPORT_INTERVAL)
+                try:
+                    atomic_write_text(METRICS_FILE, prometheus_text())
+                except OSError:
+                    logger.exception("Writing the metrics file failed")
+        _exporter.append(threading.Thread(target=write_file, name="metrics-file", daemon=True))
+    if METRICS_PORT:
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = prometheus_text().encode()
+                self.send_response(200 if self.path in ("/", "/metrics") else 404)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args): # Scrapes are not logged
+                pass
+        try:
+            server = ThreadingHTTPServer(("127.0.0.1", METRICS_PORT), MetricsHandler)
+            _exporter.append(threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True))
+        except OSError:
+            logger.exception("The metrics port %s can't be used", METRICS_PORT)
+    for thread in _exporter:
+        thread.start()
@@ -0,0 +1,176 @@
+import hashlib # To compute the version of the model files
+import os # To build the paths of the model files
+import sys # To make the tokenizer available for unpickling the vectorizer
+import threading # The model is shared by all sessions, which run in different threads
+import time # To measure load and warm up time
+
+import model_registry # Versioned bundles of the model files
+import metrics # Timing of loading the model
+
+# The recipe model, the TF-IDF vectorizer and both label encoders are loaded once per process and shared by all
+# browser sessions, instead of being loaded into the session state of every session.
+# They are loaded from the bundle the model registry serves, or from MODEL_DIR if the registry is empty. A watcher
+# thread checks every WATCH_INTERVAL seconds if another version is served, loads it next to the current one and then
+# swaps the reference. Requests which already got the old components finish with them.
+MODEL_DIR = os.environ.get("WASTELESS_MODEL_DIR", os.path.dirname(os.path.abspath(__file__))) # The model files are stored next to the app
+WATCH_INTERVAL = float(os.environ.get("WASTELESS_MODEL_WATCH", "30")) # Seconds, 0 turns the watcher off
+ARTEFACTS = ["recipe_model.npz", "recipe_model.h5", "tfidf_ingredients.pkl", "label_encoder_cuisine.pkl", "label_encoder_recipe.pkl"]
+
+_lock = threading.Lock()
+_reload_lock = threading.Lock() # Only one new version is loaded at a time
+_components = None
+_warm_up_thread = None
+_watcher_thread = None
+_stats = {"loads": 0, "load_seconds": None, "rss_before_mb": None, "rss_after_mb": None,
+          "warmed_up": False, "warm_up_seconds": None, "reloads": 0, "reload_error": None}
+
+
+# The vectorizer was pickled with a tokenizer defined in the notebook's __main__ module
+def custom_tokenizer(text):
+    return text.split(', ')
+
+# Function to get the current memory use (resident set size) of the process in MB
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as file: # Linux: second value is the resident size in pages
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        import resource # Other systems: peak resident size, in KB on Linux and in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+# Function to load the model, the NumPy export (recipe_model.npz) is used if it exists, so TensorFlow is not needed
+def load_model_file(model_dir):
+    npz_path = os.path.join(model_dir, 'recipe_model.npz')
+    if os.path.exists(npz_path):
+        from numpy_model import NumpyModel
+        return NumpyModel(npz_path)
+    import tensorflow as tf # Only imported if there is no NumPy export
+    from tensorflow.keras.models import load_model
+    # Include the custom tokenizer in custom_objects
+    custom_objects = {
+        'mse': tf.keras.losses.MeanSquaredError(),
+        'mae': tf.keras.metrics.MeanAbsoluteError(),
+        'accuracy': tf.keras.metrics.Accuracy(),
+        'custom_tokenizer': custom_tokenizer
+    }
+    return load_model(os.path.join(model_dir, 'recipe_model.h5'), custom_objects=custom_objects)
+
+# Function to get the version of the model files: a hash of their names, sizes and modification times
+def files_version(model_dir=None):
+    model_dir = model_dir or MODEL_DIR
+    digest = hashlib.sha1()
+    for name in ARTEFACTS:
+        path = os.path.join(model_dir, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:12]
+
+# Function to find the model files which should be served, returns (version, folder, True if it is a registry bundle)
+def model_source():
+    version = model_registry.current_version()
+    if version:
+        return version, model_registry.bundle_dir(version), True
+    return files_version(), MODEL_DIR, False
+
+# Function to load the model files, a registry bundle is checked against its checksums first
+def load_components(model_dir=None, version=None, verify=False):
+    import joblib
+
+    model_dir = model_dir or MODEL_DIR
+    if verify:
+        model_registry.verify_bundle(model_dir)
+
+    main_module = sys.modules["__main__"]
+    if not hasattr(main_module, "custom_tokenizer"): # Needed to unpickle the vectorizer outside of main.py
+        main_module.custom_tokenizer = custom_tokenizer
+    vectorizer = joblib.load(os.path.join(model_dir, 'tfidf_ingredients.pkl'))
+    vectorizer.tokenizer = custom_tokenizer # Ensure the tokenizer is set correctly
+    return {
+        "version": version or files_version(model_dir), # Part of the key of remembered predictions
+        "model": load_model_file(model_dir),
+        "vectorizer": vectorizer,
+        "label_encoder_cuisine": joblib.load(os.path.join(model_dir, 'label_encoder_cuisine.pkl')),
+        "label_encoder_recipe": joblib.load(os.path.join(model_dir, 'label_encoder_recipe.pkl')),
+    }
+
+# Function to get the shared model components, the first call loads them (other threads wait for it)
+def get_components():
+    global _components
+    if _components is None:
+        with _lock:
+            if _components is None:
+                _components = load_measured(*model_source())
+        start_watcher()
+    return _components
+
+# Function to load the components and record load time and memory
+@metrics.timed("model.load")
+def load_measured(version, model_dir, bundled):
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    components = load_components(model_dir, version, verify=bundled)
+    _stats.update(loads=_stats["loads"] + 1, load_seconds=time.perf_counter() - start,
+                  rss_before_mb=rss_before, rss_after_mb=current_rss_mb())
+    return components
+
+# Function to load the served version if it changed, returns True if the components were swapped.
+# If the new version can't be loaded the current one stays in use and the error is kept in the stats.
+def reload_if_changed():
+    global _components
+    with _reload_lock:
+        version, model_dir, bundled = model_source()
+        if _components is not None and _components["version"] == version:
+            return False
+        try:
+            components = load_measured(version, model_dir, bundled) # The current version keeps serving meanwhile
+        except Exception as e:
+            _stats["reload_error"] = f"{version}: {e}"
+            return False
+        with _lock:
+            _components = components # One assignment, every request sees either the old or the new version
+        _stats.update(reloads=_stats["reloads"] + 1, reload_error=None)
+        return True
+
+# Function to check for a new version in a background thread (only once per process)
+def start_watcher(interval=None):
+    global _watcher_thread
+    interval = WATCH_INTERVAL if interval is None else interval
+    if interval <= 0:
+        return None
+    def watch():
+        while True:
+            time.sleep(interval)
+            reload_if_changed()
+    with _lock:
+        if _watcher_thread is None:
+            _watcher_thread = threading.Thread(target=watch, name="model-watcher", daemon=True)
+            _watcher_thread.start()
+    return _watcher_thread
+
+# Function to run one prediction with an empty ingredient vector, so the first real request doesn't pay for
+# building the prediction function
+def warm_up():
+    import numpy as np
+    components = get_components()
+    start = time.perf_counter()
+    dummy = np.zeros((1, len(components["vectorizer"].vocabulary_)), dtype="float32")
+    components["model"].predict(dummy, verbose=0)
+    _stats.update(warmed_up=True, warm_up_seconds=time.perf_counter() - start)
+
+# Function to load and warm up the model in a background thread when the server starts (only once per process)
+def start_warm_up():
+    global _warm_up_thread
+    with _lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=warm_up, name="model-warm-up", daemon=True)
+            _warm_up_thread.start()
+    return _warm_up_thread
+
+# Function to get load time, warm up time and memory use of the model
+def model_stats():
+    stats = dict(_stats, loaded=_components is not None, version=_components["version"] if _components else None)
+    if stats["rss_before_mb"] is not None:
+        stats["rss_increase_mb"] = stats["rss_after_mb"] - stats["rss_before_mb"]
+    return stats
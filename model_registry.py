@@ -0,0 +1,123 @@
+import hashlib # To compute the checksums of the model files
+import json # The manifest is a JSON file
+import os # To work with the folders of the registry
+import shutil # To copy the model files into a bundle
+import sys # To read the command line arguments
+import tempfile # A bundle is built in a temporary folder and renamed when it is complete
+from datetime import datetime # To record when a bundle was published
+from file_utils import atomic_write_json, atomic_write_text # The manifest and the pointer to the served bundle are replaced atomically
+
+# Registry of the recipe model. Every version is a bundle folder with the model, the TF-IDF vectorizer, both label
+# encoders and a manifest with their SHA-256 checksums:
+#   model_registry/<version>/recipe_model.npz, recipe_model.h5, tfidf_ingredients.pkl, label_encoder_*.pkl, manifest.json
+#   model_registry/CURRENT   name of the bundle which is served
+# Publishing a bundle and switching CURRENT are atomic, a running server loads the new bundle in the background and
+# swaps it in (see model_holder). Without a registry the model files next to the app are used.
+# Usage: python model_registry.py publish <folder with the model files> [version]
+#        python model_registry.py activate <version>
+#        python model_registry.py list
+REGISTRY_DIR = os.environ.get("WASTELESS_MODEL_REGISTRY", os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_registry"))
+REQUIRED_FILES = ["tfidf_ingredients.pkl", "label_encoder_cuisine.pkl", "label_encoder_recipe.pkl"]
+MODEL_FILES = ["recipe_model.npz", "recipe_model.h5"] # At least one of them
+MANIFEST = "manifest.json"
+
+
+# Error raised when a bundle is incomplete or a file doesn't match its checksum
+class BundleError(Exception):
+    pass
+
+
+# Function to compute the SHA-256 checksum of a file
+def checksum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Function to get the folder of a bundle
+def bundle_dir(version, registry=None):
+    return os.path.join(registry or REGISTRY_DIR, version)
+
+# Function to get the versions in the registry, oldest first
+def list_versions(registry=None):
+    registry = registry or REGISTRY_DIR
+    if not os.path.isdir(registry):
+        return []
+    versions = [name for name in os.listdir(registry) if os.path.exists(os.path.join(registry, name, MANIFEST))]
+    return sorted(versions, key=lambda name: read_manifest(bundle_dir(name, registry))["created"])
+
+# Function to read the manifest of a bundle
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST), "r") as file:
+        return json.load(file)
+
+# Function to get the version which is served, None if the registry is empty
+def current_version(registry=None):
+    registry = registry or REGISTRY_DIR
+    try:
+        with open(os.path.join(registry, "CURRENT"), "r") as file:
+            version = file.read().strip()
+    except OSError:
+        versions = list_versions(registry) # No pointer yet, serve the newest bundle
+        return versions[-1] if versions else None
+    return version if os.path.exists(os.path.join(registry, version, MANIFEST)) else None
+
+# Function to check that all files of a bundle exist and match their checksums, returns the manifest
+def verify_bundle(path):
+    manifest = read_manifest(path)
+    for name, expected in manifest["files"].items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path):
+            raise BundleError(f"{name} is missing in {path}")
+        if checksum(file_path) != expected:
+            raise BundleError(f"{name} in {path} doesn't match its checksum")
+    return manifest
+
+# Function to copy the model files of a folder into a new bundle, returns its version
+def publish(source_dir, version=None, activate=True, registry=None):
+    registry = registry or REGISTRY_DIR
+    names = [name for name in REQUIRED_FILES + MODEL_FILES if os.path.exists(os.path.join(source_dir, name))]
+    missing = [name for name in REQUIRED_FILES if name not in names]
+    if missing or not any(name in names for name in MODEL_FILES):
+        raise BundleError(f"{source_dir} is missing {', '.join(missing) or 'recipe_model.npz or recipe_model.h5'}")
+    version = version or datetime.now().strftime("%Y%m%d-%H%M%S")
+    if os.path.exists(bundle_dir(version, registry)):
+        raise BundleError(f"Version {version} already exists")
+    os.makedirs(registry, exist_ok=True)
+    building = tempfile.mkdtemp(prefix=".building-", dir=registry) # Not listed until it is complete
+    try:
+        for name in names:
+            shutil.copy2(os.path.join(source_dir, name), os.path.join(building, name))
+        atomic_write_json(os.path.join(building, MANIFEST), {
+            "version": version,
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "files": {name: checksum(os.path.join(building, name)) for name in names},
+        })
+        os.replace(building, bundle_dir(version, registry))
+    except BaseException:
+        shutil.rmtree(building, ignore_errors=True)
+        raise
+    if activate:
+        activate_version(version, registry)
+    return version
+
+# Function to serve another version, servers pick it up with their next check
+def activate_version(version, registry=None):
+    registry = registry or REGISTRY_DIR
+    verify_bundle(bundle_dir(version, registry))
+    atomic_write_text(os.path.join(registry, "CURRENT"), version + "\n")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "publish":
+        print(f"Published version {publish(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)}")
+    elif len(sys.argv) == 3 and sys.argv[1] == "activate":
+        activate_version(sys.argv[2])
+        print(f"Serving version {sys.argv[2]}")
+    elif len(sys.argv) == 2 and sys.argv[1] == "list":
+        served = current_version()
+        for name in list_versions():
+            print(("* " if name == served else "  ") + name)
+    else:
+        sys.exit("Usage: python model_registry.py publish <folder> [version] | activate <version> | list")
@@ -0,0 +1,96 @@
+import json # The layer graph is stored as JSON inside the .npz file
+import sys # To read the command line arguments
+import numpy as np # Forward pass of the model
+
+# The recipe model is a small dense network (one hidden layer, four output heads), TensorFlow is not needed to run
+# it. The exporter reads the layers and weights from recipe_model.h5 (with h5py, no TensorFlow) and stores them in
+# a compact .npz file. NumpyModel runs the forward pass with NumPy and returns the same list of outputs as Keras'
+# model.predict, so it can be used in its place.
+# Export with:        python numpy_model.py export recipe_model.h5 recipe_model.npz
+# Compare with Keras: python numpy_model.py check recipe_model.h5 recipe_model.npz  (needs requirements-export.txt)
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "sigmoid": lambda x: 1 / (1 + np.exp(-x)),
+    "tanh": np.tanh,
+    "softmax": lambda x: softmax(x),
+}
+
+
+# Function to compute the softmax of every row
+def softmax(x):
+    exp = np.exp(x - x.max(axis=-1, keepdims=True)) # Subtract the maximum, so exp can't overflow
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+# Function to read the layer graph and weights of a Keras .h5 file and store them in a .npz file
+def export_npz(h5_path, npz_path):
+    import h5py # Only needed to export
+    with h5py.File(h5_path, "r") as file:
+        config = json.loads(file.attrs["model_config"])["config"]
+        layers = []
+        arrays = {}
+        for layer in config["layers"]:
+            kind, name = layer["class_name"], layer["config"]["name"]
+            if kind not in ("InputLayer", "Dense", "Dropout"):
+                raise ValueError(f"Layer {name} of type {kind} is not supported")
+            inputs = [node["args"][0]["config"]["keras_history"][0] for node in layer.get("inbound_nodes", [])]
+            layers.append({"name": name, "type": kind, "inputs": inputs, "activation": layer["config"].get("activation", "linear")})
+            if kind == "Dense":
+                weights = file["model_weights"][name][name]
+                arrays[f"{name}/kernel"] = weights["kernel"][()].astype(np.float32)
+                arrays[f"{name}/bias"] = weights["bias"][()].astype(np.float32)
+        graph = {"layers": layers, "outputs": [output[0] for output in config["output_layers"]]}
+    np.savez_compressed(npz_path, graph=np.array(json.dumps(graph)), **arrays)
+
+
+class NumpyModel:
+    def __init__(self, npz_path):
+        with np.load(npz_path) as file:
+            graph = json.loads(str(file["graph"]))
+            self.weights = {key: file[key] for key in file.files if key != "graph"}
+        self.layers = graph["layers"] # In the order of the .h5 file, every layer comes after its input
+        self.outputs = graph["outputs"]
+
+    # Function to run the model, returns one array per output head like Keras (verbose is accepted and ignored)
+    def predict(self, x, verbose=0):
+        values = {}
+        for layer in self.layers:
+            if layer["type"] == "InputLayer":
+                values[layer["name"]] = np.asarray(x, dtype=np.float32)
+            elif layer["type"] == "Dropout": # Dropout does nothing when predicting
+                values[layer["name"]] = values[layer["inputs"][0]]
+            else:
+                z = values[layer["inputs"][0]] @ self.weights[layer["name"] + "/kernel"] + self.weights[layer["name"] + "/bias"]
+                values[layer["name"]] = ACTIVATIONS[layer["activation"]](z)
+        return [values[name] for name in self.outputs]
+
+    # Function to get the number of inputs (size of the TF-IDF vector)
+    @property
+    def input_size(self):
+        first_dense = next(layer for layer in self.layers if layer["type"] == "Dense")
+        return self.weights[first_dense["name"] + "/kernel"].shape[0]
+
+
+# Function to compare the NumPy model with the Keras model on random inputs, returns the largest difference per head
+def parity_check(h5_path, npz_path, samples=256, seed=0):
+    from tensorflow.keras.models import load_model # Only needed for the comparison
+    keras_model = load_model(h5_path, compile=False)
+    numpy_model = NumpyModel(npz_path)
+    rng = np.random.default_rng(seed)
+    x = rng.random((samples, numpy_model.input_size), dtype=np.float32) * (rng.random((samples, numpy_model.input_size)) < 0.1) # Sparse like TF-IDF
+    expected = keras_model.predict(x, verbose=0)
+    actual = numpy_model.predict(x)
+    return {name: float(np.abs(np.asarray(e) - a).max()) for name, e, a in zip(numpy_model.outputs, expected, actual)}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] not in ("export", "check"):
+        sys.exit("Usage: python numpy_model.py export|check <model.h5> <model.npz>")
+    if sys.argv[1] == "export":
+        export_npz(sys.argv[2], sys.argv[3])
+        print(f"Exported {sys.argv[2]} to {sys.argv[3]}")
+    else:
+        differences = parity_check(sys.argv[2], sys.argv[3])
+        print(json.dumps(differences, indent=2))
+        if max(differences.values()) > 1e-4:
+            sys.exit("The NumPy model differs from the Keras model")
@@ -0,0 +1,49 @@
+import copy # Results are copied, so a page can't change the cached result
+import threading # The cache is shared by all sessions
+from collections import OrderedDict # Keeps the entries in the order they were used
+
+# Recommendations are remembered for the last MAX_ENTRIES ingredient selections of all sessions. The key is the set
+# of ingredients (order and duplicates don't matter) together with the version of the model files, so the results
+# of an old model are never returned after the model changed, they are simply evicted.
+MAX_ENTRIES = 1024
+
+_lock = threading.Lock()
+_entries = OrderedDict() # (model version, ingredient set) -> prediction, least recently used first
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+# Function to turn a selection of ingredients into the cache key (ingredients are matched to the model without case)
+def ingredient_key(ingredients):
+    return frozenset(ingredient.strip().lower() for ingredient in ingredients if ingredient.strip())
+
+# Function to return the remembered prediction or compute it with compute() and remember it.
+# version can also be a tuple, e.g. to keep the results of different functions apart.
+def get_or_compute(ingredients, version, compute):
+    key = (version, ingredient_key(ingredients))
+    with _lock:
+        if key in _entries:
+            _entries.move_to_end(key) # Most recently used
+            _stats["hits"] += 1
+            return copy.deepcopy(_entries[key])
+        _stats["misses"] += 1
+    result = compute() # Outside of the lock, other sessions don't have to wait for this prediction
+    with _lock:
+        _entries[key] = copy.deepcopy(result)
+        _entries.move_to_end(key)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats["evictions"] += 1
+    return result
+
+# Function to forget all predictions
+def clear():
+    with _lock:
+        _entries.clear()
+
+# Function to get the hit and miss counters and the hit rate
+def stats():
+    with _lock:
+        result = dict(_stats, entries=len(_entries))
+    lookups = result["hits"] + result["misses"]
+    result["hit_rate"] = result["hits"] / lookups if lookups else 0.0
+    return result
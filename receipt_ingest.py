@@ -0,0 +1,92 @@
+import io # Pages are passed to the OCR workers as PNG bytes
+import re # To find the line items in the text of a receipt
+import time # To measure how long every page took
+from collections import deque # Pages which are being OCRed, in page order
+from concurrent.futures import ThreadPoolExecutor # Tesseract runs as its own process, threads are enough to use all cores
+import metrics # Timing of the OCR
+
+# Reads PDF or image receipts and turns them into line items (product, quantity, unit, price) for the inventory.
+# PDF pages are rendered one after the other with PyMuPDF and recognised in a pool of OCR workers. The results are
+# yielded page by page in page order as soon as they are ready, so the first items of a long PDF can be shown
+# while the rest is still being read. Only a few pages are rendered ahead, so memory doesn't grow with the PDF.
+# PDF pages which already contain text (receipts sent by e-mail) are not OCRed at all.
+DPI = 300 # Resolution at which PDF pages are rendered for OCR
+MAX_WORKERS = 4 # Pages which are OCRed at the same time
+OCR_LANGUAGES = "deu+eng" # Tesseract languages, Swiss receipts are mostly German
+
+# Lines which are not products (totals, payment, VAT)
+SKIP_WORDS = ["total", "summe", "subtotal", "zwischensumme", "mwst", "vat", "tax", "bar", "cash", "karte", "card",
+              "rückgeld", "change", "twint", "rabatt", "datum", "date", "kasse", "beleg", "bon"]
+# Product line: name, optional quantity with unit or "2 x", optional unit price, price at the end of the line
+ITEM_LINE = re.compile(
+    r"^(?P<name>.*?[A-Za-zÄÖÜäöüéèà].*?)\s+"
+    r"(?:(?P<quantity>\d+(?:[.,]\d+)?)\s*(?P<unit>kg|g|l|cl|ml|stk|st|x|\*)\s+)?"
+    r"(?:(?P<unit_price>\d+[.,]\d{2})\s+)?"
+    r"(?P<price>-?\d+[.,]\d{2})(?:\s+[A-Z0-9])?$", re.IGNORECASE)
+UNITS = {"kg": ("Grams", 1000), "g": ("Grams", 1), "l": ("Liters", 1), "cl": ("Liters", 0.01), "ml": ("Liters", 0.001)}
+
+
+# Function to turn a number like "3,45" into a float
+def to_number(text):
+    return float(text.replace(",", "."))
+
+# Function to parse the text of a receipt page into line items
+def parse_items(text):
+    items = []
+    for line in text.splitlines():
+        line = " ".join(line.split())
+        match = ITEM_LINE.match(line)
+        if not match:
+            continue
+        name = match.group("name").strip(" .:-*")
+        if not name or any(word in name.lower().split() for word in SKIP_WORDS):
+            continue
+        price = to_number(match.group("price"))
+        if price <= 0: # Discounts and deposit returns
+            continue
+        quantity, unit = 1.0, "Pieces"
+        if match.group("quantity"):
+            unit, factor = UNITS.get(match.group("unit").lower(), ("Pieces", 1))
+            quantity = to_number(match.group("quantity")) * factor
+        items.append({"Product": name, "Quantity": quantity, "Unit": unit, "Price": price})
+    return items
+
+# Function to recognise the text of one page image (runs in a worker thread)
+@metrics.timed("receipt.ocr")
+def ocr_page(png):
+    import pytesseract # Imported here, so the parser works without tesseract
+    from PIL import Image
+    return pytesseract.image_to_string(Image.open(io.BytesIO(png)), lang=OCR_LANGUAGES)
+
+# Function to read the pages of a receipt, yields (page number, text or None, PNG bytes or None).
+# Text is returned for PDF pages with a text layer, all other pages are rendered for OCR.
+def render_pages(content, filename, dpi=DPI):
+    if not filename.lower().endswith(".pdf"):
+        yield 1, None, content # Images are OCRed directly
+        return
+    import fitz # PyMuPDF, imported here because only PDF receipts need it
+    with fitz.open(stream=content, filetype="pdf") as document:
+        for number, page in enumerate(document, start=1):
+            text = page.get_text()
+            if text.strip():
+                yield number, text, None
+            else:
+                yield number, None, page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY).tobytes("png")
+
+# Function to read a receipt page by page, yields {"page", "items", "source", "seconds"} in page order
+def ingest_receipt(content, filename, workers=MAX_WORKERS, dpi=DPI):
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running = deque() # (page number, start time, future or text) in page order
+        for number, text, png in render_pages(content, filename, dpi):
+            running.append((number, time.perf_counter(), text if png is None else pool.submit(ocr_page, png)))
+            while running and (len(running) > workers or isinstance(running[0][2], str) or running[0][2].done()):
+                yield finish_page(*running.popleft()) # Render at most a few pages ahead of the OCR
+        while running:
+            yield finish_page(*running.popleft())
+
+# Function to wait for the text of a page and parse it
+def finish_page(number, start, text_or_future):
+    if isinstance(text_or_future, str):
+        return {"page": number, "items": parse_items(text_or_future), "source": "text", "seconds": time.perf_counter() - start}
+    text = text_or_future.result()
+    return {"page": number, "items": parse_items(text), "source": "ocr", "seconds": time.perf_counter() - start}
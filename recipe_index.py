@@ -0,0 +1,143 @@
+import json # The dump and the index are JSON files
+import os # To check the files
+import sys # To read the command line arguments
+import threading # The index is loaded once per process and shared by all sessions
+import numpy as np # Posting lists are arrays, so counting and intersecting them runs in C
+from file_utils import atomic_write_json # To write the index safely
+
+# Local recipe search which works without the network. The importer reads a TheMealDB dump ({"meals": [...]} as
+# returned by search.php/lookup.php, one file or a folder of files) and builds an inverted index:
+# ingredient -> ids of the recipes using it (posting list) and recipe -> its ingredients.
+# A query counts for every recipe how many inventory items it uses from the posting lists of the inventory items,
+# so only recipes sharing at least one item are looked at. Recipes are ranked by the inventory items they use minus
+# the extra ingredients they need, ties go to fewer extra ingredients. Ingredients which must be in the recipe are
+# handled by intersecting their posting lists. Priority ingredients (e.g. the ones that expire soon) count PRIORITY_WEIGHT
+# more for every recipe that uses them.
+# Build the index with: python recipe_index.py <dump.json or folder> [recipe_index.json]
+INDEX_FILE = os.environ.get("WASTELESS_RECIPE_INDEX", "recipe_index.json")
+PRIORITY_WEIGHT = 3 # Extra score for every priority ingredient a recipe uses
+
+_index = None
+_index_stamp = None
+_lock = threading.Lock()
+
+
+# Function to normalise an ingredient name, so "Tomatoes " and "tomato" are the same ingredient
+def normalize(ingredient):
+    name = " ".join(str(ingredient).lower().split())
+    if name.endswith("oes"):
+        return name[:-2]
+    if name.endswith("s") and not name.endswith(("ss", "us")) and len(name) > 3:
+        return name[:-1]
+    return name
+
+
+class RecipeIndex:
+    def __init__(self, recipes):
+        self.recipes = recipes # Recipe id -> {"name", "ingredients", "link"}, ingredients are normalised
+        self.ids = sorted(recipes) # Position of a recipe in the arrays below
+        self.sizes = np.array([len(recipes[recipe_id]["ingredients"]) for recipe_id in self.ids], dtype=np.int32)
+        postings = {} # Ingredient -> positions of the recipes using it, in increasing order
+        for position, recipe_id in enumerate(self.ids):
+            for ingredient in recipes[recipe_id]["ingredients"]:
+                postings.setdefault(ingredient, []).append(position)
+        self.postings = {ingredient: np.array(positions, dtype=np.int32) for ingredient, positions in postings.items()}
+
+    # Function to get the positions of the recipes which use all given ingredients (posting list intersection)
+    def recipes_with_all(self, ingredients):
+        lists = sorted((self.postings.get(normalize(ingredient), np.empty(0, dtype=np.int32)) for ingredient in ingredients), key=len)
+        result = lists[0] if lists else np.empty(0, dtype=np.int32) # Start with the shortest list, the result can only get smaller
+        for posting in lists[1:]:
+            if not len(result):
+                break
+            result = np.intersect1d(result, posting, assume_unique=True)
+        return result
+
+    # Function to get the k best recipes for an inventory, returns a list of dictionaries with name, link,
+    # used ingredients, missing ingredients and coverage (share of the recipe's ingredients which are at home)
+    def query(self, inventory, k=3, required=None, priority=None):
+        have = {normalize(item) for item in inventory}
+        lists = [self.postings[ingredient] for ingredient in have if ingredient in self.postings]
+        if not lists:
+            return []
+        used = np.bincount(np.concatenate(lists), minlength=len(self.ids)) # Inventory items used by every recipe
+        candidates = np.flatnonzero(used)
+        if required:
+            candidates = np.intersect1d(candidates, self.recipes_with_all(required), assume_unique=True)
+        missing = self.sizes[candidates] - used[candidates]
+        score = used[candidates] - missing # Many inventory items and few extra ingredients
+        urgent = [self.postings[ingredient] for ingredient in {normalize(item) for item in priority or []} & have if ingredient in self.postings]
+        if urgent: # Recipes using the priority ingredients come first
+            score = score + PRIORITY_WEIGHT * np.bincount(np.concatenate(urgent), minlength=len(self.ids))[candidates]
+        if len(candidates) > k: # Only the best k are sorted
+            keep = np.argpartition(-score, k - 1)[:k]
+            cutoff = score[keep].min()
+            keep = np.flatnonzero(score >= cutoff) # Keep ties, they are decided below
+            candidates, missing, score = candidates[keep], missing[keep], score[keep]
+        order = sorted(range(len(candidates)), key=lambda i: (-score[i], missing[i], self.recipes[self.ids[candidates[i]]]["name"]))[:k]
+        results = []
+        for i in order:
+            recipe = self.recipes[self.ids[candidates[i]]]
+            results.append({
+                "name": recipe["name"],
+                "link": recipe["link"],
+                "used": sorted(set(recipe["ingredients"]) & have),
+                "missing": sorted(set(recipe["ingredients"]) - have),
+                "coverage": float(used[candidates[i]]) / len(recipe["ingredients"]),
+            })
+        return results
+
+    # Function to store the index, only the recipes are stored, the posting lists are built when loading
+    def save(self, path=INDEX_FILE):
+        atomic_write_json(path, {"recipes": self.recipes})
+
+    @classmethod
+    def load(cls, path=INDEX_FILE):
+        with open(path, "r") as file: # Opens file in read modus
+            return cls(json.load(file)["recipes"])
+
+
+# Function to read the meals of a TheMealDB dump, a file or a folder with JSON files
+def read_dump(path):
+    paths = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".json")] if os.path.isdir(path) else [path]
+    meals = []
+    for file_path in paths:
+        with open(file_path, "r") as file:
+            data = json.load(file)
+        meals.extend((data.get("meals") or []) if isinstance(data, dict) else data)
+    return meals
+
+# Function to build the index from the meals of a dump
+def build_index(meals):
+    recipes = {}
+    for meal in meals:
+        ingredients = sorted({normalize(meal[f"strIngredient{n}"]) for n in range(1, 21) if (meal.get(f"strIngredient{n}") or "").strip()})
+        if ingredients:
+            recipes[str(meal["idMeal"])] = {
+                "name": meal["strMeal"],
+                "ingredients": ingredients,
+                "link": f"https://www.themealdb.com/meal/{meal['idMeal']}",
+            }
+    return RecipeIndex(recipes)
+
+# Function to get the shared index, returns None if no index was built. A rebuilt file is loaded again.
+def get_index(path=INDEX_FILE):
+    global _index, _index_stamp
+    try:
+        stamp = (path, os.stat(path).st_mtime_ns)
+    except OSError:
+        return None
+    if stamp != _index_stamp:
+        with _lock:
+            if stamp != _index_stamp:
+                _index = RecipeIndex.load(path)
+                _index_stamp = stamp
+    return _index
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("Usage: python recipe_index.py <dump.json or folder> [recipe_index.json]")
+    index = build_index(read_dump(sys.argv[1]))
+    index.save(sys.argv[2] if len(sys.argv) > 2 else INDEX_FILE)
+    print(f"Indexed {len(index.recipes)} recipes with {len(index.postings)} ingredients")
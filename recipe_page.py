@@ -1,17 +1,15 @@
 import streamlit as st # Creates app interface
-import requests # To send http requests for API
-import random # Enables radom selection
 import pandas as pd # Library to handle data
 from datetime import datetime 
-
-# Add new imports for ML model
-from tensorflow.keras.models import load_model
-import joblib
-import os
-import tensorflow as tf
-
-# Replace Spoonacular API configuration with TheMealDB
-THEMEALDB_URL = 'https://www.themealdb.com/api/json/v1/1/filter.php'
+from flat_sync import record_event # To append each change to the flat's journal
+import inventory_service # Takes the ingredients of a cooked recipe out of the inventory
+import model_holder # The ML model is loaded once per process and shared by all sessions
+import prediction_cache # Remembers the recommendations of recent ingredient selections
+import recommender # Ranked recommendations and batched scoring of inventory subsets
+import metrics # Timing of the recipe search and the model
+import themealdb # Pooled, parallel requests to TheMealDB
+import recipe_index # Local recipe search without the network
+import expiry # Ingredients that expire soon are used first
 
 # Initialization of session state variables and examples if nothing in session_state
 if "inventory" not in st.session_state:
@@ -39,53 +37,32 @@ if "selected_recipe_link" not in st.session_state:
 if "cooking_history" not in st.session_state:
     st.session_state["cooking_history"] = [] # History of recipes cooked and their ratings
 
-# Initialize additional session state variables for ML predictions
-if "ml_model" not in st.session_state:
-    st.session_state["ml_model"] = None
-if "vectorizer" not in st.session_state:
-    st.session_state["vectorizer"] = None
-if "label_encoder_cuisine" not in st.session_state:
-    st.session_state["label_encoder_cuisine"] = None
-if "label_encoder_recipe" not in st.session_state:
-    st.session_state["label_encoder_recipe"] = None
-
 # Function to suggest recipes based on the inventory
+@metrics.timed("recipes.search")
 def get_recipes_from_inventory(selected_ingredients=None):
     """Get recipes from TheMealDB API based on ingredients"""
     ingredients = selected_ingredients if selected_ingredients else list(st.session_state["inventory"].keys())
+    soon = [product for product in expiry.expiry_queue(st.session_state).products() if product in ingredients] # Use these first
+    ingredients = soon + [ingredient for ingredient in ingredients if ingredient not in soon]
     if not ingredients:
         st.warning("Inventory is empty. Move your lazy ass to Migros!")
         return [], {}
     
-    recipe_titles = []
-    recipe_links = {}
-    displayed_recipes = 0
+    index = recipe_index.get_index() # Local index ranked by inventory coverage, if one was built
+    if index is not None:
+        recipes = index.query(ingredients, k=3, priority=soon)
+        if recipes:
+            recipe_titles = [recipe["name"] for recipe in recipes]
+            recipe_links = {recipe["name"]: {"link": recipe["link"], "missed_ingredients": recipe["missing"], "used_ingredients": recipe["used"]}
+                            for recipe in recipes}
+            return recipe_titles, recipe_links
     
-    for ingredient in ingredients:
-        response = requests.get(f"{THEMEALDB_URL}?i={ingredient}")
-        
-        if response.status_code == 200:
-            data = response.json()
-            meals = data.get("meals", [])
-            
-            random.shuffle(meals)
-            
-            for meal in meals:
-                if meal["strMeal"] not in recipe_titles:
-                    recipe_titles.append(meal["strMeal"])
-                    recipe_links[meal["strMeal"]] = {
-                        "link": f"https://www.themealdb.com/meal/{meal['idMeal']}",
-                        "missed_ingredients": []  # TheMealDB does not provide missed ingredients
-                    }
-                    displayed_recipes += 1
-                    
-                    if displayed_recipes >= 3:
-                        break
-            if displayed_recipes >= 3:
-                break
-        else:
-            st.error("Error fetching recipes. Please try again later.")
-            return [], {}
+    recipe_titles, recipe_links, failed = themealdb.find_recipes(soon or ingredients, limit=3) # Parallel requests
+    if not recipe_titles and soon: # Nothing found for the expiring ingredients
+        recipe_titles, recipe_links, failed = themealdb.find_recipes(ingredients, limit=3)
+    if not recipe_titles and failed:
+        st.error("Error fetching recipes. Please try again later.")
+        return [], {}
     
     return recipe_titles, recipe_links
 
@@ -100,45 +77,46 @@ def rate_recipe(recipe_title, recipe_link):
         user = st.session_state["selected_user"] # Get the selected user
         if user:
             st.success(f"You have rated '{recipe_title}' with {rating} stars!") # Success message
-            st.session_state["cooking_history"].append({ # Creates a "Cookbook" with history of rating
+            entry = { # Creates a "Cookbook" with history of rating
                 "Person": user, # Choosen user - under which rating is stored
                 "Recipe": recipe_title,
                 "Rating": rating,
                 "Link": recipe_link,
                 "Date": datetime.now().strftime("%Y-%m-%d %H:%M:%S") # Timestamp
-            })
+            }
+            st.session_state["cooking_history"].append(entry)
+            record_event(st.session_state.get("username"), {"op": "rate_recipe", "entry": entry}) # Journal only the new rating
         else:
             st.warning("Please select a user first.") # Warning message
 
+# Function to take the ingredients of the cooked recipe out of the inventory, all of them in one batch with one write
+def use_ingredients(recipe_title):
+    inventory = st.session_state["inventory"]
+    if not inventory:
+        return
+    with st.expander("Take the used ingredients out of the inventory"):
+        used = {name.strip().lower() for name in st.session_state["recipe_links"].get(recipe_title, {}).get("used_ingredients", [])}
+        products = st.multiselect("Used ingredients:", list(inventory), default=[product for product in inventory if product.strip().lower() in used],
+                                  key=f"used_{recipe_title}")
+        if not products:
+            return
+        rows = pd.DataFrame([{"Product": product, "Quantity": min(1.0, inventory[product]["Quantity"]), "Unit": inventory[product]["Unit"]}
+                             for product in products]) # One piece, liter or gram each, the user corrects the quantities
+        edited = st.data_editor(rows, hide_index=True, disabled=["Product", "Unit"], key=f"used_editor_{recipe_title}")
+        if st.button("Take them out", key=f"use_{recipe_title}"):
+            operations = [inventory_service.remove(row["Product"], row["Quantity"], row["Unit"], st.session_state["selected_user"])
+                          for row in edited.to_dict("records")]
+            result = inventory_service.apply_operations(st.session_state, operations, st.session_state.get("username"))
+            if result["ok"]:
+                st.success(f"{result['removed']} ingredients were taken out of the inventory.")
+            else: # Nothing was changed
+                st.warning(" ".join(f"{operations[index]['product']}: {message}" for index, message in result["errors"]))
 
-def custom_tokenizer(text):
-    return text.split(', ')
 
 def load_ml_components():
-    """Load the trained model and preprocessing components"""
+    """Load the trained model and preprocessing components (shared by all sessions)"""
     try:
-        if st.session_state["ml_model"] is None:
-            # Include the custom tokenizer in custom_objects
-            custom_objects = {
-                'mse': tf.keras.losses.MeanSquaredError(),
-                'mae': tf.keras.metrics.MeanAbsoluteError(),
-                'accuracy': tf.keras.metrics.Accuracy(),
-                'custom_tokenizer': custom_tokenizer
-            }
-            st.session_state["ml_model"] = load_model('models2/recipe_model.h5', custom_objects=custom_objects)
-        
-        if st.session_state["vectorizer"] is None:
-            vectorizer = joblib.load('models2/tfidf_ingredients.pkl')
-            # Ensure the tokenizer is set correctly
-            vectorizer.tokenizer = custom_tokenizer
-            st.session_state["vectorizer"] = vectorizer
-        
-        if st.session_state["label_encoder_cuisine"] is None:
-            st.session_state["label_encoder_cuisine"] = joblib.load('models2/label_encoder_cuisine.pkl')
-        
-        if st.session_state["label_encoder_recipe"] is None:
-            st.session_state["label_encoder_recipe"] = joblib.load('models2/label_encoder_recipe.pkl')
-        
+        model_holder.get_components()
         return True
     except Exception as e:
         st.error(f"Error loading ML components: {str(e)}")
@@ -146,35 +124,42 @@ def load_ml_components():
 def predict_recipe(ingredients):
     """Predict recipe and additional details based on selected ingredients"""
     try:
-        # Transform ingredients to string format
-        ingredients_text = ', '.join(ingredients)
-        ingredients_vec = st.session_state["vectorizer"].transform([ingredients_text]).toarray()
-        
-        # Get predictions
-        predictions = st.session_state["ml_model"].predict(ingredients_vec)
-        
-        # Process predictions
-        cuisine_index = predictions[0].argmax()
-        recipe_index = predictions[1].argmax()
-        
-        # Get recipe and cuisine names
-        predicted_cuisine = st.session_state["label_encoder_cuisine"].inverse_transform([cuisine_index])[0]
-        predicted_recipe = st.session_state["label_encoder_recipe"].inverse_transform([recipe_index])[0]
-        
-        # Get preparation time and calories
-        predicted_prep_time = predictions[2][0][0]
-        predicted_calories = predictions[3][0][0]
-        
-        return {
-            'recipe': predicted_recipe,
-            'cuisine': predicted_cuisine,
-            'preparation_time': predicted_prep_time,
-            'calories': predicted_calories
-        }
+        components = model_holder.get_components()
+        key = prediction_cache.ingredient_key(ingredients)
+        # The same selection (in any order) is only predicted once per model version, for all sessions
+        return prediction_cache.get_or_compute(key, components["version"], lambda: compute_prediction(components, sorted(key)))
     except Exception as e:
         st.error(f"Error making prediction: {str(e)}")
         return None
 
+# Function to run the vectorizer and the model for a list of ingredients
+@metrics.timed("model.predict")
+def compute_prediction(components, ingredients):
+    # Transform ingredients to the TF-IDF vector (inventory names are matched to the vocabulary without case)
+    ingredients_vec = recommender.tfidf_rows(components, [recommender.known_columns(components, ingredients)])
+    
+    # Get predictions
+    predictions = components["model"].predict(ingredients_vec, verbose=0)
+    
+    # Process predictions
+    cuisine_index = predictions[0].argmax()
+    recipe_index = predictions[1].argmax()
+    
+    # Get recipe and cuisine names
+    predicted_cuisine = components["label_encoder_cuisine"].inverse_transform([cuisine_index])[0]
+    predicted_recipe = components["label_encoder_recipe"].inverse_transform([recipe_index])[0]
+    
+    # Get preparation time and calories
+    predicted_prep_time = predictions[2][0][0]
+    predicted_calories = predictions[3][0][0]
+    
+    return {
+        'recipe': predicted_recipe,
+        'cuisine': predicted_cuisine,
+        'preparation_time': predicted_prep_time,
+        'calories': predicted_calories
+    }
+
 def show_preference_based_recommendations():
     """Show a section for preference-based recipe recommendations"""
     st.subheader("🎯 Get Personalized Recipe Recommendations")
@@ -203,6 +188,14 @@ def show_preference_based_recommendations():
                         st.metric("Preparation Time", f"{prediction['preparation_time']:.2f} mins")
                     with col2:
                         st.metric("Estimated Calories", f"{prediction['calories']:.2f} kcal")
+                    stats = model_holder.model_stats()
+                    if stats["load_seconds"] is not None: # Shared model, loaded once for all sessions
+                        st.caption(f"Model loaded in {stats['load_seconds']:.1f} s, using {stats['rss_increase_mb']:.0f} MB, "
+                                   f"{prediction_cache.stats()['hit_rate']:.0%} of recommendations answered from the cache")
+                    
+                    # Other likely recipes with their probability
+                    ranked = recommender.recommend(selected_ingredients, k=3)
+                    st.write("Most likely recipes: " + ", ".join(f"{entry['recipe']} ({entry['probability']:.0%})" for entry in ranked))
                     
                     # Show recipe details if available
                     if prediction['recipe'] in st.session_state["recipe_links"]:
@@ -225,6 +218,17 @@ def show_preference_based_recommendations():
             if recipe_titles:
                 st.success(f"Here's a recipe you might like: {recipe_titles[0]}")
                 st.markdown(f"[View Recipe Details]({recipe_links[recipe_titles[0]]['link']})")
+    
+    # Best recipes which can be made from the whole inventory, all ingredient subsets are scored at once
+    if st.button("Find the best recipe for our inventory") and st.session_state["inventory"]:
+        if load_ml_components():
+            soon = expiry.expiry_queue(st.session_state).products() # Recipes using what expires soon are preferred
+            best = recommender.best_recipes(list(st.session_state["inventory"].keys()), priority=soon or None, k=3)
+            if best:
+                st.table(pd.DataFrame([{"Recipe": entry["recipe"], "Probability": f"{entry['probability']:.0%}",
+                                        "Ingredients": ", ".join(entry["ingredients"])} for entry in best]))
+            else:
+                st.info("The model doesn't know any of the ingredients in the inventory.")
 
 # Main function to run the recipe page
 def recipepage():
@@ -284,6 +288,7 @@ def recipepage():
         # Display the rating section if a recipe was selected
         if st.session_state["selected_recipe"] and st.session_state["selected_recipe_link"]:
             rate_recipe(st.session_state["selected_recipe"], st.session_state["selected_recipe_link"])
+            use_ingredients(st.session_state["selected_recipe"])
 
         # Display cooking history in a table
         if st.session_state["cooking_history"]:
@@ -308,5 +313,6 @@ def recipepage():
         else:
             st.warning("No roommates available.")
 
-# Run the recipe page
-recipepage()
+# Run the recipe page (only when this file is run on its own, main.py calls it itself)
+if __name__ == "__main__":
+    recipepage()
@@ -0,0 +1,94 @@
+from itertools import combinations # To build the ingredient subsets of the inventory
+import numpy as np # The subsets are scored as one matrix
+import model_holder # Shared model, vectorizer and label encoders
+import prediction_cache # Remembers the results of recent selections
+import metrics # Timing of the batched scoring
+
+# Ranked recommendations from the recipe model. recommend() returns the k most likely recipes for a selection of
+# ingredients instead of only the most likely one. best_recipes() looks for the best recipe which can be made from
+# the inventory: it builds many ingredient subsets, scores all of them with one forward pass of the model and ranks
+# the recipes by probability times coverage (share of the priority items, e.g. items expiring soon, or of the
+# inventory which the subset uses).
+# The TF-IDF rows are built here from the vocabulary and idf weights of the vectorizer (every ingredient appears once,
+# so its term frequency is 1), inventory names are matched to the vocabulary without case ("Tomato" -> "tomato").
+MAX_SUBSET_SIZE = 3 # Largest subset of the inventory which is scored
+MAX_SUBSETS = 5000 # Subsets scored at most in one call
+
+
+# Function to map lower case ingredient names to their column in the TF-IDF vector
+def vocabulary(components):
+    return {name.lower(): column for name, column in components["vectorizer"].vocabulary_.items()}
+
+# Function to build the normalised TF-IDF rows for a list of ingredient subsets (lists of column numbers)
+def tfidf_rows(components, subsets):
+    vectorizer = components["vectorizer"]
+    rows = np.repeat(np.arange(len(subsets)), [len(subset) for subset in subsets])
+    columns = np.fromiter((column for subset in subsets for column in subset), dtype=np.intp, count=len(rows))
+    x = np.zeros((len(subsets), len(vectorizer.vocabulary_)), dtype=np.float32)
+    x[rows, columns] = 1.0
+    if vectorizer.use_idf:
+        x *= vectorizer.idf_.astype(np.float32)
+    if vectorizer.norm == "l2":
+        norms = np.linalg.norm(x, axis=1, keepdims=True)
+        x /= np.where(norms > 0, norms, 1)
+    return x
+
+# Function to get the columns of the ingredients the model knows, unknown ingredients are left out
+def known_columns(components, ingredients):
+    columns = vocabulary(components)
+    return sorted({columns[name.strip().lower()] for name in ingredients if name.strip().lower() in columns})
+
+# Function to get the k most likely recipes with their probability for a selection of ingredients
+def recommend(ingredients, k=3):
+    components = model_holder.get_components()
+    def compute():
+        recipe_probabilities = components["model"].predict(tfidf_rows(components, [known_columns(components, ingredients)]), verbose=0)[1][0]
+        top = np.argsort(-recipe_probabilities)[:k]
+        names = components["label_encoder_recipe"].inverse_transform(top)
+        return [{"recipe": str(name), "probability": float(recipe_probabilities[index])} for name, index in zip(names, top)]
+    return prediction_cache.get_or_compute(ingredients, ("recommend", components["version"], k), compute)
+
+# Function to find the best recipes which use the inventory. priority are ingredients which should be used first.
+# Returns up to k dictionaries with recipe, probability, the ingredients of the best subset, coverage and score.
+@metrics.timed("model.best_recipes")
+def best_recipes(inventory, priority=None, k=3, max_size=MAX_SUBSET_SIZE, max_subsets=MAX_SUBSETS):
+    components = model_holder.get_components()
+    columns = vocabulary(components)
+    names = {} # Column -> inventory name
+    for name in inventory:
+        if name.strip().lower() in columns:
+            names.setdefault(columns[name.strip().lower()], name)
+    known = sorted(names)
+    wanted = {columns[name.strip().lower()] for name in (priority or []) if name.strip().lower() in columns} or set(known)
+    subsets = []
+    for size in range(1, max_size + 1):
+        for subset in combinations(known, size):
+            if wanted.intersection(subset):
+                subsets.append(subset)
+                if len(subsets) >= max_subsets:
+                    break
+        if len(subsets) >= max_subsets:
+            break
+    if not subsets:
+        return []
+
+    x = tfidf_rows(components, subsets)
+    recipe_probabilities = components["model"].predict(x, verbose=0)[1] # One forward pass for all subsets
+    best_recipe = recipe_probabilities.argmax(axis=1)
+    probability = recipe_probabilities.max(axis=1)
+    wanted_mask = np.zeros(x.shape[1], dtype=np.float32)
+    wanted_mask[list(wanted)] = 1.0
+    coverage = ((x > 0) @ wanted_mask) / len(wanted)
+    score = probability * coverage
+
+    order = np.argsort(-score, kind="stable")
+    recipes, first = np.unique(best_recipe[order], return_index=True) # Best subset of every recipe
+    best = order[first[np.argsort(-score[order[first]], kind="stable")]][:k]
+    labels = components["label_encoder_recipe"].inverse_transform(best_recipe[best])
+    return [{
+        "recipe": str(label),
+        "probability": float(probability[row]),
+        "ingredients": [names[column] for column in subsets[row]],
+        "coverage": float(coverage[row]),
+        "score": float(score[row]),
+    } for label, row in zip(labels, best)]
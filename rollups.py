@@ -0,0 +1,99 @@
+import math # To skip prices which could not be read
+from datetime import datetime, timedelta # To turn day numbers back into dates
+import numpy as np # The rebuild works on the columns of the ledger
+import pandas as pd # Charts read the rollups as DataFrames
+
+# Sums of the prices of a ledger which the Overview charts need, kept up to date with every added, changed or removed
+# entry instead of being regrouped from the whole history on every render:
+#   daily[month][(roommate, day)]   per roommate and day, grouped by month so a chart of one month only reads its days
+#   monthly[(roommate, month)]      per roommate and month
+#   products[(roommate, product)]   per roommate and product
+#   totals[roommate]                per roommate
+# Roommates and products are the numbers of the ledger's interned names, days are days since 1970, months are
+# year * 12 + month - 1. Every value is [sum of prices, number of entries], a key is removed when no entry is left.
+# rebuild() computes the same tables from the columns of the ledger, verify() compares them to find drift.
+SECONDS_PER_DAY = 86400
+EPOCH = datetime(1970, 1, 1)
+
+
+# Function to get the month number of a date
+def month_of(date):
+    return date.year * 12 + date.month - 1
+
+# Function to get the day and month number of a date in seconds since 1970
+def day_and_month(seconds):
+    day = seconds // SECONDS_PER_DAY
+    return day, month_of(EPOCH + timedelta(days=int(day)))
+
+
+# Price sums of one ledger
+class Rollups:
+    def __init__(self):
+        self.daily = {}
+        self.monthly = {}
+        self.products = {}
+        self.totals = {}
+
+    # Function to add (sign=1) or remove (sign=-1) one entry
+    def add(self, mate, product, seconds, price, no_date, sign=1):
+        price = 0.0 if math.isnan(price) else price # Like pandas, prices which could not be read count as nothing
+        if seconds != no_date:
+            day, month = day_and_month(seconds)
+            change(self.daily.setdefault(month, {}), (mate, day), price, sign)
+            if not self.daily[month]:
+                del self.daily[month]
+            change(self.monthly, (mate, month), price, sign)
+        change(self.products, (mate, product), price, sign)
+        change(self.totals, mate, price, sign)
+
+    # Function to compute all tables again from the columns of a ledger
+    @classmethod
+    def rebuild(cls, ledger, no_date):
+        rollups = cls()
+        mates, products = ledger.roommate.values(), ledger.product.values()
+        seconds, prices = ledger.seconds.values(), np.nan_to_num(ledger.price.values())
+        frame = pd.DataFrame({"mate": mates, "product": products, "price": prices})
+        dated = seconds != no_date
+        days = seconds[dated] // SECONDS_PER_DAY
+        dates = pd.to_datetime(days, unit="D")
+        by_day = pd.DataFrame({"mate": mates[dated], "day": days, "month": dates.year * 12 + dates.month - 1, "price": prices[dated]})
+        for (mate, day, month), (total, count) in by_day.groupby(["mate", "day", "month"])["price"].agg(["sum", "count"]).iterrows():
+            rollups.daily.setdefault(int(month), {})[(int(mate), int(day))] = [float(total), int(count)]
+        for (mate, month), (total, count) in by_day.groupby(["mate", "month"])["price"].agg(["sum", "count"]).iterrows():
+            rollups.monthly[(int(mate), int(month))] = [float(total), int(count)]
+        for (mate, product), (total, count) in frame.groupby(["mate", "product"])["price"].agg(["sum", "count"]).iterrows():
+            rollups.products[(int(mate), int(product))] = [float(total), int(count)]
+        for mate, (total, count) in frame.groupby("mate")["price"].agg(["sum", "count"]).iterrows():
+            rollups.totals[int(mate)] = [float(total), int(count)]
+        return rollups
+
+    # Function to compare with other rollups (e.g. rebuilt ones), returns the keys whose values differ
+    def differences(self, other):
+        differences = []
+        for name in ["monthly", "products", "totals"]:
+            differences += [(name, key) for key in compare(getattr(self, name), getattr(other, name))]
+        for month in set(self.daily) | set(other.daily):
+            differences += [("daily", month, key) for key in compare(self.daily.get(month, {}), other.daily.get(month, {}))]
+        return differences
+
+    # Function to get the purchases of a month per day and roommate: {(roommate number, date): sum of prices}
+    def month_days(self, year, month):
+        return {(mate, (EPOCH + timedelta(days=day)).date()): value[0]
+                for (mate, day), value in self.daily.get(year * 12 + month - 1, {}).items()}
+
+
+# Function to add a price to a sum and remove the sum when its last entry was removed
+def change(table, key, price, sign):
+    value = table.get(key)
+    if value is None:
+        value = table[key] = [0.0, 0]
+    value[0] += sign * price
+    value[1] += sign
+    if value[1] <= 0:
+        del table[key]
+
+# Function to get the keys of two tables whose sums or counts differ
+def compare(table, other):
+    return sorted((key for key in set(table) | set(other)
+                   if key not in table or key not in other or table[key][1] != other[key][1]
+                   or not math.isclose(table[key][0], other[key][0], rel_tol=1e-9, abs_tol=1e-6)), key=str)
@@ -1,4 +1,5 @@
 import streamlit as st
+from flat_sync import record_event # To append each change to the flat's journal
 
 # Initialization of session state variables
 if "flate_name" not in st.session_state:
@@ -34,6 +35,7 @@ def setup_roommates():
 def add_roommate(room_mate):
     if room_mate and room_mate not in st.session_state["roommates"]: # Checks if room_mate is not empty and not already in the list
         st.session_state["roommates"].append(room_mate)
+        record_event(st.session_state.get("username"), {"op": "add_roommate", "roommate": room_mate})
         st.success(f"Roommate {room_mate} has been added!")
     elif room_mate in st.session_state["roommates"]:
         st.warning(f"Roommate {room_mate} is already in the list!")
@@ -72,6 +74,7 @@ def remove_roommate():
         if st.button("Remove roommate"):
             if roommate_to_remove in st.session_state["roommates"]:
                 st.session_state["roommates"].remove(roommate_to_remove)
+                record_event(st.session_state.get("username"), {"op": "remove_roommate", "roommate": roommate_to_remove})
                 st.success(f"Roommate {roommate_to_remove} has been removed!")
 
 # settings page when the setup is completed
@@ -79,11 +82,12 @@ def settingspage():
     change_flat_name()
     manage_roommates()
 
-#settingspage
-if not st.session_state["setup_finished"]:
-    if st.session_state["flate_name"] == "":
-        setup_flat_name()
+#settingspage (only when this file is run on its own, main.py calls the functions itself)
+if __name__ == "__main__":
+    if not st.session_state["setup_finished"]:
+        if st.session_state["flate_name"] == "":
+            setup_flat_name()
+        else:
+            setup_roommates()
     else:
-        setup_roommates()
-else:
-    settingspage()
+        settingspage()
@@ -0,0 +1,58 @@
+import json # To print the results
+import os # To run the measurements in the folder of the app
+import subprocess # Every measurement runs in a new Python process, so nothing is imported yet (cold start)
+import sys # To start the same Python interpreter
+
+# Measures the cold start of the app: how long the login screen takes to render and which heavy libraries and
+# subpages were imported for it, compared to importing all subpages up front like main.py used to do.
+# (Streamlit itself already imports PIL and plotly, so only plotly.express is listed.)
+# Run with: python startup_benchmark.py
+HEAVY_MODULES = ["tensorflow", "plotly.express", "pyzbar", "numpy", "pandas", "ledger",
+                 "Overview_page", "fridge_page", "barcode_page", "recipe_page"]
+
+# Renders the login screen of main.py headlessly with Streamlit's AppTest
+LOGIN_SCREEN = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+app = AppTest.from_file("main.py", default_timeout=300)
+app.run()
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "heavy_modules": [m for m in HEAVY_MODULES if m in sys.modules],
+                  "errors": [str(e.value) for e in app.exception]}))
+"""
+
+# Imports every subpage, this is what a cold start cost before the page registry
+ALL_PAGES = """
+import json, sys, time
+start = time.perf_counter()
+errors = []
+for module in ["Overview_page", "fridge_page", "barcode_page", "recipe_page"]:
+    try:
+        __import__(module)
+    except ImportError as e:
+        errors.append(str(e))
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "heavy_modules": [m for m in HEAVY_MODULES if m in sys.modules], "errors": errors}))
+"""
+
+
+# Function to run a piece of code in a new Python process and return the JSON it prints
+def run_cold(code):
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    prelude = f"HEAVY_MODULES = {HEAVY_MODULES!r}\n"
+    result = subprocess.run([sys.executable, "-c", prelude + code], cwd=app_dir, capture_output=True, text=True)
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed"}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+# Function to measure the cold start, returns a dictionary with both measurements
+def measure_startup():
+    return {
+        "login_screen": run_cold(LOGIN_SCREEN),
+        "import_all_pages": run_cold(ALL_PAGES),
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(measure_startup(), indent=2))
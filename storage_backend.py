@@ -0,0 +1,272 @@
+import json # To store settings as JSON
+import os # To read the configuration from environment variables
+import sqlite3 # Database of the SQLite backend
+from contextlib import contextmanager # To open and close a database connection with a with statement
+import event_journal # Default storage: JSON snapshot plus journal
+import expiry # Lots of the inventory rows
+
+from event_journal import HISTORY_KEYS # Keys of the history section, everything else is the hot state
+
+# Tables with history rows
+HISTORY_TABLES = ["purchases", "consumed", "cooking_history"]
+
+
+# Interface of a storage backend, every backend stores the data of a flat under the username
+class StorageBackend:
+    def load(self, username):
+        """Return the complete data of the flat as a dictionary"""
+        raise NotImplementedError
+
+    def load_hot(self, username):
+        """Return the data of the flat without the history (HISTORY_KEYS), this is all that is needed to log in"""
+        return {key: value for key, value in self.load(username).items() if key not in HISTORY_KEYS}
+
+    def load_history(self, username):
+        """Return only the history of the flat (HISTORY_KEYS) and the version it belongs to ("version")"""
+        data = self.load(username)
+        return {key: data[key] for key in HISTORY_KEYS + ["version"] if key in data}
+
+    def append(self, username, event):
+        """Store one change of the flat (see event_journal.apply_event for the events)"""
+        raise NotImplementedError
+
+    def append_many(self, username, events):
+        """Store several changes of the flat in order, backends can override this to write them at once"""
+        for event in events:
+            self.append(username, event)
+
+    def delete(self, username):
+        """Remove all data of the flat"""
+        raise NotImplementedError
+
+    def events_since(self, username, version):
+        """Return the events stored after the given version and the new version, or None if the flat has to be loaded again"""
+        return None
+
+    def compact(self, username):
+        """Shorten the stored changes of the flat if they got long, called by the saver after writing"""
+
+
+# Default backend: {username}_data.json snapshot plus {username}_journal.jsonl
+class JsonBackend(StorageBackend):
+    def load(self, username):
+        return event_journal.load_state(username)
+
+    def load_hot(self, username):
+        return event_journal.load_hot(username)
+
+    def load_history(self, username):
+        return event_journal.load_history(username)
+
+    def append(self, username, event):
+        event_journal.append_event(username, event)
+
+    def append_many(self, username, events):
+        event_journal.append_events(username, events)
+
+    def delete(self, username):
+        event_journal.delete_state(username)
+
+    def events_since(self, username, version):
+        return event_journal.events_since(username, version)
+
+    def compact(self, username):
+        event_journal.compact(username)
+
+
+# SQLite backend: history and inventory are stored in tables indexed by flat, a change only writes the rows it touches.
+# The last KEEP_EVENTS events of every flat are kept as well, so other sessions of the flat can catch up.
+class SqliteBackend(StorageBackend):
+    KEEP_EVENTS = 500
+
+    def __init__(self, path="wasteless.db"):
+        self.path = path
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL") # Readers don't block the writer, the mode is stored in the database file
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS flats (flat TEXT PRIMARY KEY, settings TEXT NOT NULL, version INTEGER NOT NULL DEFAULT 0);
+                CREATE TABLE IF NOT EXISTS events (flat TEXT, version INTEGER, event TEXT, PRIMARY KEY (flat, version));
+                CREATE TABLE IF NOT EXISTS expenses (flat TEXT, roommate TEXT, amount REAL, PRIMARY KEY (flat, roommate));
+                CREATE TABLE IF NOT EXISTS inventory (flat TEXT, product TEXT, quantity REAL, unit TEXT, price REAL, lots TEXT, PRIMARY KEY (flat, product));
+                CREATE TABLE IF NOT EXISTS purchases (id INTEGER PRIMARY KEY, flat TEXT, roommate TEXT, product TEXT, quantity REAL, price REAL, unit TEXT, date TEXT);
+                CREATE TABLE IF NOT EXISTS consumed (id INTEGER PRIMARY KEY, flat TEXT, roommate TEXT, product TEXT, quantity REAL, price REAL, unit TEXT, date TEXT);
+                CREATE TABLE IF NOT EXISTS cooking_history (id INTEGER PRIMARY KEY, flat TEXT, roommate TEXT, recipe TEXT, rating INTEGER, link TEXT, date TEXT);
+                CREATE INDEX IF NOT EXISTS purchases_flat ON purchases (flat);
+                CREATE INDEX IF NOT EXISTS consumed_flat ON consumed (flat);
+                CREATE INDEX IF NOT EXISTS cooking_history_flat ON cooking_history (flat);
+                DROP INDEX IF EXISTS purchases_flat_roommate_date;
+                DROP INDEX IF EXISTS consumed_flat_roommate_date;
+                DROP INDEX IF EXISTS cooking_history_flat_roommate_date;
+            """)
+            if "version" not in [column[1] for column in conn.execute("PRAGMA table_info(flats)")]: # Database created before versions existed
+                conn.execute("ALTER TABLE flats ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            if "lots" not in [column[1] for column in conn.execute("PRAGMA table_info(inventory)")]: # Database created before lots existed
+                conn.execute("ALTER TABLE inventory ADD COLUMN lots TEXT")
+
+    # Function to open a connection for one transaction, every call gets its own so Streamlit sessions in different threads don't share one
+    @contextmanager
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn: # Commits at the end, rolls back if an error occurs
+                yield conn
+        finally:
+            conn.close()
+
+    def load(self, username):
+        data = self.load_hot(username)
+        if data:
+            history = self.load_history(username)
+            history.pop("version") # The version of the hot state is kept
+            data.update(history)
+        return data
+
+    def load_hot(self, username):
+        with self.connect() as conn:
+            row = conn.execute("SELECT settings, version FROM flats WHERE flat = ?", (username,)).fetchone()
+            if row is None:
+                return {}
+            data = {key: value for key, value in json.loads(row[0]).items() if key not in HISTORY_KEYS}
+            data["version"] = row[1]
+            data["expenses"] = {mate: amount for mate, amount in conn.execute(
+                "SELECT roommate, amount FROM expenses WHERE flat = ?", (username,))}
+            data["inventory"] = {row[0]: self.inventory_item(row) for row in conn.execute(
+                "SELECT product, quantity, unit, price, lots FROM inventory WHERE flat = ?", (username,))}
+            return data
+
+    # Function to turn a row of the inventory table into an inventory item, rows written before lots existed have none
+    @staticmethod
+    def inventory_item(row):
+        item = {"Quantity": row[1], "Unit": row[2], "Price": row[3]}
+        if row[4] is not None:
+            item["Lots"] = json.loads(row[4])
+        return item
+
+    def load_history(self, username):
+        with self.connect() as conn:
+            row = conn.execute("SELECT settings, version FROM flats WHERE flat = ?", (username,)).fetchone()
+            if row is None:
+                return {}
+            settings = json.loads(row[0])
+            history = {key: settings[key] for key in HISTORY_KEYS if key in settings} # e.g. recipe_links
+            history["version"] = row[1] # Rows of all events up to this version, read in the same transaction
+            for table in ["purchases", "consumed"]:
+                history[table] = {mate: [] for mate in settings.get("roommates", [])}
+                for row in self.select(conn, username, table):
+                    history[table].setdefault(row.pop("Roommate"), []).append(row)
+            history["cooking_history"] = self.select(conn, username, "cooking_history")
+            return history
+
+    def append(self, username, event):
+        self.append_many(username, [event])
+
+    def append_many(self, username, events):
+        with self.connect() as conn: # All events in one transaction
+            conn.execute("INSERT OR IGNORE INTO flats (flat, settings) VALUES (?, '{}')", (username,))
+            version = conn.execute("SELECT version FROM flats WHERE flat = ?", (username,)).fetchone()[0]
+            for event in events:
+                version += 1
+                self.apply(conn, username, event, version)
+                conn.execute("INSERT INTO events VALUES (?, ?, ?)", (username, version, json.dumps(event)))
+            conn.execute("UPDATE flats SET version = ? WHERE flat = ?", (version, username))
+            conn.execute("DELETE FROM events WHERE flat = ? AND version <= ?", (username, version - self.KEEP_EVENTS))
+
+    # Function to apply one event with its version to the tables
+    def apply(self, conn, username, event, version):
+        op = event["op"]
+        if op in ["add_product", "delete_product"]:
+            sign = 1 if op == "add_product" else -1
+            self.ensure_roommate(conn, username, event["roommate"])
+            self.change_inventory(conn, username, event, version)
+            conn.execute("UPDATE expenses SET amount = amount + ? WHERE flat = ? AND roommate = ?",
+                         (sign * event["price"], username, event["roommate"]))
+            self.insert_entry(conn, username, "purchases" if op == "add_product" else "consumed", event["roommate"], {
+                "Product": event["product"], "Quantity": event["quantity"], "Price": event["price"], "Unit": event["unit"], "Date": event["date"]})
+        elif op == "rate_recipe":
+            entry = event["entry"]
+            conn.execute("INSERT INTO cooking_history (flat, roommate, recipe, rating, link, date) VALUES (?, ?, ?, ?, ?, ?)",
+                         (username, entry["Person"], entry["Recipe"], entry["Rating"], entry["Link"], entry["Date"]))
+        else: # Settings events only change the JSON column
+            settings = json.loads(conn.execute("SELECT settings FROM flats WHERE flat = ?", (username,)).fetchone()[0])
+            event_journal.apply_event(settings, event)
+            for key in ["expenses"] + HISTORY_TABLES: # apply_event adds empty entries for new roommates, they live in the tables
+                settings.pop(key, None)
+            if op == "add_roommate":
+                self.ensure_roommate(conn, username, event["roommate"])
+            conn.execute("UPDATE flats SET settings = ? WHERE flat = ?", (json.dumps(settings), username))
+
+    # Function to apply an inventory event to the row of its product, the lots are changed like in the JSON snapshot
+    def change_inventory(self, conn, username, event, version):
+        product = event["product"]
+        row = conn.execute("SELECT product, quantity, unit, price, lots FROM inventory WHERE flat = ? AND product = ?",
+                           (username, product)).fetchone()
+        inventory = {product: self.inventory_item(row)} if row else {}
+        settings = json.loads(conn.execute("SELECT settings FROM flats WHERE flat = ?", (username,)).fetchone()[0])
+        waste = settings.setdefault("waste", {})
+        before = dict(waste)
+        expiry.change_inventory(inventory, event, waste, version)
+        if product in inventory:
+            item = inventory[product]
+            conn.execute("INSERT OR REPLACE INTO inventory VALUES (?, ?, ?, ?, ?, ?)",
+                         (username, product, item["Quantity"], item["Unit"], item["Price"], json.dumps(item["Lots"])))
+        else:
+            conn.execute("DELETE FROM inventory WHERE flat = ? AND product = ?", (username, product))
+        if waste != before: # Lots were used up after their expiry day
+            conn.execute("UPDATE flats SET settings = ? WHERE flat = ?", (json.dumps(settings), username))
+
+    def delete(self, username):
+        with self.connect() as conn:
+            self.delete_rows(conn, username)
+
+    def events_since(self, username, version):
+        with self.connect() as conn:
+            row = conn.execute("SELECT version FROM flats WHERE flat = ?", (username,)).fetchone()
+            current = row[0] if row else 0
+            if version == current:
+                return [], current
+            events = [json.loads(event) for (event,) in conn.execute(
+                "SELECT event FROM events WHERE flat = ? AND version > ? ORDER BY version", (username, version))]
+            if version > current or len(events) != current - version: # Events were pruned or the flat was replaced
+                return None
+            return events, current
+
+    # Function to select the history rows of a flat in the order they were written. The flat index stores the row id with
+    # every entry, so the rows of one flat are read in id order without sorting. Filtering and paging happen in the ledger.
+    def select(self, conn, username, table):
+        if table == "cooking_history":
+            columns = "roommate, recipe, rating, link, date"
+            names = ["Person", "Recipe", "Rating", "Link", "Date"]
+        else:
+            columns = "roommate, product, quantity, price, unit, date"
+            names = ["Roommate", "Product", "Quantity", "Price", "Unit", "Date"]
+        rows = conn.execute(f"SELECT {columns} FROM {table} WHERE flat = ? ORDER BY id", (username,))
+        return [dict(zip(names, row)) for row in rows]
+
+    def insert_entry(self, conn, username, table, mate, entry):
+        conn.execute(f"INSERT INTO {table} (flat, roommate, product, quantity, price, unit, date) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     (username, mate, entry["Product"], entry["Quantity"], entry["Price"], entry["Unit"], entry["Date"]))
+
+    def ensure_roommate(self, conn, username, mate):
+        conn.execute("INSERT OR IGNORE INTO expenses VALUES (?, ?, 0.0)", (username, mate))
+
+    def delete_rows(self, conn, username):
+        for table in ["flats", "events", "expenses", "inventory"] + HISTORY_TABLES:
+            conn.execute(f"DELETE FROM {table} WHERE flat = ?", (username,))
+
+
+_backend = None
+
+# Function to get the configured backend: WASTELESS_STORAGE=sqlite selects SQLite (file in WASTELESS_DB), JSON is the default
+def get_backend():
+    global _backend
+    if _backend is None:
+        if os.environ.get("WASTELESS_STORAGE", "json") == "sqlite":
+            _backend = SqliteBackend(os.environ.get("WASTELESS_DB", "wasteless.db"))
+        else:
+            _backend = JsonBackend()
+    return _backend
+
+# Function to set the backend in code (e.g. for tests and benchmarks)
+def set_backend(backend):
+    global _backend
+    _backend = backend
@@ -0,0 +1,23 @@
+import os # To add the app folder to the import path
+import sys # Modules of the app are imported by their file name
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Every test runs in its own folder, the app writes its files (users.json, journals, databases) to the working directory
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+# Storage backend of a test, the tests using it run once with the JSON journal and once with SQLite
+@pytest.fixture(params=["json", "sqlite"])
+def backend(request, monkeypatch):
+    import storage_backend
+    import write_behind
+    monkeypatch.setattr(write_behind, "ENABLED", False) # Changes are written before the call returns
+    backend = storage_backend.JsonBackend() if request.param == "json" else storage_backend.SqliteBackend("test.db")
+    storage_backend.set_backend(backend)
+    yield backend
+    storage_backend.set_backend(None)
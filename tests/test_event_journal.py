@@ -0,0 +1,81 @@
+import event_journal
+import write_behind
+
+FLAT = "flat"
+
+
+# Function to create an add_product event
+def purchase(product, quantity=1.0):
+    return {"op": "add_product", "product": product, "quantity": quantity, "unit": "pcs", "price": 2.0,
+            "roommate": "Alice", "date": "2024-05-01 12:00:00", "lot": f"{product}-{quantity}"}
+
+
+def test_saver_compacts_a_long_journal(monkeypatch):
+    monkeypatch.setattr(event_journal, "COMPACT_EVERY", 5)
+    monkeypatch.setattr(write_behind, "ENABLED", False)
+    import storage_backend
+    storage_backend.set_backend(storage_backend.JsonBackend())
+    try:
+        write_behind.submit_events(FLAT, [{"op": "add_roommate", "roommate": "Alice"}])
+        for number in range(12):
+            write_behind.submit_events(FLAT, [purchase("Milk", number + 1.0)])
+    finally:
+        storage_backend.set_backend(None)
+    base, events = event_journal.read_journal(FLAT)
+    assert len(events) < 5 # The journal never grows past COMPACT_EVERY records
+    assert base + len(events) == 13
+    assert event_journal.events_since(FLAT, 13) == ([], 13)
+    assert event_journal.events_since(FLAT, base - 1) is None # Sessions that are further behind load the flat again
+    data = event_journal.load_state(FLAT)
+    assert data["inventory"]["Milk"]["Quantity"] == sum(range(1, 13))
+    assert len(data["purchases"]["Alice"]) == 12
+
+
+def test_compact_keeps_a_short_journal():
+    event_journal.append_events(FLAT, [purchase("Milk")])
+    assert not event_journal.compact(FLAT)
+    assert event_journal.read_journal(FLAT) == (0, [purchase("Milk")])
+    assert event_journal.compact(FLAT, min_events=0)
+    assert event_journal.read_journal(FLAT) == (1, [])
+
+
+def test_events_appended_after_a_cut_off_line_are_kept():
+    event_journal.append_events(FLAT, [{"op": "add_roommate", "roommate": "Alice"}, purchase("Milk")])
+    with open(event_journal.journal_file(FLAT), "a") as file:
+        file.write('{"op": "add_product", "product": "Che') # The process died during the write
+    event_journal.append_events(FLAT, [purchase("Eggs")])
+    event_journal.append_event(FLAT, purchase("Bread"))
+    data = event_journal.load_state(FLAT)
+    assert sorted(data["inventory"]) == ["Bread", "Eggs", "Milk"]
+    assert data["version"] == 4
+    assert event_journal.compact(FLAT, min_events=0)
+    assert sorted(event_journal.load_state(FLAT)["inventory"]) == ["Bread", "Eggs", "Milk"]
+
+
+def test_undecodable_lines_are_skipped():
+    event_journal.append_events(FLAT, [{"op": "add_roommate", "roommate": "Alice"}])
+    with open(event_journal.journal_file(FLAT), "a") as file:
+        file.write('{"op": "add_prod\n') # Written by an older version which appended after a cut off line
+    event_journal.append_events(FLAT, [purchase("Eggs")])
+    assert [event["op"] for event in event_journal.read_events(FLAT)] == ["add_roommate", "add_product"]
+
+
+def test_interrupted_compaction_does_not_apply_events_twice(monkeypatch):
+    event_journal.append_events(FLAT, [{"op": "add_roommate", "roommate": "Alice"}, purchase("Milk")])
+    written = []
+    def crash_before_the_journal(path, text): # The process dies after both sections were replaced
+        written.append(path)
+        raise KeyboardInterrupt
+    with monkeypatch.context() as patch:
+        patch.setattr(event_journal, "atomic_write_text", crash_before_the_journal)
+        try:
+            event_journal.compact(FLAT, min_events=0)
+        except KeyboardInterrupt:
+            pass
+    assert written == [event_journal.journal_file(FLAT)]
+    event_journal.append_events(FLAT, [purchase("Eggs")])
+    data = event_journal.load_state(FLAT)
+    assert data["version"] == 3
+    assert data["inventory"]["Milk"]["Quantity"] == 1.0
+    assert [entry["Product"] for entry in data["purchases"]["Alice"]] == ["Milk", "Eggs"]
+    assert event_journal.load_history(FLAT)["version"] == 3
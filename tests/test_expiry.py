@@ -0,0 +1,72 @@
+import pytest
+import expiry
+import storage_backend
+from event_journal import apply_event
+
+DATE = "2024-05-01 12:00:00"
+
+
+# Function to create an event as the app wrote it before lots existed (no lot id, no expiry day)
+def legacy(op, quantity, price, date=DATE):
+    return {"op": op, "product": "milk", "quantity": quantity, "unit": "Liters", "price": price, "roommate": "Alice", "date": date}
+
+
+def test_totals_follow_the_lots_after_a_legacy_removal():
+    inventory = {}
+    expiry.change_inventory(inventory, dict(legacy("add_product", 2.0, 4.0), lot="a", expires="2024-05-03"))
+    expiry.change_inventory(inventory, dict(legacy("add_product", 2.0, 1.0), lot="b", expires="2024-05-10"))
+    expiry.change_inventory(inventory, legacy("delete_product", 1.0, 2.5)) # Average price, not the value of the used lot
+    item = inventory["milk"]
+    assert item["Quantity"] == sum(lot["Quantity"] for lot in item["Lots"]) == 3.0
+    assert item["Price"] == pytest.approx(sum(lot["Price"] for lot in item["Lots"]))
+    assert item["Price"] == pytest.approx(3.0) # The lot expiring first was used: 4.0 - 2.0 + 1.0
+
+
+def test_legacy_lots_are_named_after_the_event_version():
+    inventory = {}
+    expiry.change_inventory(inventory, legacy("add_product", 1.0, 1.0), version=1)
+    expiry.change_inventory(inventory, legacy("add_product", 1.0, 1.0), version=2)
+    expiry.change_inventory(inventory, legacy("delete_product", 1.0, 1.0), version=3)
+    expiry.change_inventory(inventory, legacy("add_product", 1.0, 1.0), version=4) # Same date and number of lots as before
+    ids = [lot["Id"] for lot in inventory["milk"]["Lots"]]
+    assert ids == ["v2", "v4"]
+
+
+def test_backends_name_legacy_lots_alike():
+    events = [legacy("add_product", 1.0, 1.0), legacy("add_product", 2.0, 3.0), legacy("delete_product", 1.5, 2.0),
+              legacy("add_product", 1.0, 1.0)]
+    backends = [storage_backend.JsonBackend(), storage_backend.SqliteBackend("test.db")]
+    for backend in backends:
+        backend.append_many("flat", events)
+    session = {}
+    for version, event in enumerate(events, start=1): # Like sync_session applies the events of other sessions
+        apply_event(session, event, history=False, version=version)
+    json_item, sqlite_item = (backend.load_hot("flat")["inventory"]["milk"] for backend in backends)
+    assert json_item == sqlite_item == session["inventory"]["milk"]
+    assert json_item["Price"] == pytest.approx(sum(lot["Price"] for lot in json_item["Lots"]))
+
+
+def test_removal_uses_the_lots_the_session_chose():
+    first = dict(legacy("add_product", 2.0, 4.0), lot="a", expires="2024-05-10")
+    other = dict(legacy("add_product", 1.0, 1.0), lot="b", expires="2024-05-03") # Added by another session meanwhile
+    session = {}
+    apply_event(session, first, history=False, version=1)
+    lots, price = expiry.plan_removal(session["inventory"]["milk"], 1.0) # The session hasn't seen lot b yet
+    removal = dict(legacy("delete_product", 1.0, price), lots=lots)
+    assert lots == [["a", 1.0]] and price == pytest.approx(2.0)
+    apply_event(session, removal, history=False, version=3)
+    apply_event(session, other, history=False, version=2) # Synced afterwards
+    backends = [storage_backend.JsonBackend(), storage_backend.SqliteBackend("test.db")]
+    for backend in backends:
+        backend.append_many("flat", [first, other, removal])
+    json_item, sqlite_item = (backend.load_hot("flat")["inventory"]["milk"] for backend in backends)
+    assert json_item == sqlite_item
+    assert sorted(json_item["Lots"], key=lambda lot: lot["Id"]) == sorted(session["inventory"]["milk"]["Lots"], key=lambda lot: lot["Id"])
+    assert {lot["Id"]: lot["Quantity"] for lot in json_item["Lots"]} == {"a": 1.0, "b": 1.0}
+
+
+def test_removal_of_a_lot_used_up_meanwhile_falls_back_to_first_in_first_out():
+    lots = [{"Id": "a", "Quantity": 1.0, "Price": 2.0, "Expires": "2024-05-10", "Added": DATE}]
+    taken = expiry.take_lots(lots, [["gone", 0.5]])
+    assert [(lot["Id"], used) for lot, used, _ in taken] == [("a", 0.5)]
+    assert lots[0]["Quantity"] == pytest.approx(0.5)
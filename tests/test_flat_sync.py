@@ -0,0 +1,59 @@
+import pytest
+import streamlit as st
+import flat_sync
+import lazy_history
+
+FLAT = "flat"
+
+
+# Function to make the given dictionary the session state of the current browser session
+def use_session(monkeypatch, state):
+    monkeypatch.setattr(st, "session_state", state)
+    return state
+
+# Function to create an add_product event of another browser session
+def purchase(product, session="other"):
+    return {"op": "add_product", "product": product, "quantity": 1.0, "unit": "pcs", "price": 2.0,
+            "roommate": "Alice", "date": "2024-05-01 12:00:00", "lot": product, "session": session}
+
+
+@pytest.fixture
+def flat(backend):
+    backend.append_many(FLAT, [{"op": "add_roommate", "roommate": "Alice", "session": "other"}])
+    return backend
+
+
+def test_history_loaded_after_other_session_wrote_is_not_applied_twice(flat, monkeypatch):
+    state = use_session(monkeypatch, {"username": FLAT})
+    flat_sync.load_session(FLAT)
+    assert lazy_history.is_unloaded(state["purchases"])
+    flat.append(FLAT, purchase("Milk")) # Written by another session after this session's last sync
+    assert len(state["purchases"]["Alice"]) == 1 # The history is loaded now and already contains the purchase
+    flat_sync.sync_session()
+    assert len(state["purchases"]["Alice"]) == 1
+    assert state["inventory"]["Milk"]["Quantity"] == 1.0
+    flat.append(FLAT, purchase("Eggs")) # Newer than the loaded history, the next sync adds it
+    flat_sync.sync_session()
+    assert [entry["Product"] for entry in state["purchases"]["Alice"]] == ["Milk", "Eggs"]
+    assert state["version"] == state["history_version"] + 1
+
+
+def test_unloaded_history_reads_the_events_of_other_sessions(flat, monkeypatch):
+    state = use_session(monkeypatch, {"username": FLAT})
+    flat_sync.load_session(FLAT)
+    flat.append(FLAT, purchase("Milk"))
+    flat_sync.sync_session() # Only the hot state is changed
+    assert state["inventory"]["Milk"]["Quantity"] == 1.0
+    assert lazy_history.is_unloaded(state["purchases"])
+    assert [entry["Product"] for entry in state["purchases"]["Alice"]] == ["Milk"]
+
+
+def test_own_events_are_not_applied_again(flat, monkeypatch):
+    state = use_session(monkeypatch, {"username": FLAT})
+    flat_sync.load_session(FLAT)
+    own = purchase("Milk", session=flat_sync.session_id())
+    flat_sync.apply_event(state, own)
+    flat_sync.record_event(FLAT, own)
+    flat_sync.sync_session()
+    assert len(state["purchases"]["Alice"]) == 1
+    assert state["inventory"]["Milk"]["Quantity"] == 1.0
@@ -0,0 +1,36 @@
+import os # To find the model files next to the app
+import numpy as np
+import pytest
+from numpy_model import NumpyModel, export_npz, parity_check
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+H5_PATH = os.path.join(APP_DIR, "recipe_model.h5")
+NPZ_PATH = os.path.join(APP_DIR, "recipe_model.npz")
+
+
+# Function to create fixed inputs which are sparse like TF-IDF vectors
+def inputs(model, samples=32, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.random((samples, model.input_size)) * (rng.random((samples, model.input_size)) < 0.1)).astype(np.float32)
+
+
+def test_numpy_model_returns_one_array_per_head():
+    model = NumpyModel(NPZ_PATH)
+    outputs = model.predict(inputs(model))
+    assert len(outputs) == len(model.outputs) == 4
+    assert all(output.shape[0] == 32 and np.isfinite(output).all() for output in outputs)
+
+
+def test_committed_export_matches_the_h5_file(tmp_path):
+    pytest.importorskip("h5py")
+    export_npz(H5_PATH, tmp_path / "recipe_model.npz")
+    committed, exported = NumpyModel(NPZ_PATH), NumpyModel(tmp_path / "recipe_model.npz")
+    x = inputs(committed)
+    for expected, actual in zip(committed.predict(x), exported.predict(x)):
+        np.testing.assert_array_equal(expected, actual)
+
+
+def test_numpy_model_matches_keras():
+    pytest.importorskip("tensorflow")
+    differences = parity_check(H5_PATH, NPZ_PATH)
+    assert max(differences.values()) < 1e-4, differences
@@ -0,0 +1,52 @@
+import random
+from datetime import datetime, timedelta
+from ledger import Ledger, LedgerBook
+
+MATES = ["Alice", "Bob", "Carla"]
+PRODUCTS = ["milk", "eggs", "bread", "apples"]
+
+
+# Function to create an entry, some have dates the columns can't store (they count as "no date")
+def entry(rng):
+    date = (datetime(2024, 1, 1) + timedelta(seconds=rng.randint(0, 400 * 86400))).strftime("%Y-%m-%d %H:%M:%S")
+    return {"Product": rng.choice(PRODUCTS), "Quantity": float(rng.randint(1, 4)), "Price": round(rng.uniform(0.5, 20), 2),
+            "Unit": "Pieces", "Date": rng.choice([date] * 9 + ["yesterday"])}
+
+
+def test_rollups_match_a_rebuild_after_adds_and_deletes():
+    rng = random.Random(0)
+    book = LedgerBook.from_entries({mate: [entry(rng) for _ in range(20)] for mate in MATES})
+    for _ in range(300):
+        mate = rng.choice(MATES)
+        action = rng.random()
+        if action < 0.6 or not len(book[mate]):
+            book[mate].append(entry(rng))
+        elif action < 0.8:
+            del book[mate][rng.randrange(len(book[mate]))]
+        elif action < 0.9:
+            book[mate][rng.randrange(len(book[mate]))] = entry(rng)
+        else:
+            book[mate].insert(rng.randrange(len(book[mate])), entry(rng))
+    assert book.ledger.verify_rollups() == []
+
+
+def test_rollups_are_empty_after_deleting_everything():
+    rng = random.Random(1)
+    ledger = Ledger()
+    rows = [ledger.append(rng.choice(MATES), entry(rng)) for _ in range(50)]
+    ledger.delete(rows)
+    assert ledger.verify_rollups() == []
+    assert ledger.totals() == {mate: 0.0 for mate in ledger.roommates.names}
+
+
+def test_month_and_product_sums():
+    ledger = Ledger()
+    ledger.append("Alice", {"Product": "milk", "Quantity": 1.0, "Price": 2.0, "Unit": "Liters", "Date": "2024-05-01 08:00:00"})
+    ledger.append("Alice", {"Product": "milk", "Quantity": 1.0, "Price": 3.0, "Unit": "Liters", "Date": "2024-05-01 18:00:00"})
+    ledger.append("Bob", {"Product": "eggs", "Quantity": 6.0, "Price": 4.5, "Unit": "Pieces", "Date": "2024-06-02 09:00:00"})
+    month = ledger.month_totals(2024, 5)
+    assert month[["Roommate", "Total"]].values.tolist() == [["Alice", 5.0]]
+    products = {(row.Roommate, row.Product): row.Price for row in ledger.product_totals().itertuples()}
+    assert products == {("Alice", "milk"): 5.0, ("Bob", "eggs"): 4.5}
+    assert ledger.totals() == {"Alice": 5.0, "Bob": 4.5}
+    assert ledger.verify_rollups() == []
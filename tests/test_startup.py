@@ -0,0 +1,10 @@
+import pytest
+import startup_benchmark
+
+
+def test_login_screen_imports_no_heavy_modules():
+    pytest.importorskip("streamlit")
+    result = startup_benchmark.run_cold(startup_benchmark.LOGIN_SCREEN)
+    assert "error" not in result, result
+    assert result["errors"] == []
+    assert result["heavy_modules"] == []
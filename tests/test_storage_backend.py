@@ -0,0 +1,77 @@
+import pytest
+import storage_backend
+import event_journal
+
+FLAT = "flat"
+DATE = "2024-05-01 12:00:00"
+EVENTS = [
+    {"op": "set", "key": "flate_name", "value": "Test flat"},
+    {"op": "add_roommate", "roommate": "Alice"},
+    {"op": "add_roommate", "roommate": "Bob"},
+    {"op": "add_product", "product": "milk", "quantity": 2.0, "unit": "Liters", "price": 3.0, "roommate": "Alice",
+     "date": DATE, "lot": "milk-1", "expires": "2024-05-03"},
+    {"op": "add_product", "product": "milk", "quantity": 1.0, "unit": "Liters", "price": 2.0, "roommate": "Bob",
+     "date": DATE, "lot": "milk-2", "expires": "2024-05-10"},
+    {"op": "add_product", "product": "eggs", "quantity": 6.0, "unit": "Pieces", "price": 4.5, "roommate": "Bob",
+     "date": DATE, "lot": "eggs-1", "expires": None},
+    {"op": "delete_product", "product": "milk", "quantity": 2.5, "unit": "Liters", "price": 4.0, "roommate": "Bob",
+     "date": "2024-05-05 09:00:00"}, # Uses up the first lot after its expiry day
+    {"op": "rate_recipe", "entry": {"Person": "Alice", "Recipe": "Omelette", "Rating": 5, "Link": "https://example.com", "Date": DATE}},
+    {"op": "set", "key": "recipe_links", "value": {"Omelette": {"link": "https://example.com", "missed_ingredients": []}}},
+    {"op": "remove_roommate", "roommate": "Bob"},
+]
+
+
+# Function to load the data of the flat with both backends
+def load_both(json_backend, sqlite_backend):
+    return json_backend.load(FLAT), sqlite_backend.load(FLAT)
+
+
+@pytest.fixture
+def backends():
+    return storage_backend.JsonBackend(), storage_backend.SqliteBackend("test.db")
+
+
+def test_backends_store_the_same_events_alike(backends):
+    for backend in backends:
+        backend.append_many(FLAT, EVENTS[:4])
+        for event in EVENTS[4:]:
+            backend.append(FLAT, event)
+    json_data, sqlite_data = load_both(*backends)
+    assert json_data == sqlite_data
+    assert json_data["version"] == len(EVENTS)
+    assert json_data["inventory"]["milk"]["Quantity"] == pytest.approx(0.5)
+    assert json_data["waste"]["lots"] == 1
+    assert [entry["Product"] for entry in json_data["consumed"]["Bob"]] == ["milk"]
+
+
+def test_backends_return_the_same_events_since_a_version(backends):
+    for backend in backends:
+        backend.append_many(FLAT, EVENTS)
+    assert backends[0].events_since(FLAT, 3) == backends[1].events_since(FLAT, 3) == (EVENTS[3:], len(EVENTS))
+    assert backends[0].events_since(FLAT, len(EVENTS)) == backends[1].events_since(FLAT, len(EVENTS)) == ([], len(EVENTS))
+
+
+def test_backends_split_hot_state_and_history_alike(backends):
+    for backend in backends:
+        backend.append_many(FLAT, EVENTS)
+    assert backends[0].load_hot(FLAT) == backends[1].load_hot(FLAT)
+    assert backends[0].load_history(FLAT) == backends[1].load_history(FLAT)
+
+
+def test_compacted_journal_loads_alike(backends):
+    for backend in backends:
+        backend.append_many(FLAT, EVENTS[:5])
+    assert event_journal.compact(FLAT, min_events=0)
+    for backend in backends:
+        backend.append_many(FLAT, EVENTS[5:])
+    json_data, sqlite_data = load_both(*backends)
+    assert json_data == sqlite_data
+    assert json_data["version"] == len(EVENTS)
+
+
+def test_delete_removes_the_flat(backends):
+    for backend in backends:
+        backend.append_many(FLAT, EVENTS)
+        backend.delete(FLAT)
+        assert backend.load_hot(FLAT).get("inventory", {}) == {}
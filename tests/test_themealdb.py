@@ -0,0 +1,84 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import themealdb
+
+# Answers of the stand-in server per ingredient
+MEALS = {
+    "chicken": [{"strMeal": f"Chicken {n}", "idMeal": str(n)} for n in range(5)],
+    "rice": [{"strMeal": "Rice bowl", "idMeal": "10"}],
+}
+
+
+# Local stand-in for TheMealDB: /filter.php?i=<ingredient>, "broken" answers with an error and "slow" too late
+class StandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keeps the connection open, like the real API
+    clients = set()
+
+    def do_GET(self):
+        StandIn.clients.add(self.client_address)
+        ingredient = self.path.split("i=", 1)[-1]
+        if ingredient == "slow":
+            time.sleep(1)
+        status = 500 if ingredient == "broken" else 200
+        body = json.dumps({"meals": MEALS.get(ingredient)}).encode() # Unknown ingredients get {"meals": null}
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError): # The client gave up (timeout or budget)
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_filter_by_ingredient(server):
+    assert themealdb.filter_by_ingredient("rice", base_url=server) == MEALS["rice"]
+    assert themealdb.filter_by_ingredient("nothing", base_url=server) == []
+
+
+def test_requests_reuse_the_pooled_connection(server):
+    StandIn.clients.clear()
+    for _ in range(5):
+        themealdb.filter_by_ingredient("rice", base_url=server)
+    assert len(StandIn.clients) == 1
+
+
+def test_find_recipes_stops_at_the_limit(server):
+    titles, links, failed = themealdb.find_recipes(["chicken", "rice"], limit=3, base_url=server)
+    assert len(titles) == 3 and failed == 0
+    assert set(titles) <= {meal["strMeal"] for meals in MEALS.values() for meal in meals}
+    assert all(links[title]["link"].startswith("https://www.themealdb.com/meal/") for title in titles)
+
+
+def test_failed_requests_are_counted(server):
+    titles, _, failed = themealdb.find_recipes(["broken", "rice"], limit=3, base_url=server)
+    assert titles == ["Rice bowl"] and failed == 1
+
+
+def test_slow_requests_time_out(server):
+    start = time.monotonic()
+    titles, _, failed = themealdb.find_recipes(["slow", "rice"], limit=3, base_url=server, timeout=0.2)
+    assert titles == ["Rice bowl"] and failed == 1
+    assert time.monotonic() - start < 1
+
+
+def test_budget_limits_the_whole_search(server):
+    start = time.monotonic()
+    titles, _, failed = themealdb.find_recipes(["slow"], limit=3, base_url=server, budget=0.2)
+    assert titles == [] and failed == 0 # The request was still running when the budget was used up
+    assert time.monotonic() - start < 0.8
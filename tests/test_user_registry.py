@@ -0,0 +1,25 @@
+import json
+import os
+import user_registry
+
+
+def test_sign_up_login_and_removal():
+    assert not user_registry.users_exist()
+    assert user_registry.add_user("flat", "secret")
+    assert not user_registry.add_user("flat", "other") # The username is the primary key
+    assert user_registry.users_exist()
+    assert user_registry.check_password("flat", "secret")
+    assert not user_registry.check_password("flat", "other")
+    assert not user_registry.check_password("unknown", "secret")
+    assert user_registry.remove_user("flat")
+    assert not user_registry.remove_user("flat")
+    assert not user_registry.check_password("flat", "secret")
+
+
+def test_users_json_is_imported_once():
+    with open(user_registry.USERS_FILE, "w") as file:
+        json.dump({"old": "password"}, file)
+    assert user_registry.check_password("old", "password")
+    assert user_registry.remove_user("old")
+    assert not os.path.exists(user_registry.USERS_FILE) # Renamed, so the removed user is not imported again
+    assert not user_registry.check_password("old", "password")
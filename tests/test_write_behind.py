@@ -0,0 +1,73 @@
+import pytest
+import storage_backend
+import write_behind
+
+FLAT = "flat"
+
+
+# Backend which records what the saver writes, fail is the number of writes that raise an error first
+class RecordingBackend(storage_backend.StorageBackend):
+    def __init__(self, fail=0):
+        self.writes = []
+        self.fail = fail
+
+    def append_many(self, username, events):
+        if self.fail:
+            self.fail -= 1
+            raise OSError("disk full")
+        self.writes.append(("events", username, events))
+
+
+@pytest.fixture
+def recording(monkeypatch):
+    monkeypatch.setattr(write_behind, "ENABLED", True)
+    monkeypatch.setattr(write_behind, "DELAY", 0.05)
+    backend = RecordingBackend()
+    storage_backend.set_backend(backend)
+    yield backend
+    write_behind.flush(timeout=5)
+    storage_backend.set_backend(None)
+
+
+# Function to create a set event
+def setting(key, value):
+    return {"op": "set", "key": key, "value": value}
+
+
+def test_coalesce_keeps_the_last_value_of_every_setting():
+    events = [setting("a", 1), {"op": "add_roommate", "roommate": "Alice"}, setting("b", 1), setting("a", 2)]
+    assert write_behind.coalesce(events) == events[1:]
+
+
+def test_a_burst_of_changes_is_written_at_once(recording):
+    write_behind.submit_events(FLAT, [setting("flate_name", "One")])
+    write_behind.submit_events(FLAT, [{"op": "add_roommate", "roommate": "Alice"}])
+    write_behind.submit_events(FLAT, [setting("flate_name", "Two")])
+    assert write_behind.flush(FLAT, timeout=5)
+    assert recording.writes == [("events", FLAT, [{"op": "add_roommate", "roommate": "Alice"}, setting("flate_name", "Two")])]
+    assert write_behind.stats()["pending"] == 0
+
+
+def test_submitted_events_are_copied(recording):
+    event = setting("flate_name", "One")
+    write_behind.submit_events(FLAT, [event])
+    event["value"] = "Changed"
+    write_behind.flush(FLAT, timeout=5)
+    assert recording.writes[0][2] == [setting("flate_name", "One")]
+
+
+def test_failed_write_is_retried(recording):
+    recording.fail = 1
+    errors = write_behind.stats()["errors"]
+    write_behind.submit_events(FLAT, [setting("flate_name", "One")])
+    assert write_behind.flush(FLAT, timeout=5)
+    assert recording.writes == [("events", FLAT, [setting("flate_name", "One")])]
+    assert write_behind.stats()["errors"] == errors + 1
+
+
+def test_discard_drops_the_queued_changes(recording, monkeypatch):
+    monkeypatch.setattr(write_behind, "DELAY", 5) # The background thread waits, so the changes are still queued
+    write_behind.submit_events(FLAT, [setting("flate_name", "One")])
+    write_behind.discard(FLAT)
+    assert write_behind.flush(FLAT, timeout=5)
+    assert recording.writes == []
@@ -0,0 +1,82 @@
+import os # To read the API address from an environment variable
+import random # Enables radom selection
+import threading # The HTTP session is shared by all sessions and worker threads
+import time # To keep track of the latency budget
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED # Ingredients are queried in parallel
+import requests # To send http requests for API
+import api_cache # Answers are cached on disk and shared by all sessions
+import metrics # Timing of the requests
+from requests.adapters import HTTPAdapter # Connection pool of the shared HTTP session
+
+# Client for TheMealDB. All requests go through one pooled HTTP session, so the connection (and TLS handshake)
+# is reused instead of opening a new one per ingredient. The address can be changed with THEMEALDB_URL or the
+# base_url argument, e.g. to run against a local stand-in server.
+THEMEALDB_URL = os.environ.get("THEMEALDB_URL", "https://www.themealdb.com/api/json/v1/1")
+MAX_WORKERS = 8 # Requests sent at the same time
+TIMEOUT = 5.0 # Seconds for one request (connect and read)
+BUDGET = 8.0 # Seconds for the whole search, ingredients not answered by then are skipped
+
+_session = None
+_session_lock = threading.Lock()
+
+
+# Function to get the shared HTTP session
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+# Function to get the meals which contain an ingredient, raises requests.RequestException if the request fails.
+# Answers (also "no meals") come from the cache if the same ingredient was searched recently.
+def filter_by_ingredient(ingredient, base_url=None, timeout=TIMEOUT):
+    @metrics.timed("themealdb.filter")
+    def fetch():
+        response = get_session().get(f"{base_url or THEMEALDB_URL}/filter.php", params={"i": ingredient}, timeout=timeout)
+        response.raise_for_status()
+        return response.json().get("meals") or [] # TheMealDB returns {"meals": null} if nothing was found
+    if base_url: # Stand-in servers are not cached
+        return fetch()
+    return api_cache.cached("themealdb.filter", ingredient, fetch)
+
+# Function to find recipes for a list of ingredients, returns the recipe titles, their links and the number of
+# failed requests. The ingredients are queried in parallel, the search stops as soon as `limit` recipes were found
+# or the budget is used up, requests which haven't started yet are cancelled.
+def find_recipes(ingredients, limit=3, base_url=None, timeout=TIMEOUT, budget=BUDGET, workers=MAX_WORKERS):
+    recipe_titles = []
+    recipe_links = {}
+    failed = 0
+    deadline = time.monotonic() + budget
+    executor = ThreadPoolExecutor(max_workers=min(workers, max(len(ingredients), 1)))
+    try:
+        pending = {executor.submit(filter_by_ingredient, ingredient, base_url, timeout) for ingredient in ingredients}
+        while pending and len(recipe_titles) < limit:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    meals = future.result()
+                except (requests.RequestException, ValueError): # No connection, timeout, error status or invalid JSON
+                    failed += 1
+                    continue
+                random.shuffle(meals)
+                for meal in meals:
+                    if len(recipe_titles) >= limit:
+                        break
+                    if meal["strMeal"] not in recipe_titles:
+                        recipe_titles.append(meal["strMeal"])
+                        recipe_links[meal["strMeal"]] = {
+                            "link": f"https://www.themealdb.com/meal/{meal['idMeal']}",
+                            "missed_ingredients": []  # TheMealDB does not provide missed ingredients
+                        }
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True) # Running requests end by their timeout
+    return recipe_titles, recipe_links, failed
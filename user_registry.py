@@ -0,0 +1,59 @@
+import json # To import the users file of older versions
+import os # To read the settings from environment variables
+import sqlite3 # Registry shared by all sessions and server processes
+from contextlib import contextmanager # To open one connection per operation
+
+# Registry of all flats and their passwords. The users are rows of a SQLite table with the username as primary key,
+# so a sign up inserts one row and a login looks up one row, no matter how many flats are registered. The unique key
+# decides which of two concurrent sign ups with the same name wins, also across server processes.
+# A users.json of an older version is imported the first time the registry is opened and then renamed.
+USERS_DB = os.environ.get("WASTELESS_USERS_DB", "users.db")
+USERS_FILE = "users.json" # Registry of older versions
+
+_initialized = set() # Registry files whose table was already created by this process
+
+
+# Function to open the registry, creates the table and imports users.json the first time
+@contextmanager
+def connect(path=None):
+    path = path or USERS_DB
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        with conn: # Commits at the end, rolls back if an error occurs
+            if os.path.abspath(path) not in _initialized:
+                conn.execute("CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT NOT NULL)")
+                import_users_file(conn)
+                _initialized.add(os.path.abspath(path))
+            yield conn
+    finally:
+        conn.close()
+
+# Function to move the users of users.json into the table, the file is renamed so deleted users don't come back
+def import_users_file(conn):
+    conn.execute("BEGIN IMMEDIATE") # Other processes wait, so the file is imported only once
+    if os.path.exists(USERS_FILE):
+        with open(USERS_FILE, "r") as file: # Opens file in read modus
+            users = json.load(file)
+        conn.executemany("INSERT OR IGNORE INTO users VALUES (?, ?)", users.items())
+        os.replace(USERS_FILE, USERS_FILE + ".imported")
+
+# Function to check if any user exists
+def users_exist():
+    with connect() as conn:
+        return conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is not None
+
+# Function to check username and password
+def check_password(username, password):
+    with connect() as conn:
+        row = conn.execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()
+        return row is not None and row[0] == password
+
+# Function to add a user, returns False if the username already exists
+def add_user(username, password):
+    with connect() as conn:
+        return conn.execute("INSERT OR IGNORE INTO users VALUES (?, ?)", (username, password)).rowcount == 1
+
+# Function to remove a user, returns False if the username does not exist
+def remove_user(username):
+    with connect() as conn:
+        return conn.execute("DELETE FROM users WHERE username = ?", (username,)).rowcount == 1
@@ -0,0 +1,120 @@
+import atexit # To write everything that is still pending when the server stops
+import json # To copy the events before they are handed to the background thread
+import logging # To report failed writes from the background thread
+import os # To read the configuration from environment variables
+import threading # Background thread which does the writing
+from storage_backend import get_backend # Backend which finally stores the data
+import metrics # Timing of the writes
+
+# Changes are not written while the page is rendered. They are queued per flat and a background thread writes them,
+# all changes of a flat that arrive within DELAY seconds (a burst of reruns) end up in one write.
+DELAY = 0.2 # Seconds the background thread waits for more changes before writing
+ENABLED = os.environ.get("WASTELESS_WRITE_BEHIND", "1") != "0" # Set to 0 to write synchronously
+
+logger = logging.getLogger(__name__)
+
+_condition = threading.Condition() # Protects the variables below and wakes up the background thread
+_pending = {} # username -> list of events which are not written yet
+_writing = set() # Flats the background thread is writing right now
+_urgent = False # Set by flush() so the background thread doesn't wait for DELAY
+_thread = None
+_stats = {"events": 0, "writes": 0, "errors": 0}
+
+
+# Function to queue changes of a flat
+def submit_events(username, events):
+    events = json.loads(json.dumps(events)) # Copy, the session may change the dictionaries after this call
+    if not ENABLED:
+        get_backend().append_many(username, events)
+        get_backend().compact(username)
+        return
+    with _condition:
+        _pending.setdefault(username, []).extend(events) # Coalesce with the changes that are already waiting
+        _stats["events"] += len(events)
+        _condition.notify_all()
+    start()
+
+# Function to drop the queued changes of a flat (used before the account is deleted)
+def discard(username):
+    with _condition:
+        _pending.pop(username, None)
+
+# Function to wait until the queued changes of one flat (or of all flats) are written, returns False on timeout
+def flush(username=None, timeout=None):
+    global _urgent
+    with _condition:
+        def busy():
+            if username is None:
+                return bool(_pending or _writing)
+            return username in _pending or username in _writing
+        if not busy():
+            return True
+        if _thread is None or not _thread.is_alive(): # e.g. at shutdown: write in this thread
+            write_pending()
+        _urgent = True
+        _condition.notify_all()
+        return _condition.wait_for(lambda: not busy(), timeout)
+
+# Function to get counters of the saver
+def stats():
+    with _condition:
+        return dict(_stats, pending=sum(len(events) for events in _pending.values()))
+
+# Function to start the background thread once per process
+def start():
+    global _thread
+    with _condition:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=worker, name="write-behind", daemon=True)
+            _thread.start()
+
+# Function to remove duplicate settings from a list of events, only the last value of a setting has to be written
+def coalesce(events):
+    last_set = {event["key"]: index for index, event in enumerate(events) if event["op"] == "set"}
+    return [event for index, event in enumerate(events) if event["op"] != "set" or last_set[event["key"]] == index]
+
+# Function to write the queued events of one flat
+@metrics.timed("storage.write")
+def write_events(username, events):
+    backend = get_backend()
+    backend.append_many(username, coalesce(events))
+    _stats["writes"] += 1
+    backend.compact(username) # Keeps the journal of a flat that stays logged in short
+
+# Function to take all pending events and write them (must be called with _condition held)
+def write_pending():
+    global _pending
+    batch, _pending = _pending, {}
+    _writing.update(batch)
+    _condition.release() # Writing happens without the lock, so pages can queue new changes meanwhile
+    try:
+        failed = {}
+        for username, events in batch.items():
+            try:
+                write_events(username, events)
+            except Exception:
+                logger.exception("Saving the data of %s failed, trying again", username)
+                failed[username] = events
+    finally:
+        _condition.acquire()
+    for username, events in failed.items(): # Failed writes go back to the front of the queue
+        _stats["errors"] += 1
+        _pending[username] = events + _pending.get(username, [])
+    _writing.difference_update(batch)
+    _condition.notify_all()
+    return not failed
+
+# Background thread: waits for changes, gives a burst of reruns DELAY seconds to settle and writes them together
+def worker():
+    global _urgent
+    with _condition:
+        while True:
+            _condition.wait_for(lambda: _pending)
+            if not _urgent:
+                _condition.wait_for(lambda: _urgent, DELAY)
+            _urgent = False
+            if not write_pending():
+                _condition.wait(DELAY) # Don't retry a failing write in a tight loop
+
+# Write everything that is still pending when the process ends
+atexit.register(flush, None, 10)